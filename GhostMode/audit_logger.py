@@ -1,28 +1,254 @@
 """
 Audit logging for Ghost Mode
 Handles recording of actions for later analysis
+
+Records are structured JSON lines written by a background thread, so
+callers on the activation path only pay for a non-blocking queue put.
 """
+import atexit
+import gzip
+import json
 import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import List
+
+FSYNC_BATCH = 'batch'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_BATCH, FSYNC_INTERVAL, FSYNC_NEVER)
+
+ACTIVATION = 'activation'
+DEACTIVATION = 'deactivation'
+
+
+class _Flush:
+    """Queue marker the writer acknowledges once everything before it is written"""
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
 
 class AuditLogger:
-    """Audit logger for Ghost Mode events"""
-    def __init__(self, file_path: str = 'ghost_mode_audit.log'):
-        self.logger = logging.getLogger('audit')
-        # Prevent duplicate handlers
-        if not self.logger.handlers:
-            handler = logging.FileHandler(file_path)
-            handler.setFormatter(
-                logging.Formatter('%(asctime)s - %(message)s')
-            )
-            self.logger.addHandler(handler)
-            self.logger.setLevel(logging.INFO)
-    
-    def log_activation(self, killed_processes: list, hardware_ok: bool, location_ok: bool, location_state: tuple):
+    """Audit logger for Ghost Mode events
+
+    Producers never block: when the bounded queue is full the record is
+    dropped and counted. The writer batches up to batch_size records per
+    write, syncs them according to fsync ('batch', 'interval' or 'never')
+    and rotates the file past max_bytes into gzip archives
+    (ghost_mode_audit.log.1.gz is the newest).
+    """
+    def __init__(self, file_path: str = 'ghost_mode_audit.log', queue_size: int = 4096,
+                 batch_size: int = 256, flush_interval: float = 0.2,
+                 fsync: str = FSYNC_INTERVAL, fsync_interval: float = 1.0,
+                 max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.logger = logging.getLogger(__name__)
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._last_sync = time.monotonic()
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ghost-audit', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, event: str, **fields) -> bool:
+        """Queue one record; returns False if it had to be dropped"""
+        with self._seq_lock:
+            self._seq += 1
+            seq = self._seq
+        record = {'ts': time.time(), 'seq': seq, 'event': event}
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._seq_lock:
+                self.dropped += 1
+            return False
+
+    def log_activation(self, killed_processes: list, hardware_ok: bool, location_ok: bool, location_state: tuple, matched: list = None, suspended: list = None, cloaked: list = None, stages: list = None):
         """Log activated ghost mode actions with hardware, location status, and raw state"""
-        status = f"hardware_ok={hardware_ok}, location_ok={location_ok}, location_state={location_state}, terminated={killed_processes}"
-        self.logger.info(f"Activated Ghost Mode - {status}")
-    
-    def log_deactivation(self, running_processes: list, hardware_ok: bool, location_ok: bool, location_state: tuple):
+        self.log(
+            ACTIVATION,
+            hardware_ok=bool(hardware_ok),
+            location_ok=bool(location_ok),
+            location_state=list(location_state or ()),
+            terminated=list(killed_processes),
+            matched=matched if matched is not None else [],
+            suspended=suspended or [],
+            cloaked=cloaked or [],
+            stages=stages or [],
+        )
+
+    def log_deactivation(self, running_processes: list, hardware_ok: bool, location_ok: bool, location_state: tuple, matched: list = None, restored: list = None, thawed: list = None, uncloaked: list = None, stages: list = None):
         """Log deactivated ghost mode actions with hardware, location status, and raw state"""
-        status = f"hardware_restored={hardware_ok}, location_restored={location_ok}, location_state={location_state}, still_running={running_processes}"
-        self.logger.info(f"Deactivated Ghost Mode - {status}")
+        self.log(
+            DEACTIVATION,
+            hardware_restored=bool(hardware_ok),
+            location_restored=bool(location_ok),
+            location_state=list(location_state or ()),
+            still_running=list(running_processes),
+            matched=matched if matched is not None else [],
+            restored=restored or [],
+            thawed=thawed or [],
+            uncloaked=uncloaked or [],
+            stages=stages or [],
+        )
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every record queued so far is written"""
+        if not self._thread.is_alive():
+            return False
+        marker = _Flush()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write everything queued, then stop the writer
+
+        Waits as long as the writer keeps making progress, so a full queue
+        at shutdown is still written out; gives up only after timeout
+        seconds without a single record written.
+        """
+        if not self._thread.is_alive():
+            return
+        self._closing.set()
+        try:
+            # Wakes the writer; when the queue is full it is busy anyway
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        written = self.written
+        while True:
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                return
+            if self.written == written:
+                self.logger.warning(f"Audit writer stalled at shutdown; {self._queue.qsize()} records lost")
+                return
+            written = self.written
+
+    def stats(self) -> dict:
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'rotations': self.rotations,
+            'queued': self._queue.qsize(),
+        }
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.file_path, 'a', encoding='utf-8')
+        return self._file
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                try:
+                    self._sync(force=self._closing.is_set())
+                except OSError as e:
+                    self.logger.error(f"Audit sync failed: {e}")
+                if self._closing.is_set():
+                    break
+                continue
+            items = [first]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records, markers = [], []
+            # Closing stops the writer once the queue is drained, not at the marker
+            stopping = self._closing.is_set() and self._queue.empty()
+            for item in items:
+                if isinstance(item, _Flush):
+                    markers.append(item)
+                elif item is not _STOP:
+                    records.append(item)
+            try:
+                self._write(records)
+                # A flush or shutdown asks for durability regardless of policy
+                self._sync(force=bool(markers) or stopping)
+            except OSError as e:
+                self.logger.error(f"Audit write failed: {e}")
+            for marker in markers:
+                marker.done.set()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, records: List[dict]) -> None:
+        if not records:
+            return
+        lines = ''.join(json.dumps(r, separators=(',', ':'), default=str) + '\n' for r in records)
+        f = self._open()
+        f.write(lines)
+        f.flush()
+        self.written += len(records)
+        self.batches += 1
+        if self.fsync == FSYNC_BATCH:
+            os.fsync(f.fileno())
+            self._last_sync = time.monotonic()
+        if self.max_bytes and f.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _sync(self, force: bool = False) -> None:
+        if self._file is None or (self.fsync == FSYNC_NEVER and not force):
+            return
+        now = time.monotonic()
+        if force or (self.fsync == FSYNC_INTERVAL and now - self._last_sync >= self.fsync_interval):
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+
+    def archive_path(self, index: int) -> str:
+        return f"{self.file_path}.{index}.gz"
+
+    def _rotate(self) -> None:
+        """Compress the current file to .1.gz, shifting older archives up"""
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(self.archive_path(index)):
+                    os.replace(self.archive_path(index), self.archive_path(index + 1))
+            tmp = self.archive_path(1) + '.tmp'
+            with open(self.file_path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp, self.archive_path(1))
+        os.remove(self.file_path)
+        self.rotations += 1
+
+
+def read_records(path: str) -> List[dict]:
+    """Parse a plain or gzip-compressed audit file"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
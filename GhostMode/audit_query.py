@@ -0,0 +1,431 @@
+"""
+Audit log queries for Ghost Mode
+Indexes the JSON-lines audit log in a sidecar file and answers time-range,
+process and failure queries by reading only the records they need
+"""
+import bisect
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from audit_logger import ACTIVATION
+
+INDEX_SUFFIX = '.idx'
+BUCKET_SECONDS = 3600
+MAX_SEGMENTS = 16
+HEAD_BYTES = 256
+
+_MAGIC = b'GAIX'
+# magic, meta length, postings length in bytes
+_HEADER = struct.Struct('<4sIQ')
+_RELATIVE = re.compile(r'^(\d+(?:\.\d+)?)([smhdw])$')
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def record_terms(record: dict) -> set:
+    """Index terms for a record: event type, processes acted on and failures"""
+    terms = {f"event:{record.get('event')}"}
+    for name in record.get('terminated', ()):
+        terms.add(f"proc:{str(name).lower()}")
+    for match in record.get('matched', ()):
+        if isinstance(match, dict) and match.get('name'):
+            terms.add(f"proc:{str(match['name']).lower()}")
+    for stage in record.get('stages', ()):
+        if isinstance(stage, dict) and not stage.get('ok', True):
+            terms.add(f"fail:{stage.get('name')}")
+    for flag, name in (('hardware_ok', 'hardware'), ('location_ok', 'location'),
+                       ('hardware_restored', 'hardware'), ('location_restored', 'location')):
+        if record.get(flag) is False:
+            terms.add(f"fail:{name}")
+    return terms
+
+
+def _postings_bytes(offsets: List[int]) -> bytes:
+    data = array('Q', offsets)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _postings_array(data: bytes) -> array:
+    values = array('Q')
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+class Segment(NamedTuple):
+    """Index of the log bytes [start, end)"""
+    start: int
+    end: int
+    records: int
+    buckets: List[List[int]]
+    terms: Dict[str, List[int]]
+    blob: int
+
+
+class AuditIndex:
+    """Incrementally built sidecar index for one audit log file
+
+    Each update appends a segment covering the bytes written since the
+    previous one: (time bucket, first byte offset) pairs plus sorted
+    posting lists of record offsets per term. Segments are merged once
+    there are more than max_segments. The log's first line identifies it,
+    so a rotated log is re-indexed from scratch.
+    """
+    def __init__(self, log_path: str, index_path: str = None, bucket_seconds: int = BUCKET_SECONDS,
+                 max_segments: int = MAX_SEGMENTS):
+        self.log_path = log_path
+        self.index_path = index_path or log_path + INDEX_SUFFIX
+        self.bucket_seconds = bucket_seconds
+        self.max_segments = max_segments
+        self.logger = logging.getLogger(__name__)
+        self.segments: List[Segment] = []
+        self.head = ''
+        self._data = b''
+        self._load()
+
+    @property
+    def end(self) -> int:
+        return self.segments[-1].end if self.segments else 0
+
+    @property
+    def records(self) -> int:
+        return sum(s.records for s in self.segments)
+
+    def _log_head(self) -> str:
+        """Hash of the log's first line, which never changes once written"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                return hashlib.sha1(f.readline(HEAD_BYTES)).hexdigest()
+        except FileNotFoundError:
+            return ''
+
+    def _load(self) -> None:
+        self.segments = []
+        try:
+            with open(self.index_path, 'rb') as f:
+                self._data = f.read()
+        except FileNotFoundError:
+            self._data = b''
+            return
+        pos = 0
+        while pos + _HEADER.size <= len(self._data):
+            magic, meta_len, blob_len = _HEADER.unpack_from(self._data, pos)
+            if magic != _MAGIC or pos + _HEADER.size + meta_len + blob_len > len(self._data):
+                # A torn final segment is dropped and rebuilt by the next update
+                self.logger.warning(f"Truncating damaged audit index at byte {pos}")
+                with open(self.index_path, 'r+b') as f:
+                    f.truncate(pos)
+                break
+            meta = json.loads(self._data[pos + _HEADER.size:pos + _HEADER.size + meta_len])
+            blob = pos + _HEADER.size + meta_len
+            if not self.segments:
+                self.head = meta['head']
+            self.segments.append(Segment(meta['start'], meta['end'], meta['records'],
+                                         meta['buckets'], meta['terms'], blob))
+            pos = blob + blob_len
+        self._data = self._data[:pos]
+
+    def postings(self, term: str) -> array:
+        """Sorted offsets of every indexed record carrying term"""
+        result = array('Q')
+        for segment in self.segments:
+            entry = segment.terms.get(term)
+            if entry:
+                start = segment.blob + entry[0] * 8
+                result.extend(_postings_array(self._data[start:start + entry[1] * 8]))
+        return result
+
+    def buckets(self) -> List[List[int]]:
+        return [bucket for segment in self.segments for bucket in segment.buckets]
+
+    def _encode(self, start: int, end: int, records: int, buckets, terms: Dict[str, List[int]],
+                head: str) -> bytes:
+        blob, layout, pos = [], {}, 0
+        for term in sorted(terms):
+            offsets = terms[term]
+            blob.append(_postings_bytes(offsets))
+            layout[term] = [pos, len(offsets)]
+            pos += len(offsets)
+        meta = json.dumps({
+            'start': start, 'end': end, 'records': records, 'head': head,
+            'bucket_seconds': self.bucket_seconds, 'buckets': buckets, 'terms': layout,
+        }, separators=(',', ':')).encode()
+        payload = b''.join(blob)
+        return _HEADER.pack(_MAGIC, len(meta), len(payload)) + meta + payload
+
+    def _write(self, data: bytes, append: bool) -> None:
+        if append:
+            with open(self.index_path, 'ab') as f:
+                f.write(data)
+        else:
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.index_path)
+
+    def _reload_if_changed(self) -> None:
+        """Pick up segments another process (or AuditIndex) appended"""
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            size = 0
+        if size != len(self._data):
+            self._load()
+
+    def update(self) -> int:
+        """Index records appended since the last update; returns how many"""
+        self._reload_if_changed()
+        head = self._log_head()
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            size = 0
+        if self.segments and (head != self.head or size < self.end):
+            self.logger.info(f"{self.log_path} was rotated or rewritten; rebuilding its index")
+            self.reset()
+        start = self.end
+        if size <= start:
+            return 0
+        buckets, terms, records = [], {}, 0
+        with open(self.log_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Only complete lines; the writer may be mid-append
+            end = mm.rfind(b'\n', start, size) + 1
+            offset = start
+            existing = self.buckets()
+            last_bucket = existing[-1][0] if existing else None
+            while offset < end:
+                newline = mm.find(b'\n', offset, end)
+                line = mm[offset:newline]
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    if isinstance(record, dict):
+                        bucket = int(record.get('ts', 0) // self.bucket_seconds * self.bucket_seconds)
+                        if bucket != last_bucket:
+                            buckets.append([bucket, offset])
+                            last_bucket = bucket
+                        for term in record_terms(record):
+                            terms.setdefault(term, []).append(offset)
+                        records += 1
+                offset = newline + 1
+        if end <= start:
+            return 0
+        segment = self._encode(start, end, records, buckets, terms, head)
+        self._write(segment, append=bool(self.segments))
+        self._load()
+        self.head = head
+        if len(self.segments) > self.max_segments:
+            self.compact()
+        return records
+
+    def compact(self) -> None:
+        """Merge every segment into one"""
+        if len(self.segments) < 2:
+            return
+        terms: Dict[str, List[int]] = {}
+        for term in {t for segment in self.segments for t in segment.terms}:
+            terms[term] = self.postings(term).tolist()
+        buckets = []
+        for bucket in self.buckets():
+            if not buckets or buckets[-1][0] != bucket[0]:
+                buckets.append(bucket)
+        data = self._encode(self.segments[0].start, self.end, self.records, buckets, terms, self.head)
+        self._write(data, append=False)
+        self._load()
+
+    def reset(self) -> None:
+        try:
+            os.remove(self.index_path)
+        except FileNotFoundError:
+            pass
+        self.segments, self.head, self._data = [], '', b''
+
+
+def parse_time(value) -> Optional[float]:
+    """Epoch seconds from a number, an ISO date/time, or a relative age like 7d"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    match = _RELATIVE.match(value.strip())
+    if match:
+        return time.time() - float(match.group(1)) * _UNITS[match.group(2)]
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _intersect(lists: List[array]) -> List[int]:
+    lists = sorted(lists, key=len)
+    smallest, others = lists[0], lists[1:]
+    result = []
+    for offset in smallest:
+        for other in others:
+            pos = bisect.bisect_left(other, offset)
+            if pos == len(other) or other[pos] != offset:
+                break
+        else:
+            result.append(offset)
+    return result
+
+
+class AuditQuery:
+    """Time-range, process, failure and event queries over an audit log
+
+    The live log is answered from its index through a memory map; gzip
+    archives written by rotation are scanned only when archives=True.
+    """
+    def __init__(self, log_path: str = 'ghost_mode_audit.log', bucket_seconds: int = BUCKET_SECONDS):
+        self.log_path = log_path
+        self.index = AuditIndex(log_path, bucket_seconds=bucket_seconds)
+
+    def refresh(self) -> int:
+        return self.index.update()
+
+    @staticmethod
+    def _terms(process: str = None, failed: str = None, event: str = None) -> List[str]:
+        terms = []
+        if process:
+            terms.append(f"proc:{process.lower()}")
+        if failed:
+            terms.append(f"fail:{failed}")
+        if event:
+            terms.append(f"event:{event}")
+        return terms
+
+    def _window(self, start: Optional[float], end: Optional[float]) -> Tuple[int, int]:
+        """Byte range holding every record whose bucket overlaps [start, end]
+
+        The writer appends records in timestamp order, so buckets are
+        ascending in both time and offset.
+        """
+        buckets = self.index.buckets()
+        keys = [b[0] for b in buckets]
+        lo, hi = 0, self.index.end
+        if start is not None and buckets:
+            pos = bisect.bisect_right(keys, start) - 1
+            lo = buckets[pos][1] if pos >= 0 else 0
+        if end is not None and buckets:
+            pos = bisect.bisect_right(keys, end)
+            hi = buckets[pos][1] if pos < len(buckets) else self.index.end
+        return lo, hi
+
+    def search(self, start=None, end=None, process: str = None, failed: str = None,
+               event: str = None, limit: int = None, reverse: bool = False,
+               archives: bool = False) -> Iterator[dict]:
+        """Records matching every given filter, oldest first unless reverse"""
+        start, end = parse_time(start), parse_time(end)
+        self.refresh()
+        terms = self._terms(process, failed, event)
+        found = 0
+        sources = [self._search_live(start, end, terms, reverse)]
+        if archives:
+            archive_paths = self._archives()
+            if reverse:
+                sources.extend(self._search_archive(p, start, end, terms, reverse) for p in archive_paths)
+            else:
+                sources[:0] = [self._search_archive(p, start, end, terms, reverse)
+                               for p in reversed(archive_paths)]
+        for source in sources:
+            for record in source:
+                yield record
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+    def last(self, **filters) -> Optional[dict]:
+        """Most recent record matching the filters"""
+        return next(self.search(reverse=True, limit=1, **filters), None)
+
+    def count(self, **filters) -> int:
+        return sum(1 for _ in self.search(**filters))
+
+    @staticmethod
+    def _in_range(record: dict, start, end) -> bool:
+        ts = record.get('ts', 0)
+        return (start is None or ts >= start) and (end is None or ts <= end)
+
+    def _search_live(self, start, end, terms, reverse) -> Iterator[dict]:
+        if not self.index.end:
+            return
+        lo, hi = self._window(start, end)
+        with open(self.log_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if terms:
+                lists = []
+                for term in terms:
+                    postings = self.index.postings(term)
+                    lists.append(postings[bisect.bisect_left(postings, lo):bisect.bisect_left(postings, hi)])
+                offsets = _intersect(lists)
+                if reverse:
+                    offsets.reverse()
+                lines = (mm[offset:mm.find(b'\n', offset)] for offset in offsets)
+            else:
+                lines = mm[lo:hi].split(b'\n')
+                lines = (reversed(lines) if reverse else lines)
+            for line in lines:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if self._in_range(record, start, end):
+                    yield record
+
+    def _archives(self) -> List[str]:
+        """Rotated archives, newest first"""
+        paths, index = [], 1
+        while os.path.exists(f"{self.log_path}.{index}.gz"):
+            paths.append(f"{self.log_path}.{index}.gz")
+            index += 1
+        return paths
+
+    def _search_archive(self, path: str, start, end, terms, reverse) -> Iterator[dict]:
+        wanted = set(terms)
+        with gzip.open(path, 'rb') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if reverse:
+            records.reverse()
+        for record in records:
+            if self._in_range(record, start, end) and wanted <= record_terms(record):
+                yield record
+
+
+def format_record(record: dict) -> str:
+    """One-line human summary of an audit record"""
+    when = datetime.fromtimestamp(record.get('ts', 0)).isoformat(sep=' ', timespec='seconds')
+    failed = sorted(t[5:] for t in record_terms(record) if t.startswith('fail:'))
+    killed = record.get('terminated') or record.get('still_running') or []
+    parts = [when, record.get('event', '?')]
+    if killed:
+        label = 'terminated' if record.get('event') == ACTIVATION else 'still running'
+        parts.append(f"{label}: {', '.join(map(str, killed))}")
+    parts.append(f"failed: {', '.join(failed)}" if failed else 'ok')
+    return ' | '.join(parts)
+
+
+def run_query(args, out=None) -> int:
+    out = out or sys.stdout
+    query = AuditQuery(args.log)
+    filters = dict(start=args.since, end=args.until, process=args.process,
+                   failed=args.failed, event=args.event, archives=args.archives)
+    if args.count:
+        print(query.count(**filters), file=out)
+        return 0
+    if args.last:
+        records = [r for r in [query.last(**filters)] if r is not None]
+    else:
+        records = query.search(limit=args.limit, **filters)
+    found = False
+    for record in records:
+        found = True
+        print(json.dumps(record) if args.json else format_record(record), file=out)
+    return 0 if found else 1
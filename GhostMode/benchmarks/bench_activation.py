@@ -0,0 +1,140 @@
+"""
+Benchmark and regression gate for end-to-end activation
+Runs activation and deactivation through GhostModeController against the
+simulated OS backend (fake_os.py) at several process table sizes, prints
+latency percentiles and the scaling per 1000 processes, and compares the
+percentiles with a stored baseline; any beyond tolerance fail the run.
+Baselines are machine-specific: refresh with --update-baseline after an
+intended change or on new hardware.
+Usage: python bench_activation.py [--sizes 1000 5000 10000 20000] [--runs 15]
+                                  [--os Linux Windows] [--update-baseline]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_os import Latency, SimulatedOS
+from stats import LatencyStats
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_activation.json')
+KINDS = ('activation', 'deactivation')
+GATED = ('p50_ms', 'p95_ms')
+
+
+def measure(os_type: str, size: int, args) -> dict:
+    """Percentiles per kind for one OS and process table size"""
+    sim = SimulatedOS(
+        size, os_type, command_latency=Latency(args.command_ms / 1000),
+        registry_latency=Latency(args.registry_ms / 1000),
+        terminate_latency=Latency(args.terminate_ms / 1000),
+        restore_latency=Latency(args.restore_ms / 1000), failure_rate=args.failure_rate, seed=size
+    )
+    controller = sim.controller()
+    latencies = {kind: LatencyStats() for kind in KINDS}
+    failures = 0
+    try:
+        for _ in range(args.runs):
+            sim.reset()
+            for kind, toggle in zip(KINDS, (controller.activate, controller.deactivate)):
+                start = time.perf_counter()
+                report = toggle()
+                latencies[kind].record(time.perf_counter() - start)
+                failures += not report.ok
+    finally:
+        controller.close()
+        sim.close()
+    result = {}
+    for kind, stats in latencies.items():
+        summary = stats.summary()
+        result[kind] = {key: round(summary[key], 3) for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')}
+    result['failures'] = failures
+    return result
+
+
+def slope_ms_per_k(sizes, values) -> float:
+    """Least-squares growth in milliseconds per 1000 processes"""
+    if len(sizes) < 2:
+        return 0.0
+    return statistics.linear_regression([s / 1000 for s in sizes], values).slope
+
+
+def compare(results: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    regressions = []
+    for key, kinds in results.items():
+        expected = baseline.get('results', {}).get(key)
+        if expected is None:
+            continue
+        for kind in KINDS:
+            for metric in GATED:
+                limit = expected[kind][metric] * (1 + tolerance) + slack_ms
+                if kinds[kind][metric] > limit:
+                    regressions.append(f"{key} {kind} {metric}: {kinds[kind][metric]:.1f} ms "
+                                       f"> {limit:.1f} ms (baseline {expected[kind][metric]:.1f} ms)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000, 20000])
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--os', nargs='+', default=['Linux', 'Windows'], choices=['Linux', 'Windows'])
+    parser.add_argument('--command-ms', type=float, default=5.0, help='simulated device command latency')
+    parser.add_argument('--registry-ms', type=float, default=0.5, help='simulated registry call latency')
+    parser.add_argument('--terminate-ms', type=float, default=20.0, help='simulated termination batch latency')
+    parser.add_argument('--restore-ms', type=float, default=30.0, help='simulated relaunch latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of simulated calls that fail')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative slowdown')
+    parser.add_argument('--slack-ms', type=float, default=5.0, help='allowed absolute slowdown')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = {}
+    for os_type in args.os:
+        for size in args.sizes:
+            results[f'{os_type}/{size}'] = measure(os_type, size, args)
+            row = results[f'{os_type}/{size}']
+            print(f"{os_type:>7} {size:>6} procs  " + "  ".join(
+                f"{kind[:5]} p50 {row[kind]['p50_ms']:6.1f} p95 {row[kind]['p95_ms']:6.1f} "
+                f"p99 {row[kind]['p99_ms']:6.1f} ms" for kind in KINDS
+            ) + (f"  failures {row['failures']}" if row['failures'] else ''))
+        for kind in KINDS:
+            p50s = [results[f'{os_type}/{size}'][kind]['p50_ms'] for size in args.sizes]
+            print(f"{os_type:>7} {kind} scaling: {slope_ms_per_k(args.sizes, p50s):+.2f} ms per 1000 processes")
+
+    settings = {name: getattr(args, name) for name in
+                ('runs', 'command_ms', 'registry_ms', 'terminate_ms', 'restore_ms', 'failure_rate')}
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': platform.machine(), 'cpus': os.cpu_count(),
+                       'python': platform.python_version(),
+                       'settings': settings, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != settings:
+        print(f"Baseline was recorded with {baseline.get('settings')}; not comparable with {settings}")
+        return 0
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        return 1
+    print(f"Within {args.tolerance:.0%} + {args.slack_ms:g} ms of the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
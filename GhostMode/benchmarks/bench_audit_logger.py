@@ -0,0 +1,72 @@
+"""
+Benchmark for the audit pipeline
+Measures sustained events per second and the latency a log_activation
+call adds to the activation path, against a synchronous FileHandler
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audit_logger import FSYNC_BATCH, FSYNC_INTERVAL, FSYNC_NEVER, AuditLogger
+from stats import LatencyStats
+
+EVENTS = 20000
+MATCHED = [{'pid': 1000 + n, 'name': 'zoom', 'target': 'zoom', 'ppid': 1, 'exe': '/usr/bin/zoom'} for n in range(5)]
+STAGES = [{'name': name, 'ok': True, 'elapsed': 0.12, 'error': None, 'timed_out': False}
+          for name in ('webcam', 'microphone', 'processes', 'location')]
+
+
+def activation(log):
+    log(['zoom'], True, True, (0,), matched=MATCHED, suspended=[], stages=STAGES)
+
+
+def sync_baseline(path):
+    """The previous writer: a FileHandler called on the producer thread"""
+    logger = logging.getLogger('bench-audit')
+    logger.propagate = False
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    def log(killed, hw_ok, loc_ok, loc_state, matched=None, suspended=None, stages=None):
+        logger.info(f"Activated Ghost Mode - hardware_ok={hw_ok}, location_ok={loc_ok}, "
+                    f"location_state={loc_state}, terminated={killed}, matched={matched}, stages={stages}")
+    return log, lambda: (logger.removeHandler(handler), handler.close())
+
+
+def measure(label, log, drain):
+    latency = LatencyStats(window=EVENTS)
+    start = time.perf_counter()
+    for _ in range(EVENTS):
+        t = time.perf_counter()
+        activation(log)
+        latency.record(time.perf_counter() - t)
+    drain()
+    elapsed = time.perf_counter() - start
+    summary = latency.summary()
+    print(f"{label:>20}: {EVENTS / elapsed:>9.0f} events/s, per call p50 "
+          f"{summary['p50_ms'] * 1000:.1f} us, p99 {summary['p99_ms'] * 1000:.1f} us")
+
+
+def main():
+    root = tempfile.mkdtemp()
+    try:
+        log, close = sync_baseline(os.path.join(root, 'sync.log'))
+        measure('sync FileHandler', log, close)
+        for policy in (FSYNC_NEVER, FSYNC_INTERVAL, FSYNC_BATCH):
+            audit = AuditLogger(os.path.join(root, f'{policy}.log'), queue_size=EVENTS, fsync=policy)
+            measure(f'async fsync={policy}', audit.log_activation, audit.flush)
+            audit.close()
+            if audit.dropped:
+                print(f"{'':>20}  dropped {audit.dropped}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark for indexed audit queries
+Builds a synthetic multi-million-record audit log, indexes it, and times
+lookups against a full scan of the file
+Usage: python bench_audit_query.py [records]
+"""
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audit_query import AuditQuery, record_terms
+
+PROCS = ['zoom.exe', 'teams.exe', 'chrome', 'slack', 'obs', 'discord', 'skype', 'webex']
+
+
+def generate(path, count, start=1.6e9, step=15.0):
+    rng = random.Random(7)
+    with open(path, 'w') as f:
+        for n in range(count):
+            ok = rng.random() > 0.02
+            record = {
+                'ts': start + n * step, 'seq': n + 1, 'event': 'activation',
+                'hardware_ok': ok, 'location_ok': True, 'location_state': [0],
+                'terminated': rng.sample(PROCS, rng.randint(0, 2)), 'matched': [], 'suspended': [],
+                'stages': [{'name': 'webcam', 'ok': ok, 'elapsed': 0.11, 'error': None, 'timed_out': False}],
+            }
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+    return start + count * step
+
+
+def full_scan(path, start, end, process):
+    found = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            record = json.loads(line)
+            if start <= record['ts'] <= end and f'proc:{process}' in record_terms(record):
+                found += 1
+    return found
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:>34}: {(time.perf_counter() - start) * 1000:>10.1f} ms  -> {result}")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    root = tempfile.mkdtemp()
+    path = os.path.join(root, 'ghost_mode_audit.log')
+    try:
+        end_ts = timed(f'generate {count} records', lambda: generate(path, count))
+        print(f"{'log size':>34}: {os.path.getsize(path) / 1e6:>10.1f} MB")
+        query = AuditQuery(path)
+        timed('build index', query.refresh)
+        print(f"{'index size':>34}: {os.path.getsize(query.index.index_path) / 1e6:>10.1f} MB")
+        week = 7 * 86400
+        start, end = end_ts - 30 * 86400, end_ts - 23 * 86400
+        timed('last zoom.exe kill', lambda: query.last(process='zoom.exe')['seq'])
+        timed('webcam failures in one week', lambda: query.count(start=start, end=end, failed='webcam'))
+        timed('zoom.exe kills in one week', lambda: query.count(start=start, end=start + week, process='zoom.exe'))
+        timed('all records in one hour', lambda: query.count(start=start, end=start + 3600))
+        timed('reopen index (no new records)', lambda: AuditQuery(path).refresh())
+        timed('full scan: zoom.exe kills in week', lambda: full_scan(path, start, start + week, 'zoom.exe'))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
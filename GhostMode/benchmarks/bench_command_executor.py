@@ -0,0 +1,56 @@
+"""
+Benchmark for hardware command execution
+Compares a fresh shell per command with a pool of warm shell sessions,
+using fake_shell.py to model the startup cost of PowerShell. Both runners
+execute the same commands the way HardwareController does: two chains in
+parallel, each running its commands one at a time.
+"""
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from command_executor import CommandExecutor, CommandResult
+
+FAKE_SHELL = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_shell.py')]
+# The four restore commands of deactivate_protections, as two independent chains
+CHAINS = [[['true'], ['true']], [['true'], ['true']]]
+
+
+class FreshShellRunner:
+    """Starts a new (slow) shell for every command, as powershell -Command does"""
+    def run(self, argv, timeout: float = None) -> CommandResult:
+        result = subprocess.run(FAKE_SHELL + ['-c', shlex.join(argv)], capture_output=True,
+                                text=True, timeout=timeout)
+        return CommandResult(result.returncode, result.stdout, result.stderr)
+
+
+def run_chains(runner) -> list:
+    """HardwareController._run_chains: chains in parallel, commands in order"""
+    with ThreadPoolExecutor(max_workers=len(CHAINS)) as pool:
+        return list(pool.map(lambda chain: [runner.run(cmd) for cmd in chain], CHAINS))
+
+
+def main():
+    startup = float(os.environ.setdefault('GHOST_SHELL_STARTUP', '0.3'))
+    executor = CommandExecutor(pool_size=len(CHAINS), shell_argv=FAKE_SHELL)
+    start = time.perf_counter()
+    executor.warm()
+    warm_cost = time.perf_counter() - start
+    commands = sum(len(chain) for chain in CHAINS)
+    try:
+        for label, runner in (('fresh shell', FreshShellRunner()), ('warm pool', executor)):
+            start = time.perf_counter()
+            run_chains(runner)
+            print(f"{label:>12}: {(time.perf_counter() - start) * 1000:.1f} ms for {commands} commands "
+                  f"in {len(CHAINS)} parallel chains")
+        print(f"  startup {startup * 1000:.0f} ms per shell; pool warm-up {warm_cost * 1000:.1f} ms (paid once)")
+    finally:
+        executor.close()
+
+
+if __name__ == '__main__':
+    main()
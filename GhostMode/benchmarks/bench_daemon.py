@@ -0,0 +1,127 @@
+"""
+Load test for the control daemon
+Fires toggle bursts and status polls from hundreds of concurrent clients
+at a daemon whose pipeline takes a fixed time, and reports how many
+pipeline runs they collapsed into and the client-side latency.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from daemon import DaemonClient, GhostDaemon
+from stats import LatencyStats
+
+
+class FakeReport:
+    def __init__(self, kind):
+        self.kind = kind
+
+    def to_dict(self):
+        return {'kind': self.kind, 'ok': True, 'stages': []}
+
+
+class FakeController:
+    """Pipelines that sleep for a fixed time, standing in for real hardware work"""
+    def __init__(self, pipeline_s: float, status_s: float):
+        self.pipeline_s = pipeline_s
+        self.status_s = status_s
+        self.runs = 0
+        self.status_calls = 0
+        self.active = False
+
+    def _run(self, active):
+        self.runs += 1
+        time.sleep(self.pipeline_s)
+        self.active = active
+        return FakeReport('activation' if active else 'deactivation')
+
+    def activate(self, on_progress=None):
+        return self._run(True)
+
+    def deactivate(self, on_progress=None):
+        return self._run(False)
+
+    def status(self):
+        self.status_calls += 1
+        time.sleep(self.status_s)
+        return {'active': self.active, 'protections': {}, 'sources': {}, 'pending_restore': []}
+
+
+def start_daemon(controller, socket_path):
+    daemon = GhostDaemon(controller, socket_path)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(daemon.start())
+        ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait()
+    return daemon, loop, thread
+
+
+def burst(socket_path, commands, clients):
+    """One request per client, all at once; returns LatencyStats and wall time"""
+    latency = LatencyStats(window=len(commands))
+    barrier = threading.Barrier(clients)
+
+    def request(cmd):
+        client = DaemonClient(socket_path)
+        barrier.wait()
+        start = time.perf_counter()
+        client.request(cmd)
+        latency.record(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(request, commands))
+    return latency, time.perf_counter() - start
+
+
+def report(label, latency, wall):
+    print(f"{label:>10}: {latency.count} requests in {wall * 1000:.0f} ms  "
+          f"p50 {latency.percentile(50) * 1000:.1f} ms  p99 {latency.percentile(99) * 1000:.1f} ms  "
+          f"max {latency.max * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--pipeline-ms', type=float, default=300.0)
+    parser.add_argument('--status-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    socket_path = os.path.join(root, 'ghost.sock')
+    controller = FakeController(args.pipeline_ms / 1000, args.status_ms / 1000)
+    daemon, loop, thread = start_daemon(controller, socket_path)
+    try:
+        toggles = ['activate' if i % 2 else 'deactivate' for i in range(args.clients)]
+        latency, wall = burst(socket_path, toggles, args.clients)
+        report('toggles', latency, wall)
+        print(f"{'':>10}  {controller.runs} pipeline runs "
+              f"(uncoalesced: {args.clients} x {args.pipeline_ms:.0f} ms)")
+        latency, wall = burst(socket_path, ['status'] * args.clients, args.clients)
+        report('status', latency, wall)
+        print(f"{'':>10}  {controller.status_calls} probes for {args.clients} requests")
+        print(f"     stats: {daemon.stats()}")
+    finally:
+        asyncio.run_coroutine_threadsafe(daemon.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
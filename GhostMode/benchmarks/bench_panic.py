@@ -0,0 +1,119 @@
+"""
+Benchmark for armed panic mode
+Compares trigger-to-last-protection latency of a cold activation (scan,
+resolve, probe, then act) with executing a pre-armed kill plan, against
+real sleep processes and a hardware stand-in with fixed command costs
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from controller import GhostModeController
+from orchestrator import FINISHED
+from stats import LatencyHistogram, LatencyObjective
+
+
+class FakeHardware:
+    """Device commands and probes that take a fixed time, like warm shell commands"""
+    os_type = 'Linux'
+
+    def __init__(self, probe_s: float, command_s: float):
+        self.probe_s = probe_s
+        self.command_s = command_s
+        self.runner = None
+
+    def _probe(self):
+        time.sleep(self.probe_s)
+        return False
+
+    def _command(self):
+        time.sleep(self.command_s)
+        return True
+
+    check_webcam_status = check_microphone_status = _probe
+    disable_webcam = disable_microphone = randomize_mac_address = deactivate_protections = _command
+
+
+class FakeLocation:
+    def prepare(self):
+        return False
+
+    def release(self):
+        pass
+
+
+def spawn(marker: str, count: int) -> list:
+    return [subprocess.Popen(['sleep', marker]) for _ in range(count)]
+
+
+def controller_for(root: str, marker: str, args) -> GhostModeController:
+    config = os.path.join(root, 'targets.txt')
+    with open(config, 'w') as f:
+        f.write(f'cmd:{marker}\n')
+    controller = GhostModeController(config, os.path.join(root, 'state.json'),
+                                     os.path.join(root, 'audit.log'), enforce=False)
+    controller.hardware = FakeHardware(args.probe_ms / 1000, args.command_ms / 1000)
+    controller.location_service = FakeLocation()
+    return controller
+
+
+def run_trial(controller, procs, armed: bool) -> float:
+    """Trigger-to-last-protection seconds for one activation"""
+    controller.journal.state = {}
+    finished = []
+    if armed:
+        controller.panic.arm()
+        # Let the plan pick up everything spawned for this trial
+        time.sleep(0.3)
+    started = time.monotonic()
+    controller.activate(lambda event, name, result: event == FINISHED and finished.append(time.monotonic()))
+    for proc in procs:
+        proc.wait()
+    controller.process_manager.launch_records = []
+    if armed:
+        controller.panic.disarm()
+    return max(finished) - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=20)
+    parser.add_argument('--probe-ms', type=float, default=30.0)
+    parser.add_argument('--command-ms', type=float, default=10.0)
+    parser.add_argument('--objective-ms', type=float, default=250.0)
+    args = parser.parse_args()
+
+    # A marker that cannot appear in this benchmark's own command line
+    marker = f'{random.randint(10**6, 10**7)}.{random.randint(1000, 9999)}'
+    objective = LatencyObjective(args.objective_ms / 1000, 0.95)
+    root = tempfile.mkdtemp()
+    controller = controller_for(root, marker, args)
+    controller.panic.terminator.grace_period = controller.process_manager.terminator.grace_period
+    try:
+        for label, armed in (('cold', False), ('armed', True)):
+            histogram = LatencyHistogram()
+            for _ in range(args.trials):
+                procs = spawn(marker, args.processes)
+                histogram.record(run_trial(controller, procs, armed))
+            summary = histogram.summary()
+            verdict = objective.evaluate(histogram)
+            print(f"{label:>6}: mean {summary['mean_ms']:.1f} ms  p50 <= {summary['p50_ms']:.0f} ms  "
+                  f"p99 <= {summary['p99_ms']:.0f} ms  max {summary['max_ms']:.1f} ms  "
+                  f"objective {args.objective_ms:.0f} ms: {verdict['attained']:.0%} "
+                  f"({'met' if verdict['met'] else 'missed'})")
+        print(f"  {args.processes} target processes, {args.trials} trials each")
+    finally:
+        controller.close()
+        subprocess.run(['pkill', '-f', f'sleep {marker}'])
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
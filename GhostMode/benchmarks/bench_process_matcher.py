@@ -0,0 +1,51 @@
+"""
+Micro-benchmark for target process matching
+Compares the per-process list rebuild against the compiled ProcessMatcher
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from process_matcher import ProcessMatcher
+
+PROCESS_COUNTS = (1000, 3000, 5000)
+TARGET_COUNTS = (10, 100, 500)
+
+
+def random_name(rng: random.Random) -> str:
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))) + '.exe'
+
+
+def legacy_scan(names, targets) -> int:
+    """The original kill_processes matching loop"""
+    return sum(1 for name in names if name.lower() in [p.lower() for p in targets])
+
+
+def matcher_scan(names, matcher) -> int:
+    match = matcher.match
+    return sum(1 for name in names if match(name))
+
+
+def main():
+    rng = random.Random(1234)
+    print(f"{'procs':>6} {'targets':>8} {'legacy ms':>10} {'matcher ms':>11} {'speedup':>8}")
+    for target_count in TARGET_COUNTS:
+        targets = [random_name(rng) for _ in range(target_count)]
+        # A handful of glob rules exercises the combined regex path too
+        rules = targets + ['glob:chrome*', 'glob:*helper*.exe']
+        for process_count in PROCESS_COUNTS:
+            names = [random_name(rng) for _ in range(process_count)]
+            for i in range(0, process_count, 50):
+                names[i] = targets[(i // 50) % target_count]
+            legacy = min(timeit.repeat(lambda: legacy_scan(names, targets), number=1, repeat=3))
+            matcher = ProcessMatcher(rules)
+            compiled = min(timeit.repeat(lambda: matcher_scan(names, matcher), number=1, repeat=3))
+            print(f"{process_count:>6} {target_count:>8} {legacy * 1000:>10.2f} "
+                  f"{compiled * 1000:>11.2f} {legacy / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
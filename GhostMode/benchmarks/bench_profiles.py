@@ -0,0 +1,85 @@
+"""
+Benchmark for profile target loading
+Compares parsing and compiling a target list with loading its compiled
+form from the on-disk cache (a fresh process) and from memory (a profile
+switch back), for rule sets of several sizes and mixes.
+Usage: python bench_profiles.py [--sizes 100 1000 5000] [--runs 5]
+"""
+import argparse
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from process_matcher import TargetSet
+from profiles import Profile, TargetCache
+
+
+def random_rules(rng: random.Random, size: int) -> tuple:
+    """Mostly exact names, with globs, regexes, exe paths and cmdline rules mixed in"""
+    def word():
+        return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+    kinds = [
+        lambda: f"{word()}.exe",
+        lambda: f"glob:{word()}*",
+        lambda: f"re:{word()}[0-9]+",
+        lambda: f"exe:/opt/{word()}/*",
+        lambda: f"cmd:--{word()}",
+        lambda: f"{word()} @freeze",
+    ]
+    weights = [60, 10, 10, 8, 7, 5]
+    return tuple(rng.choices(kinds, weights)[0]() for _ in range(size))
+
+
+def best_ms(func, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return min(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='ghost-profiles-')
+    rng = random.Random(7)
+    print(f"{'rules':>6} {'compile ms':>11} {'disk ms':>8} {'memory ms':>10} {'speedup':>8}")
+    try:
+        for size in args.sizes:
+            profile = Profile('bench', random_rules(rng, size))
+            path = os.path.join(root, f'{size}.cache')
+            TargetCache(path).get(profile)
+
+            def compile_fresh():
+                # re caches compiled patterns per process; start each run cold
+                import re
+                re.purge()
+                TargetSet.compile(profile.targets)
+
+            def load_disk():
+                import re
+                re.purge()
+                TargetCache(path).get(profile)
+
+            warm = TargetCache(path)
+            warm.get(profile)
+            compiled = best_ms(compile_fresh, args.runs)
+            disk = best_ms(load_disk, args.runs)
+            memory = best_ms(lambda: warm.get(profile), args.runs)
+            print(f"{size:>6} {compiled:>11.2f} {disk:>8.2f} {memory:>10.4f} {compiled / disk:>7.1f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Benchmark and regression gate for headless startup
+Runs `ghostmode.py status` in fresh interpreters, reads `-X importtime`
+output, and fails if a GUI or Windows-only module is imported. The fastest
+import time and cold start, and the set of modules imported, are compared
+with a stored baseline: a time beyond tolerance or a module the baseline
+did not import fails the run. Baselines are machine-specific: refresh with
+--update-baseline after an intended change or on new hardware.
+Usage: python bench_startup.py [--runs 5] [--tolerance 0.25] [--slack-ms 10] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'ghostmode.py')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_startup.json')
+FORBIDDEN = ('PyQt5', 'winreg', 'tkinter')
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Module name -> (self us, cumulative us) from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nesting is shown by indentation; the module name itself has none
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run(workdir: str, args, importtime: bool):
+    cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [CLI] + args
+    start = time.perf_counter()
+    result = subprocess.run(cmd, cwd=workdir, capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+
+def compare(results: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    regressions = []
+    for metric in ('import_ms', 'start_ms'):
+        limit = baseline[metric] * (1 + tolerance) + slack_ms
+        if results[metric] > limit:
+            regressions.append(f"{metric}: {results[metric]:.1f} ms > {limit:.1f} ms "
+                               f"(baseline {baseline[metric]:.1f} ms)")
+    added = sorted(set(results['modules']) - set(baseline['modules']))
+    if added:
+        regressions.append(f"modules not imported by the baseline: {', '.join(added)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--slack-ms', type=float, default=10.0, help='allowed absolute slowdown')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'config'))
+    with open(os.path.join(workdir, 'config', 'target_processes.txt'), 'w') as f:
+        f.write('ghost-bench-no-such-process\n')
+    failures = []
+    try:
+        command = ['status', '--json', '--local']
+        import_totals, starts, modules = [], [], {}
+        for _ in range(args.runs):
+            _, result = run(workdir, command, importtime=True)
+            modules = parse_importtime(result.stderr)
+            import_totals.append(sum(s for s, _ in modules.values()) / 1000)
+            elapsed, _ = run(workdir, command, importtime=False)
+            starts.append(elapsed * 1000)
+        # Scheduling noise only ever adds time, so the fastest run is the most stable
+        import_ms, start_ms = min(import_totals), min(starts)
+        slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:8]
+        print(f"modules imported: {len(modules)}")
+        print(f"import time:      {import_ms:.1f} ms")
+        print(f"cold start:       {start_ms:.1f} ms")
+        print("slowest imports (self):")
+        for name, (self_us, _) in slowest:
+            print(f"  {self_us / 1000:7.2f} ms  {name}")
+
+        forbidden = sorted(name for name in modules if name.split('.')[0] in FORBIDDEN)
+        if forbidden:
+            failures.append(f"forbidden modules imported: {', '.join(forbidden)}")
+    finally:
+        shutil.rmtree(workdir)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+
+    results = {'import_ms': round(import_ms, 3), 'start_ms': round(start_ms, 3), 'modules': sorted(modules)}
+    # The modules imported depend on the interpreter, so only like ones compare
+    settings = {'runs': args.runs, 'python': platform.python_version()}
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': platform.machine(), 'cpus': os.cpu_count(),
+                       'settings': settings, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != settings:
+        print(f"Baseline was recorded with {baseline.get('settings')}; not comparable with {settings}")
+        return 0
+    regressions = compare(results, baseline['results'], args.tolerance, args.slack_ms)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        return 1
+    print(f"Within {args.tolerance:.0%} + {args.slack_ms:g} ms of the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
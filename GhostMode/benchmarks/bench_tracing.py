@@ -0,0 +1,86 @@
+"""
+Benchmark for tracing overhead
+Measures the cost of one span with tracing off and on, and of a stubbed
+activation pipeline with and without tracing, and fails if a disabled
+span costs more than its budget. The cheapest spanned call, a registry
+write, takes tens of microseconds, so the default budget keeps a disabled
+span under a few percent of it and far below one percent of a command.
+Usage: python bench_tracing.py [--spans 200000] [--runs 200] [--max-disabled-ns 1500]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tracing
+from orchestrator import PipelineOrchestrator, Stage
+
+
+def per_span_ns(spans: int) -> float:
+    span = tracing.span
+    start = time.perf_counter()
+    for _ in range(spans):
+        with span('command', runner='shell', command='amixer'):
+            pass
+    return (time.perf_counter() - start) / spans * 1e9
+
+
+def baseline_ns(spans: int) -> float:
+    start = time.perf_counter()
+    for _ in range(spans):
+        pass
+    return (time.perf_counter() - start) / spans * 1e9
+
+
+def pipeline_ms(orchestrator: PipelineOrchestrator, runs: int) -> float:
+    def work():
+        # A stage making a handful of traced service calls
+        for op in ('open', 'query', 'set'):
+            with tracing.span('registry', op=op):
+                pass
+        return True
+    stages = [Stage(name, work) for name in ('webcam', 'microphone', 'processes', 'location')]
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        orchestrator.run('activation', stages)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--spans', type=int, default=200000)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--max-disabled-ns', type=float, default=1500.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    orchestrator = PipelineOrchestrator()
+    try:
+        loop = baseline_ns(args.spans)
+        tracing.disable()
+        disabled = per_span_ns(args.spans) - loop
+        off_ms = pipeline_ms(orchestrator, args.runs)
+        tracing.enable(tracing.Tracer())
+        enabled = per_span_ns(args.spans) - loop
+        on_ms = pipeline_ms(orchestrator, args.runs)
+        tracing.disable()
+    finally:
+        orchestrator.shutdown()
+
+    print(f"span, tracing off: {disabled:8.0f} ns")
+    print(f"span, tracing on:  {enabled:8.0f} ns")
+    print(f"activation pipeline (4 stages, 12 spans), median of {args.runs}: "
+          f"off {off_ms:.3f} ms, on {on_ms:.3f} ms")
+    if disabled > args.max_disabled_ns:
+        print(f"FAIL: a disabled span costs {disabled:.0f} ns, budget {args.max_disabled_ns:.0f} ns")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Benchmark for the trigger engine
+Dispatches synthetic event storms against rule sets of several sizes,
+comparing the engine's (type, kind) index with a linear scan of every
+rule, then drives a started engine to measure event-to-action latency
+and how many actions debouncing and coalescing leave.
+Usage: python bench_triggers.py [--rules 10 100 1000] [--events 20000] [--act-ms 50]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from triggers import DEVICE, NETWORK, PROCESS, Event, Rule, TriggerEngine
+
+SUBSYSTEMS = ['video4linux', 'sound', 'usb', 'input', 'block', 'net', 'hidraw', 'bluetooth']
+
+
+def random_rules(rng: random.Random, size: int) -> list:
+    """Mostly process rules, with device and network rules mixed in"""
+    def word():
+        return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+    rules = []
+    for n in range(size):
+        kind = rng.choices([PROCESS, DEVICE, NETWORK], [70, 20, 10])[0]
+        action = rng.choice(['activate', 'deactivate'])
+        if kind == PROCESS:
+            rules.append(Rule(f'r{n}', PROCESS, action, 'exec', processes=[f'glob:{word()}*']))
+        elif kind == DEVICE:
+            rules.append(Rule(f'r{n}', DEVICE, action, rng.choice(SUBSYSTEMS), fields={'action': 'add'}))
+        else:
+            rules.append(Rule(f'r{n}', NETWORK, action, rng.choice(['up', 'down']), fields={'interface': 'wl*'}))
+    return rules
+
+
+def random_events(rng: random.Random, count: int) -> list:
+    """Mostly unrelated process starts, as a busy desktop produces them"""
+    events = []
+    now = time.monotonic()
+    for _ in range(count):
+        kind = rng.choices([PROCESS, DEVICE, NETWORK], [90, 8, 2])[0]
+        if kind == PROCESS:
+            name = ''.join(rng.choices(string.ascii_lowercase, k=8))
+            events.append(Event(PROCESS, 'exec', {'name': name, 'exe': f'/usr/bin/{name}', 'cmdline': [name]}, now))
+        elif kind == DEVICE:
+            events.append(Event(DEVICE, rng.choice(SUBSYSTEMS), {'action': 'change'}, now))
+        else:
+            events.append(Event(NETWORK, 'up', {'interface': 'eth0'}, now))
+    return events
+
+
+def linear_scan(rules: list, events: list) -> int:
+    """Check every event against every rule of its type, as a flat list would"""
+    checks = 0
+    for event in events:
+        for rule in rules:
+            if rule.type != event.type or (rule.kind is not None and rule.kind != event.kind):
+                continue
+            checks += 1
+            rule.matches(event)
+    return checks
+
+
+def best(func, runs: int = 3) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+def storm(events: int, act_ms: float) -> dict:
+    """A burst of matching starts and alternating device events through a started engine"""
+    rules = [Rule('call', PROCESS, 'activate', 'exec', processes=['glob:zoom*']),
+             Rule('plug', DEVICE, 'activate', 'video4linux', debounce=0),
+             Rule('unplug', DEVICE, 'deactivate', 'usb', debounce=0)]
+    engine = TriggerEngine(rules, sources=[])
+    engine.start(lambda action, profile, rule: time.sleep(act_ms / 1000))
+    try:
+        burst = []
+        for n in range(events):
+            now = time.monotonic()
+            burst.append(Event(PROCESS, 'exec', {'name': 'zoom'}, now))
+            burst.append(Event(DEVICE, 'video4linux' if n % 2 else 'usb', {}, now))
+        start = time.perf_counter()
+        engine.submit(burst)
+        engine.wait_idle(60)
+        elapsed = time.perf_counter() - start
+    finally:
+        engine.stop()
+    return dict(engine.stats(), elapsed=elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rules', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--act-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    events = random_events(rng, args.events)
+    print(f"{'rules':>6} {'indexed ev/s':>13} {'linear ev/s':>12} {'checks/ev':>10} {'linear':>7} {'speedup':>8}")
+    for size in args.rules:
+        rules = random_rules(rng, size)
+        engine = TriggerEngine(rules, sources=[])
+        engine.request = lambda request: None
+
+        def indexed():
+            for event in events:
+                engine.dispatch(event)
+
+        indexed_s = best(indexed)
+        linear_s = best(lambda: linear_scan(rules, events))
+        engine.checks = 0
+        indexed()
+        linear_checks = linear_scan(rules, events)
+        print(f"{size:>6} {len(events) / indexed_s:>13.0f} {len(events) / linear_s:>12.0f} "
+              f"{engine.checks / len(events):>10.1f} {linear_checks / len(events):>7.1f} "
+              f"{linear_s / indexed_s:>7.1f}x")
+
+    stats = storm(args.events // 4, args.act_ms)
+    latency = stats['latency']
+    print(f"\nstorm: {stats['events']} events in {stats['elapsed'] * 1000:.0f} ms, {stats['fired']} fired, "
+          f"{stats['debounced']} debounced, {stats['coalesced']} coalesced, {stats['actions']} actions")
+    print(f"event to action: p50 {latency['p50_ms']:.2f} ms, p99 {latency['p99_ms']:.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
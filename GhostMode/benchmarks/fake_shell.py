@@ -0,0 +1,10 @@
+"""
+Stand-in for a slow-starting shell such as PowerShell
+Sleeps for GHOST_SHELL_STARTUP seconds, then replaces itself with /bin/sh
+"""
+import os
+import sys
+import time
+
+time.sleep(float(os.environ.get('GHOST_SHELL_STARTUP', '0.3')))
+os.execv('/bin/sh', ['/bin/sh'] + sys.argv[1:])
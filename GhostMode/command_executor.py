@@ -0,0 +1,233 @@
+"""
+Command execution for Ghost Mode
+Runs hardware commands in fresh processes or through warm shell sessions
+"""
+import logging
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Sequence
+
+from tracing import span
+
+# Applied when a caller gives no timeout, so a hung command or a pool whose
+# sessions are all stuck cannot block a pipeline stage forever
+DEFAULT_TIMEOUT = 30.0
+
+
+class CommandResult(NamedTuple):
+    """Exit status and output of a command"""
+    returncode: int
+    stdout: str
+    stderr: str = ''
+
+
+def command_name(argv: Sequence[str]) -> str:
+    """Program a command runs, past any sudo, for labelling spans"""
+    for arg in argv:
+        if arg != 'sudo' and not arg.startswith('-'):
+            return os.path.basename(arg)
+    return ''
+
+
+class SubprocessRunner:
+    """Runs every command in a new process"""
+    def run(self, argv: Sequence[str], timeout: float = None) -> CommandResult:
+        with span('command', runner='subprocess', command=command_name(argv)):
+            result = subprocess.run(list(argv), capture_output=True, text=True, timeout=timeout)
+        return CommandResult(result.returncode, result.stdout, result.stderr)
+
+    def run_many(self, commands: List[Sequence[str]], timeout: float = None) -> List[CommandResult]:
+        with ThreadPoolExecutor(max_workers=max(1, len(commands))) as pool:
+            return list(pool.map(lambda argv: self.run(argv, timeout), commands))
+
+    def close(self) -> None:
+        pass
+
+
+def default_shell() -> List[str]:
+    if os.name == 'nt':
+        return ['powershell', '-NoProfile', '-NonInteractive', '-Command', '-']
+    return ['/bin/sh']
+
+
+class ShellSession:
+    """A long-lived shell that runs commands one at a time
+
+    Each command is followed by a unique sentinel line carrying its exit
+    status, so output can be split per command without restarting the
+    shell. stderr is merged into stdout. The session is restarted when the
+    shell dies or a command times out. A command is sent again only if the
+    shell was found dead when sending it; one that dies while the command
+    runs raises, since the command may already have taken effect.
+    """
+    def __init__(self, shell_argv: Sequence[str] = None):
+        self.shell_argv = list(shell_argv or default_shell())
+        self.powershell = 'powershell' in os.path.basename(self.shell_argv[0]).lower()
+        self.proc: Optional[subprocess.Popen] = None
+        self.starts = 0
+        self.logger = logging.getLogger(__name__)
+        self._lines: queue.Queue = queue.Queue()
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self) -> None:
+        self.close()
+        self.proc = subprocess.Popen(
+            self.shell_argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, bufsize=0
+        )
+        self.starts += 1
+        self._lines = queue.Queue()
+        threading.Thread(target=self._pump, args=(self.proc, self._lines), daemon=True).start()
+        if self.powershell:
+            self._send("$ErrorActionPreference = 'Stop'\n")
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, lines: queue.Queue) -> None:
+        """Move shell output lines onto a queue so reads can time out"""
+        for line in iter(proc.stdout.readline, b''):
+            lines.put(line.decode('utf-8', 'replace'))
+        lines.put(None)
+
+    def close(self) -> None:
+        if self.proc is not None:
+            try:
+                self.proc.kill()
+                self.proc.wait(1)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+            self.proc = None
+
+    def _send(self, text: str) -> None:
+        self.proc.stdin.write(text.encode())
+        self.proc.stdin.flush()
+
+    def _script(self, argv: Sequence[str], token: str) -> str:
+        if self.powershell:
+            if len(argv) == 3 and argv[0].lower() == 'powershell' and argv[1] == '-Command':
+                body = argv[2]
+            else:
+                body = '& ' + ' '.join("'" + arg.replace("'", "''") + "'" for arg in argv)
+            return (
+                f"$c = 0; $global:LASTEXITCODE = 0; "
+                f"try {{ {body} 2>&1 | Out-String -Stream; if ($LASTEXITCODE) {{ $c = $LASTEXITCODE }} }} "
+                f"catch {{ $_ | Out-String -Stream; $c = 1 }}; Write-Output \"`n{token} $c\"\n"
+            )
+        # stdin is detached so a command cannot swallow the rest of the session input
+        return f"{shlex.join(argv)} </dev/null 2>&1; printf '\\n{token} %d\\n' \"$?\"\n"
+
+    def wait_ready(self, timeout: float = DEFAULT_TIMEOUT) -> None:
+        """Start the shell if needed and block until it answers"""
+        if not self.alive:
+            self.start()
+        token = f"__GHOST_{uuid.uuid4().hex}__"
+        if self.powershell:
+            self._send(f'Write-Output "`n{token} 0"\n')
+        else:
+            self._send(f"printf '\\n{token} 0\\n'\n")
+        self._collect(token, ['ready'], timeout)
+
+    def run(self, argv: Sequence[str], timeout: float = DEFAULT_TIMEOUT) -> CommandResult:
+        """Run one command in the session"""
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT
+        for _ in range(2):
+            if not self.alive:
+                self.start()
+            token = f"__GHOST_{uuid.uuid4().hex}__"
+            try:
+                self._send(self._script(argv, token))
+            except BrokenPipeError as e:
+                self.logger.warning(f"Shell session died ({e}); restarting")
+                self.close()
+                continue
+            try:
+                return self._collect(token, argv, timeout)
+            except EOFError:
+                self.close()
+                raise RuntimeError(f"Shell session exited while running {argv[0]}") from None
+        raise RuntimeError(f"Shell session could not run {argv[0]}")
+
+    def _collect(self, token: str, argv: Sequence[str], timeout: float) -> CommandResult:
+        output = []
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                # The command may still be running in the shell; start afresh
+                self.close()
+                raise subprocess.TimeoutExpired(list(argv), timeout, ''.join(output))
+            if line is None:
+                raise EOFError("shell exited")
+            if line.startswith(token):
+                code = int(line.split()[1])
+                # Drop the newline printed before the sentinel
+                text = ''.join(output)
+                return CommandResult(code, text[:-1] if text.endswith('\n') else text)
+            output.append(line)
+
+
+class CommandExecutor:
+    """Pool of warm shell sessions shared by hardware operations
+
+    Independent commands passed to run_many execute in parallel, one per
+    session, so a batch pays neither process startup nor serial latency.
+    """
+    def __init__(self, pool_size: int = 2, shell_argv: Sequence[str] = None):
+        self.pool_size = pool_size
+        self.shell_argv = shell_argv
+        self._idle: queue.Queue = queue.Queue()
+        self._sessions: List[ShellSession] = []
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _acquire(self, timeout: float) -> ShellSession:
+        with self._lock:
+            if self._idle.empty() and len(self._sessions) < self.pool_size:
+                session = ShellSession(self.shell_argv)
+                self._sessions.append(session)
+                return session
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No shell session became free within {timeout:g}s") from None
+
+    def warm(self) -> None:
+        """Start every session now so the first activation skips shell startup"""
+        with self._lock:
+            new = [ShellSession(self.shell_argv) for _ in range(self.pool_size - len(self._sessions))]
+            self._sessions.extend(new)
+        with ThreadPoolExecutor(max_workers=max(1, len(new))) as pool:
+            list(pool.map(ShellSession.wait_ready, new))
+        for session in new:
+            self._idle.put(session)
+
+    def run(self, argv: Sequence[str], timeout: float = DEFAULT_TIMEOUT) -> CommandResult:
+        """Run a command on a free session; waiting for one is bounded by timeout too"""
+        if timeout is None:
+            timeout = DEFAULT_TIMEOUT
+        with span('command', runner='shell', command=command_name(argv)):
+            session = self._acquire(timeout)
+            try:
+                return session.run(argv, timeout)
+            finally:
+                self._idle.put(session)
+
+    def run_many(self, commands: List[Sequence[str]], timeout: float = DEFAULT_TIMEOUT) -> List[CommandResult]:
+        """Run independent commands in parallel across the pool"""
+        with ThreadPoolExecutor(max_workers=max(1, min(self.pool_size, len(commands)))) as pool:
+            return list(pool.map(lambda argv: self.run(argv, timeout), commands))
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+            self._idle = queue.Queue()
@@ -0,0 +1,303 @@
+"""
+Ghost Mode controller
+Owns the services and runs activation/deactivation without any GUI, so the
+Qt app, the command line and other front ends share one implementation.
+Service modules are imported on first use to keep headless startup cheap.
+"""
+import logging
+import os
+import time
+from functools import cached_property
+
+CONFIG_PATH = 'config/target_processes.txt'
+STATE_PATH = 'ghost_mode_state.json'
+AUDIT_PATH = 'ghost_mode_audit.log'
+
+
+class GhostModeController:
+    """Services, reconciliation and auditing for one ghost mode front end
+
+    enforce=False suits one-shot callers: no enforcement watcher is started
+    and the launch records needed to undo an activation are kept in the
+    state journal so a later process can deactivate. With tracing enabled,
+    metrics_path receives a Prometheus textfile after every toggle.
+    profile names the profile to use; by default the one used last, as
+    recorded in the state journal, or the store's default.
+    """
+    def __init__(self, config_path: str = CONFIG_PATH, state_path: str = STATE_PATH,
+                 audit_path: str = AUDIT_PATH, runner=None, enforce: bool = True,
+                 metrics_path: str = None, profile: str = None):
+        self.config_path = config_path
+        self.state_path = state_path
+        self.audit_path = audit_path
+        self.runner = runner
+        self.enforce = enforce
+        self.metrics_path = metrics_path
+        self.profile_name = profile
+        self.logger = logging.getLogger(__name__)
+
+    @cached_property
+    def hardware(self):
+        from hardware_control import HardwareController
+        return HardwareController(self.runner)
+
+    @cached_property
+    def process_manager(self):
+        from process_manager import ProcessManager
+        from restoration import LaunchRecord
+        from network_cloak import CloakRecord
+        from suspension import SuspendRecord
+        process_manager = ProcessManager()
+        process_manager.targets = self.profiles.targets(self.profile)
+        if self.enforce:
+            # The enforcement watcher re-applies edited profiles while active
+            process_manager.refresh = self.apply_profile
+        session = self.journal.session
+        process_manager.launch_records = [LaunchRecord.from_dict(r) for r in session.get('launch_records', [])]
+        process_manager.suspended = [SuspendRecord(**r) for r in session.get('suspended', [])]
+        process_manager.cloaked = [CloakRecord(**r) for r in session.get('cloaked', [])]
+        return process_manager
+
+    @cached_property
+    def profiles(self):
+        """Profiles beside the target list; compiled targets are cached beside the journal"""
+        from profiles import CACHE_FILE, PROFILES_FILE, ProfileStore, TargetCache
+        cache = TargetCache(os.path.join(os.path.dirname(self.state_path), CACHE_FILE))
+        # One-shot callers exit before an edit could matter, so only long-lived ones watch
+        return ProfileStore(os.path.join(os.path.dirname(self.config_path), PROFILES_FILE),
+                            self.config_path, cache, watch=self.enforce)
+
+    @property
+    def profile(self):
+        """The selected Profile, falling back to the default if it was removed"""
+        name = self.profile_name or self.journal.session.get('profile')
+        try:
+            return self.profiles.get(name)
+        except KeyError:
+            self.logger.warning(f"Profile {name!r} no longer exists; using {self.profiles.default()!r}")
+            return self.profiles.get()
+
+    def select_profile(self, name: str):
+        """Switch to a profile; raises KeyError if there is none by that name"""
+        profile = self.profiles.get(name)
+        self.profile_name = name
+        self.apply_profile()
+        return profile
+
+    def apply_profile(self) -> bool:
+        """Pick up edited profiles and put the selected one's settings in place
+
+        Cheap when nothing changed: the watch check does not block and the
+        compiled targets come from memory. Returns True if the targets were
+        replaced; an armed panic plan is then rebuilt for them.
+        """
+        self.profiles.refresh()
+        profile = self.profile
+        self.hardware.mac.configure(profile.mac_interfaces, profile.mac_prefix)
+        targets = self.profiles.targets(profile)
+        process_manager = self.process_manager
+        if targets is process_manager.targets:
+            return False
+        process_manager.targets = targets
+        self.logger.info(f"Using profile {profile.name}: {len(targets.rules)} target rules")
+        if self.armed:
+            self.panic.refresh()
+        return True
+
+    @cached_property
+    def location_service(self):
+        from location_service import LocationService
+        return LocationService()
+
+    @cached_property
+    def audit_logger(self):
+        from audit_logger import AuditLogger
+        return AuditLogger(self.audit_path)
+
+    @cached_property
+    def orchestrator(self):
+        from orchestrator import PipelineOrchestrator
+        return PipelineOrchestrator()
+
+    @cached_property
+    def journal(self):
+        from reconcile import StateJournal
+        return StateJournal(self.state_path)
+
+    @cached_property
+    def reconciler(self):
+        from reconcile import Reconciler, build_protections
+        protections = build_protections(
+            self.hardware, self.process_manager, self.location_service, self.enforce
+        )
+        return Reconciler(self.orchestrator, self.journal, protections)
+
+    @cached_property
+    def panic(self):
+        from panic import PanicArm
+        return PanicArm(self)
+
+    @cached_property
+    def triggers(self):
+        """Trigger rules from triggers.ini beside the target list; start() it to follow them"""
+        from triggers import TRIGGERS_FILE, TriggerEngine, parse_rules
+        path = os.path.join(os.path.dirname(self.config_path), TRIGGERS_FILE)
+        rules = []
+        if os.path.exists(path):
+            try:
+                rules = parse_rules(path)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Triggers disabled; could not load {path}: {e}")
+        return TriggerEngine(rules, scanner=self.process_manager.scanner)
+
+    @property
+    def armed(self) -> bool:
+        """True while a panic kill plan is being kept ready"""
+        return 'panic' in self.__dict__ and self.panic.armed
+
+    def _rearm(self) -> None:
+        # Arming is sticky: a plan spent by activation is rebuilt once deactivated
+        if 'panic' in self.__dict__ and self.panic.spent:
+            self.panic.arm()
+
+    def _plan(self, active: bool):
+        from reconcile import build_activation_actions, build_deactivation_actions, desired_state
+        context = {}
+        if active:
+            actions = build_activation_actions(
+                self.hardware, self.process_manager, self.location_service, context,
+                enforce=self.enforce
+            )
+            return 'activation', desired_state(True, self.profile.protections), actions, context
+        actions = build_deactivation_actions(
+            self.hardware, self.process_manager, self.location_service, context
+        )
+        return 'deactivation', desired_state(False), actions, context
+
+    def activate(self, on_progress=None):
+        """Apply every protection not already in effect; returns the ReconcileReport
+
+        While armed, the prepared panic plan is executed instead.
+        """
+        self.apply_profile()
+        if self.armed:
+            report = self.panic.trigger(on_progress)
+        else:
+            kind, desired, actions, context = self._plan(True)
+            report = self.reconciler.reconcile(kind, desired, actions, on_progress, context)
+        self.record_activation(report)
+        return report
+
+    def deactivate(self, on_progress=None):
+        self.apply_profile()
+        kind, desired, actions, context = self._plan(False)
+        report = self.reconciler.reconcile(kind, desired, actions, on_progress, context)
+        self.record_deactivation(report)
+        self._rearm()
+        return report
+
+    def activate_async(self, on_progress=None, on_finished=None):
+        """Activate on a worker thread; on_finished gets the report, unaudited"""
+        self.apply_profile()
+        if self.armed:
+            return self.panic.trigger_async(on_progress, on_finished)
+        kind, desired, actions, context = self._plan(True)
+        return self.reconciler.reconcile_async(kind, desired, actions, on_progress, on_finished, context)
+
+    def deactivate_async(self, on_progress=None, on_finished=None):
+        self.apply_profile()
+        kind, desired, actions, context = self._plan(False)
+
+        def finished(report):
+            self._rearm()
+            if on_finished:
+                on_finished(report)
+        return self.reconciler.reconcile_async(kind, desired, actions, on_progress, finished, context)
+
+    def _save_session(self) -> None:
+        process_manager = self.process_manager
+        self.journal.session = {
+            'profile': self.profile.name,
+            'launch_records': [r.to_dict() for r in process_manager.launch_records],
+            'suspended': [r._asdict() for r in process_manager.suspended],
+            'cloaked': [r._asdict() for r in process_manager.cloaked],
+        }
+        self.journal.save()
+
+    def record_activation(self, result) -> None:
+        """Persist what deactivation needs and write the audit record"""
+        self._save_session()
+        snapshot = result.context.get('snapshot')
+        self.audit_logger.log_activation(
+            self.process_manager.killed_processes,
+            result.stage_ok('webcam') and result.stage_ok('microphone'),
+            result.stage_ok('location'), result.context.get('location_state', ()),
+            matched=snapshot.to_records() if snapshot else [],
+            suspended=[r._asdict() for r in self.process_manager.suspended],
+            cloaked=[r._asdict() for r in self.process_manager.cloaked],
+            stages=result.to_records()
+        )
+        self.export_metrics()
+
+    def record_deactivation(self, result) -> None:
+        self._save_session()
+        snapshot = result.context.get('snapshot')
+        self.audit_logger.log_deactivation(
+            snapshot.running_targets if snapshot else [],
+            result.stage_ok('hardware'), result.stage_ok('location'),
+            result.context.get('location_state', ()),
+            matched=snapshot.to_records() if snapshot else [],
+            restored=[r._asdict() for r in self.process_manager.last_restore],
+            thawed=[r._asdict() for r in self.process_manager.thawed],
+            uncloaked=[r._asdict() for r in self.process_manager.uncloaked],
+            stages=result.to_records()
+        )
+        self.export_metrics()
+
+    def export_metrics(self) -> None:
+        """Write the metrics textfile, if tracing is on and a path is set"""
+        from tracing import tracer
+        active = tracer()
+        if active is None or not self.metrics_path:
+            return
+        try:
+            active.write_textfile(self.metrics_path)
+        except OSError as e:
+            self.logger.warning(f"Could not write metrics to {self.metrics_path}: {e}")
+
+    def status(self) -> dict:
+        """Observed protection state without changing anything"""
+        from reconcile import PROTECTIONS
+        self.apply_profile()
+        profile = self.profile
+        observed, sources = self.reconciler.observe(PROTECTIONS)
+        status = {
+            'active': all(observed[name] for name in profile.protections),
+            'profile': profile.name,
+            'protections': observed,
+            'sources': sources,
+            'pending_restore': [r.app for r in self.process_manager.launch_records],
+            'suspended': len(self.process_manager.suspended),
+            'cloaked': len(self.process_manager.cloaked),
+            'checked_at': time.time(),
+        }
+        if 'panic' in self.__dict__:
+            status['panic'] = self.panic.stats()
+        if 'triggers' in self.__dict__ and self.triggers.running:
+            status['triggers'] = self.triggers.stats()
+        return status
+
+    def close(self) -> None:
+        """Flush the audit trail and stop background work"""
+        if 'triggers' in self.__dict__:
+            self.triggers.stop()
+        if 'panic' in self.__dict__:
+            self.panic.disarm()
+        if 'process_manager' in self.__dict__:
+            self.process_manager.stop_enforcement()
+        if 'audit_logger' in self.__dict__:
+            self.audit_logger.close()
+        if 'orchestrator' in self.__dict__:
+            self.orchestrator.shutdown()
+        if 'profiles' in self.__dict__:
+            self.profiles.close()
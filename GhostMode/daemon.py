@@ -0,0 +1,427 @@
+"""
+Ghost Mode control daemon
+Owns the ghost mode services in one long-running process and serves them
+over a Unix-domain socket, so the GUI, hotkey tools and scripts can all
+act as thin clients.
+
+Protocol: one JSON object per line in each direction.
+    -> {"id": 1, "cmd": "activate" | "deactivate" | "status" | "metrics" | "subscribe"}
+    <- {"id": 1, "ok": true, "result": {...}} or {"id": 1, "ok": false, "error": "..."}
+"activate" and "deactivate" accept "profile": "NAME" to switch profiles first.
+With triggers, fired rules go through the same path as client requests
+and are published as {"event": "trigger", ...}.
+After "subscribe" the connection receives {"event": ...} lines until it closes.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+import tempfile
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import tracing
+
+ACTIVATE = 'activate'
+DEACTIVATE = 'deactivate'
+STATUS = 'status'
+SUBSCRIBE = 'subscribe'
+METRICS = 'metrics'
+COMMANDS = (ACTIVATE, DEACTIVATE, STATUS, METRICS, SUBSCRIBE)
+
+
+def fallback_socket_dir() -> str:
+    """Per-user directory for the socket when there is no XDG runtime dir, as under sudo"""
+    return os.path.join(tempfile.gettempdir(), f'ghostmode-{os.getuid()}')
+
+
+def default_socket_path() -> str:
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, 'ghostmode.sock')
+    return os.path.join(fallback_socket_dir(), 'ghostmode.sock')
+
+
+def private_dir(path: str) -> str:
+    """Create path as a 0700 directory, or check that it already is one we own
+
+    Raises PermissionError for a symlink, another user's directory or one
+    others may write to, since a socket in it could be replaced.
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory owned by uid {os.getuid()}")
+    return path
+
+
+def check_owner(path: str) -> None:
+    """Raise PermissionError unless path is a socket owned by this user"""
+    info = os.lstat(path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a socket owned by uid {os.getuid()}")
+
+
+def peer_uid(sock: socket.socket) -> Optional[int]:
+    """User id of the process at the other end, where the platform reports it"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+class GhostDaemon:
+    """Serializes ghost mode pipelines for any number of socket clients
+
+    Requests coalesce: asking for the state a running pipeline is already
+    moving to joins that run, and asking for the opposite state queues one
+    follow-up run. Only the newest queued request survives; requests it
+    replaces are answered with superseded=True. Status is served from a
+    cache refreshed at most every status_ttl seconds and never while a
+    pipeline is running.
+    """
+    def __init__(self, controller, socket_path: str = None, status_ttl: float = 2.0,
+                 subscriber_queue: int = 256, triggers=None):
+        self.controller = controller
+        # A triggers.TriggerEngine to run while serving, if any
+        self.triggers = triggers
+        self.socket_path = socket_path or default_socket_path()
+        self.status_ttl = status_ttl
+        self.subscriber_queue = subscriber_queue
+        self.logger = logging.getLogger(__name__)
+        self.runs = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.status_refreshes = 0
+        self._current: Optional[Tuple[bool, asyncio.Future]] = None
+        self._pending: Optional[Tuple[bool, asyncio.Future]] = None
+        self._status: Optional[dict] = None
+        self._status_at = 0.0
+        self._status_refresh: Optional[asyncio.Future] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._connections: Set[asyncio.Task] = set()
+        self._server = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # Pipelines
+
+    async def set_active(self, active: bool) -> dict:
+        """Drive ghost mode to the requested state, sharing runs with other clients"""
+        self.requests += 1
+        if self._current is None:
+            return await asyncio.shield(self._start(active))
+        if self._pending is not None:
+            pending_active, pending_future = self._pending
+            if pending_active == active:
+                self.coalesced += 1
+                return await asyncio.shield(pending_future)
+            # The newest request wins; the one it replaces never runs
+            self._pending = None
+            pending_future.set_result({'superseded': True, 'kind': self._kind(pending_active)})
+        current_active, current_future = self._current
+        self.coalesced += 1
+        if current_active == active:
+            return await asyncio.shield(current_future)
+        self._pending = (active, self._loop.create_future())
+        return await asyncio.shield(self._pending[1])
+
+    async def select_profile(self, name: str) -> None:
+        """Switch profiles for this and later runs; raises KeyError if unknown"""
+        # Switching may rebuild an armed plan, which walks the process table
+        await self._loop.run_in_executor(None, self.controller.select_profile, name)
+        self._status_at = 0.0
+
+    def _on_trigger(self, action: str, profile: str, rule: str) -> None:
+        """Run a fired trigger's action; called on the trigger engine's worker thread"""
+        future = asyncio.run_coroutine_threadsafe(self._triggered(action, profile, rule), self._loop)
+        future.result()
+
+    async def _triggered(self, action: str, profile: str, rule: str) -> dict:
+        self.publish({'event': 'trigger', 'rule': rule, 'action': action, 'profile': profile})
+        if profile:
+            await self.select_profile(profile)
+        return await self.set_active(action == ACTIVATE)
+
+    @staticmethod
+    def _kind(active: bool) -> str:
+        return 'activation' if active else 'deactivation'
+
+    def _start(self, active: bool, future: asyncio.Future = None) -> asyncio.Future:
+        future = future or self._loop.create_future()
+        self._current = (active, future)
+        self._loop.create_task(self._run(active, future))
+        return future
+
+    async def _run(self, active: bool, future: asyncio.Future) -> None:
+        self.runs += 1
+        kind = self._kind(active)
+        self.publish({'event': 'pipeline_started', 'kind': kind})
+
+        def on_progress(event, name, result):
+            # Called on orchestrator worker threads
+            message = {'event': 'stage', 'kind': kind, 'state': event, 'stage': name}
+            if result is not None:
+                message.update(ok=result.ok, elapsed=round(result.elapsed, 3))
+            self._loop.call_soon_threadsafe(self.publish, message)
+
+        pipeline = self.controller.activate if active else self.controller.deactivate
+        try:
+            report = await self._loop.run_in_executor(None, pipeline, on_progress)
+            result = report.to_dict()
+        except Exception as e:
+            self.logger.error(f"{kind} failed: {e}")
+            result = {'kind': kind, 'ok': False, 'error': str(e)}
+        self._status_at = 0.0
+        self.publish(dict(result, event='pipeline_finished'))
+        if not future.done():
+            future.set_result(result)
+        self._current = None
+        if self._pending is not None:
+            pending_active, pending_future = self._pending
+            self._pending = None
+            self._start(pending_active, pending_future)
+
+    # Status
+
+    async def status(self) -> dict:
+        fresh = time.monotonic() - self._status_at < self.status_ttl
+        if self._status is not None and (fresh or self._current is not None):
+            return self._decorate(self._status)
+        if self._status_refresh is None:
+            self._status_refresh = self._loop.create_task(self._refresh_status())
+        await asyncio.shield(self._status_refresh)
+        return self._decorate(self._status)
+
+    async def _refresh_status(self) -> None:
+        try:
+            self.status_refreshes += 1
+            self._status = await self._loop.run_in_executor(None, self.controller.status)
+            self._status_at = time.monotonic()
+        finally:
+            self._status_refresh = None
+
+    def _decorate(self, status: dict) -> dict:
+        result = dict(status)
+        result['running'] = self._kind(self._current[0]) if self._current else None
+        result['age'] = round(time.monotonic() - self._status_at, 3)
+        return result
+
+    # Events
+
+    def publish(self, message: dict) -> None:
+        for subscriber in list(self._subscribers):
+            if subscriber.full():
+                # A slow subscriber loses its oldest events rather than stalling others
+                subscriber.get_nowait()
+            subscriber.put_nowait(message)
+
+    # Connections
+
+    async def _send(self, writer: asyncio.StreamWriter, message: dict) -> None:
+        writer.write(json.dumps(message, default=str).encode() + b'\n')
+        await writer.drain()
+
+    async def _stream_events(self, writer: asyncio.StreamWriter, reader: asyncio.StreamReader) -> None:
+        subscriber: asyncio.Queue = asyncio.Queue(self.subscriber_queue)
+        self._subscribers.add(subscriber)
+        closed = self._loop.create_task(reader.read())
+        getter = None
+        try:
+            while True:
+                getter = self._loop.create_task(subscriber.get())
+                done, _ = await asyncio.wait({getter, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed in done:
+                    return
+                await self._send(writer, getter.result())
+        finally:
+            self._subscribers.discard(subscriber)
+            for task in (getter, closed):
+                if task is not None:
+                    task.cancel()
+
+    async def _dispatch(self, cmd: str, request: dict):
+        """Run one command; raises KeyError for unknown commands or profiles"""
+        if cmd in (ACTIVATE, DEACTIVATE):
+            if request.get('profile'):
+                await self.select_profile(request['profile'])
+            return await self.set_active(cmd == ACTIVATE)
+        if cmd == STATUS:
+            return await self.status()
+        if cmd == METRICS:
+            return self.metrics()
+        raise KeyError(f"unknown command {cmd!r}; expected one of {COMMANDS}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        uid = peer_uid(writer.get_extra_info('socket'))
+        if uid is not None and uid != os.getuid():
+            self.logger.warning(f"Refused a connection from uid {uid}")
+            writer.close()
+            return
+        self._connections.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    cmd = request.get('cmd')
+                except (ValueError, AttributeError):
+                    await self._send(writer, {'ok': False, 'error': 'invalid JSON request'})
+                    continue
+                reply: Dict[str, object] = {'id': request.get('id')}
+                if cmd == SUBSCRIBE:
+                    reply.update(ok=True, result={'subscribed': True})
+                    await self._send(writer, reply)
+                    await self._stream_events(writer, reader)
+                    break
+                try:
+                    reply.update(ok=True, result=await self._dispatch(cmd, request))
+                except KeyError as e:
+                    reply.update(ok=False, error=e.args[0])
+                except Exception as e:
+                    # A failing command is answered; the connection and the daemon carry on
+                    self.logger.error(f"{cmd} request failed: {e!r}")
+                    reply.update(ok=False, error=str(e) or type(e).__name__)
+                await self._send(writer, reply)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        # The shared temp dir fallback is only safe inside a directory of our own
+        if not os.path.isdir(directory) or directory == fallback_socket_dir():
+            private_dir(directory)
+        if os.path.lexists(self.socket_path):
+            # A leftover socket from a crashed daemon; refuse to steal a live
+            # one, or to remove anything another user put there
+            check_owner(self.socket_path)
+            if DaemonClient(self.socket_path).alive():
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+        # Bind with no access for others, so the socket is never briefly open
+        umask = os.umask(0o077)
+        try:
+            self._server = await asyncio.start_unix_server(self.handle, self.socket_path, backlog=1024)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+        self.logger.info(f"Ghost Mode daemon listening on {self.socket_path}")
+        if self.triggers is not None:
+            self.triggers.start(self._on_trigger)
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        if self.triggers is not None:
+            # The worker may be waiting on this loop for a pipeline
+            await self._loop.run_in_executor(None, self.triggers.stop)
+        if self._server is not None:
+            self._server.close()
+            # Subscribers would otherwise hold the server open indefinitely
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def metrics(self) -> dict:
+        """Span metrics in the Prometheus text format, if tracing is on"""
+        active = tracing.tracer()
+        if active is None:
+            return {'enabled': False}
+        return {'enabled': True, 'text': active.render(), 'spans': active.summary()}
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'runs': self.runs,
+            'coalesced': self.coalesced,
+            'status_refreshes': self.status_refreshes,
+            'subscribers': len(self._subscribers),
+            'triggers': self.triggers.stats() if self.triggers is not None else None,
+        }
+
+
+class DaemonClient:
+    """Blocking client for scripts, hotkey tools and the command line"""
+    def __init__(self, socket_path: str = None, timeout: float = 60.0):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self._ids = 0
+
+    def _connect(self, timeout: float = None) -> socket.socket:
+        """Connect to the daemon; raises PermissionError if another user could be answering"""
+        check_owner(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout or self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            uid = peer_uid(sock)
+            if uid is not None and uid != os.getuid():
+                raise PermissionError(f"{self.socket_path} is served by uid {uid}, not {os.getuid()}")
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def alive(self) -> bool:
+        try:
+            self._connect(timeout=0.5).close()
+            return True
+        except OSError:
+            return False
+
+    def request(self, cmd: str, **fields) -> dict:
+        """Send one command and return its result; raises RuntimeError on a daemon error"""
+        self._ids += 1
+        with self._connect() as sock:
+            sock.sendall(json.dumps(dict(fields, id=self._ids, cmd=cmd)).encode() + b'\n')
+            reply = json.loads(sock.makefile('rb').readline())
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error', 'daemon error'))
+        return reply['result']
+
+    def subscribe(self):
+        """Yield daemon events until the connection closes"""
+        with self._connect() as sock:
+            sock.settimeout(None)
+            sock.sendall(json.dumps({'id': 0, 'cmd': SUBSCRIBE}).encode() + b'\n')
+            stream = sock.makefile('rb')
+            stream.readline()
+            for line in stream:
+                yield json.loads(line)
+
+
+def run_daemon(controller, socket_path: str = None, triggers=None) -> None:
+    daemon = GhostDaemon(controller, socket_path, triggers=triggers)
+    try:
+        asyncio.run(daemon.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            # Never remove a socket another user left in our way
+            check_owner(daemon.socket_path)
+            os.unlink(daemon.socket_path)
+        except (FileNotFoundError, PermissionError):
+            pass
+        controller.close()
@@ -0,0 +1,226 @@
+"""
+Device state probing for Ghost Mode
+Reads webcam and microphone state from sysfs, /dev and /proc/asound, and
+caches it until kernel or filesystem change events say it is stale
+"""
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from command_executor import SubprocessRunner
+from fs_watch import DIR_EVENTS, ChangeWatcher
+from tracing import count, span
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP = 1
+# Subsystems whose uevents can change webcam or microphone state
+UEVENT_SUBSYSTEMS = frozenset({'module', 'video4linux', 'sound', 'usb'})
+
+WEBCAM = 'webcam'
+MICROPHONE = 'microphone'
+
+_SWITCH = re.compile(r'\[(on|off)\]')
+_CAPTURE_PCM = re.compile(r'pcm\d+c$')
+
+
+class WebcamState(NamedTuple):
+    """Whether the UVC driver is loaded and which video nodes exist"""
+    module_loaded: bool
+    devices: Tuple[str, ...]
+
+    @property
+    def disabled(self) -> bool:
+        return not self.module_loaded and not self.devices
+
+
+class MicrophoneState(NamedTuple):
+    """Capture PCMs and capture switch positions (None if amixer failed)"""
+    capture_devices: Tuple[str, ...]
+    switches: Optional[Tuple[bool, ...]]
+
+    @property
+    def disabled(self) -> bool:
+        if not self.capture_devices:
+            return True
+        # Unknown switch state counts as enabled
+        return bool(self.switches) and not any(self.switches)
+
+
+class UeventSource:
+    """Kernel uevents (the events udev consumes) read without blocking"""
+    def __init__(self, subsystems=UEVENT_SUBSYSTEMS):
+        self.subsystems = subsystems
+        self.sock: Optional[socket.socket] = None
+        self.logger = logging.getLogger(__name__)
+
+    def open(self) -> bool:
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            self.sock.bind((0, UEVENT_KERNEL_GROUP))
+            self.sock.setblocking(False)
+            return True
+        except (OSError, AttributeError) as e:
+            self.logger.info(f"Kernel uevents unavailable: {e}")
+            self.close()
+            return False
+
+    @staticmethod
+    def parse(data: bytes) -> Dict[str, str]:
+        """Split an 'action@devpath\\0KEY=value\\0...' message into its fields"""
+        fields = {}
+        for part in data.split(b'\0')[1:]:
+            key, sep, value = part.partition(b'=')
+            if sep:
+                fields[key.decode('ascii', 'replace')] = value.decode('utf-8', 'replace')
+        return fields
+
+    def pending(self) -> bool:
+        """Drain queued uevents; True if any concerned a watched subsystem"""
+        if self.sock is None:
+            return False
+        relevant = False
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return relevant
+            except OSError as e:
+                # ENOBUFS: events were dropped, so assume something changed
+                self.logger.debug(f"uevent socket: {e}")
+                return True
+            if self.parse(data).get('SUBSYSTEM') in self.subsystems:
+                relevant = True
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class DeviceProbe:
+    """Cached webcam and microphone state
+
+    Probes read sysfs, /dev and /proc/asound directly; only the capture
+    switch needs amixer. Results are reused until a uevent or an inotify
+    change under the probed directories arrives. Mixer switches raise no
+    events, so the microphone entry also expires after mixer_ttl seconds
+    and callers that change it invalidate the cache themselves.
+    """
+    def __init__(self, sys_root: str = '/sys', dev_root: str = '/dev', proc_root: str = '/proc',
+                 runner=None, mixer_ttl: float = 5.0, use_uevents: bool = True):
+        self.sys_root = sys_root
+        self.dev_root = dev_root
+        self.proc_root = proc_root
+        self.runner = runner or SubprocessRunner()
+        self.mixer_ttl = mixer_ttl
+        self.use_uevents = use_uevents
+        self.logger = logging.getLogger(__name__)
+        self.probes = 0
+        self.hits = 0
+        self._cache: Dict[str, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[ChangeWatcher] = None
+        self._uevents: Optional[UeventSource] = None
+
+    def _watch_paths(self) -> List[str]:
+        return [
+            os.path.join(self.sys_root, 'module'),
+            self.dev_root,
+            os.path.join(self.proc_root, 'asound'),
+        ]
+
+    def _start_watching(self) -> None:
+        """Created on first query so constructing a controller stays cheap"""
+        # Entries appearing or vanishing matter; writes to device nodes do not
+        self._watcher = ChangeWatcher(self._watch_paths(), DIR_EVENTS)
+        if self.use_uevents:
+            self._uevents = UeventSource()
+            if not self._uevents.open():
+                self._uevents = None
+
+    def _check_events(self) -> None:
+        if self._watcher is None:
+            self._start_watching()
+            return
+        # Evaluate both so each source drains its queue
+        changed = self._watcher.changed()
+        if self._uevents is not None and self._uevents.pending():
+            changed = True
+        if changed:
+            self._cache.clear()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def _cached(self, key: str, probe, ttl: float = None):
+        with self._lock:
+            self._check_events()
+            now = time.monotonic()
+            entry = self._cache.get(key)
+            if entry is not None and (ttl is None or now - entry[0] < ttl):
+                self.hits += 1
+                count('probe_cache', result='hit')
+                return entry[1]
+            with span('probe', device=key):
+                value = probe()
+            self.probes += 1
+            count('probe_cache', result='miss')
+            self._cache[key] = (now, value)
+            return value
+
+    def probe_webcam(self) -> WebcamState:
+        loaded = os.path.isdir(os.path.join(self.sys_root, 'module', 'uvcvideo'))
+        try:
+            devices = tuple(sorted(
+                entry.path for entry in os.scandir(self.dev_root) if entry.name.startswith('video')
+            ))
+        except OSError:
+            devices = ()
+        return WebcamState(loaded, devices)
+
+    def _capture_devices(self) -> Tuple[str, ...]:
+        asound = os.path.join(self.proc_root, 'asound')
+        devices = []
+        try:
+            cards = [e for e in os.scandir(asound) if e.name.startswith('card') and e.is_dir()]
+        except OSError:
+            return ()
+        for card in cards:
+            try:
+                devices.extend(e.path for e in os.scandir(card.path) if _CAPTURE_PCM.match(e.name))
+            except OSError:
+                continue
+        return tuple(sorted(devices))
+
+    def _capture_switches(self) -> Optional[Tuple[bool, ...]]:
+        try:
+            result = self.runner.run(['amixer', 'get', 'Capture'])
+        except (OSError, ValueError) as e:
+            self.logger.debug(f"amixer unavailable: {e}")
+            return None
+        if result.returncode != 0:
+            return None
+        return tuple(state == 'on' for state in _SWITCH.findall(result.stdout))
+
+    def probe_microphone(self) -> MicrophoneState:
+        devices = self._capture_devices()
+        # Without a capture PCM there is nothing to switch; skip amixer
+        switches = self._capture_switches() if devices else None
+        return MicrophoneState(devices, switches)
+
+    def webcam_state(self) -> WebcamState:
+        return self._cached(WEBCAM, self.probe_webcam)
+
+    def microphone_state(self) -> MicrophoneState:
+        return self._cached(MICROPHONE, self.probe_microphone, self.mixer_ttl)
+
+    def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.close()
+        if self._uevents is not None:
+            self._uevents.close()
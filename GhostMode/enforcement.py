@@ -0,0 +1,341 @@
+"""
+Continuous enforcement for Ghost Mode
+Watches for target processes that start while ghost mode is active
+"""
+import logging
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import threading
+import time
+from typing import List, Optional
+
+import psutil
+
+from proc_scanner import MatchedProcess
+from stats import LatencyStats
+from termination import KILLED, TERMINATED
+
+# linux/connector.h and linux/cn_proc.h
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+NLMSG_DONE = 3
+PROC_CN_MCAST_LISTEN = 1
+PROC_CN_MCAST_IGNORE = 2
+PROC_EVENT_EXEC = 0x00000002
+
+NLMSGHDR = struct.Struct('=IHHII')
+CN_MSG = struct.Struct('=IIIIHH')
+PROC_EVENT_HEADER = struct.Struct('=IIQ')
+EXEC_EVENT = struct.Struct('=II')
+
+
+class ProcConnectorSource:
+    """Process exec events from the Linux netlink proc connector
+
+    Needs CAP_NET_ADMIN; open() raises OSError when the connector is not
+    available so callers can fall back to ProcDiffSource.
+    """
+    name = 'proc_connector'
+
+    def __init__(self):
+        self.sock = None
+
+    def _control(self, op: int) -> None:
+        payload = struct.pack('=I', op)
+        cn = CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(payload), 0)
+        header = NLMSGHDR.pack(
+            NLMSGHDR.size + len(cn) + len(payload), NLMSG_DONE, 0, 0, self.sock.getsockname()[0]
+        )
+        self.sock.send(header + cn + payload)
+
+    def open(self, verify_timeout: float = 0.5) -> None:
+        if not hasattr(socket, 'AF_NETLINK'):
+            raise OSError("netlink is not available on this platform")
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            # Port 0 lets the kernel pick, so several listeners can coexist
+            self.sock.bind((0, CN_IDX_PROC))
+            self._control(PROC_CN_MCAST_LISTEN)
+            self._verify(verify_timeout)
+        except OSError:
+            self.close()
+            raise
+
+    def _verify(self, timeout: float) -> None:
+        """Check events are delivered; some kernels accept the subscription silently"""
+        true = shutil.which('true')
+        if not true:
+            return
+        probe = subprocess.Popen([true])
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                events = self.poll(max(0.0, deadline - time.monotonic()))
+                if any(pid == probe.pid for pid, _ in events):
+                    return
+        finally:
+            probe.wait()
+        raise OSError("proc connector delivered no events")
+
+    def close(self) -> None:
+        if self.sock is not None:
+            try:
+                self._control(PROC_CN_MCAST_IGNORE)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
+
+    def poll(self, timeout: float) -> List[tuple]:
+        """Return (pid, exec time) pairs, waiting up to timeout"""
+        self.sock.settimeout(timeout)
+        pids = []
+        try:
+            data = self.sock.recv(65536)
+        except socket.timeout:
+            return pids
+        self.sock.setblocking(False)
+        while data:
+            pids.extend(self.parse(data))
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+        return pids
+
+    @staticmethod
+    def parse(data: bytes) -> List[tuple]:
+        """Extract (tgid, CLOCK_MONOTONIC seconds) of exec events from a datagram"""
+        pids = []
+        offset = 0
+        while offset + NLMSGHDR.size <= len(data):
+            length = NLMSGHDR.unpack_from(data, offset)[0]
+            if length < NLMSGHDR.size:
+                break
+            event = offset + NLMSGHDR.size + CN_MSG.size
+            if event + PROC_EVENT_HEADER.size + EXEC_EVENT.size <= offset + length:
+                what, _, timestamp_ns = PROC_EVENT_HEADER.unpack_from(data, event)
+                if what == PROC_EVENT_EXEC:
+                    pid, tgid = EXEC_EVENT.unpack_from(data, event + PROC_EVENT_HEADER.size)
+                    if pid == tgid:
+                        pids.append((tgid, timestamp_ns / 1e9))
+            offset += (length + 3) & ~3
+        return pids
+
+
+class ProcDiffSource:
+    """New PIDs found by diffing the PID list between ticks
+
+    Newly seen PIDs are reported again for a few ticks so a process caught
+    between fork and exec is re-checked once it has its final name.
+    """
+    name = 'proc_diff'
+
+    def __init__(self, root: str = '/proc', recheck_ticks: int = 3):
+        self.root = root
+        self.recheck_ticks = recheck_ticks
+        self._known = set()
+        self._young = {}
+
+    def _list_pids(self) -> set:
+        if os.path.isdir(self.root):
+            with os.scandir(self.root) as it:
+                return {int(entry.name) for entry in it if entry.name.isdigit()}
+        return set(psutil.pids())
+
+    def open(self) -> None:
+        self._known = self._list_pids()
+        self._young = {}
+
+    def close(self) -> None:
+        self._known = set()
+        self._young = {}
+
+    def poll(self, timeout: float) -> List[tuple]:
+        """Sleep one tick and return (pid, None) for PIDs added or still settling"""
+        time.sleep(timeout)
+        current = self._list_pids()
+        for pid in current - self._known:
+            self._young[pid] = self.recheck_ticks
+        self._known = current
+        pids = []
+        for pid, ticks in list(self._young.items()):
+            if pid not in current or ticks <= 0:
+                del self._young[pid]
+                continue
+            self._young[pid] = ticks - 1
+            pids.append((pid, None))
+        return pids
+
+
+def open_event_source(logger=None):
+    """Open the proc connector if possible, else the incremental /proc diff"""
+    logger = logger or logging.getLogger(__name__)
+    try:
+        source = ProcConnectorSource()
+        source.open()
+        return source
+    except OSError as e:
+        logger.info(f"Proc connector unavailable ({e}); using /proc diff")
+    source = ProcDiffSource()
+    source.open()
+    return source
+
+
+class EnforcementWatcher:
+    """Background thread that kills target processes as they (re)start
+
+    Uses the proc connector when it can be opened and falls back to the
+    incremental /proc diff otherwise. The diff loop stretches its interval
+    when its measured CPU use exceeds cpu_budget (fraction of one core).
+    Every refresh_interval seconds it calls process_manager.refresh, if set,
+    so edited target profiles take effect while ghost mode stays on.
+    """
+    def __init__(self, process_manager, interval: float = 0.1, max_interval: float = 1.0,
+                 cpu_budget: float = 0.02, source=None, refresh_interval: float = 1.0):
+        self.process_manager = process_manager
+        self.base_interval = interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self.cpu_budget = cpu_budget
+        # The manager's engine, so an injected or simulated one is honoured
+        self.terminator = process_manager.terminator
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.latency = LatencyStats()
+        self.kills = 0
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def cpu_fraction(self) -> float:
+        """Share of one core used by the watcher since it started"""
+        return self.cpu_seconds / self.wall_seconds if self.wall_seconds else 0.0
+
+    def _open_source(self):
+        if self.source is not None:
+            self.source.open()
+            return self.source
+        return open_event_source(self.logger)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.source = self._open_source()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ghost-enforcement', daemon=True)
+        self._thread.start()
+        self.logger.info(f"Enforcement started using {self.source.name}")
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.source is not None:
+            self.source.close()
+        self.logger.info(f"Enforcement stopped: {self.stats()}")
+
+    def _refresh(self) -> None:
+        refresh = getattr(self.process_manager, 'refresh', None)
+        if refresh is None:
+            return
+        try:
+            refresh()
+        except Exception as e:
+            self.logger.error(f"Could not refresh targets: {e}")
+
+    def _run(self) -> None:
+        next_refresh = time.monotonic() + self.refresh_interval
+        while not self._stop.is_set():
+            wall = time.monotonic()
+            cpu = time.thread_time()
+            if wall >= next_refresh:
+                self._refresh()
+                next_refresh = wall + self.refresh_interval
+            events = self.source.poll(self.interval)
+            if events:
+                try:
+                    self.enforce(events)
+                except Exception as e:
+                    self.logger.error(f"Enforcement error: {e}")
+            cpu = time.thread_time() - cpu
+            self.cpu_seconds += cpu
+            self.wall_seconds += time.monotonic() - wall
+            self._adapt()
+
+    def _adapt(self) -> None:
+        """Back off the diff interval while over the CPU budget"""
+        if not isinstance(self.source, ProcDiffSource):
+            return
+        if self.cpu_fraction > self.cpu_budget:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        elif self.interval > self.base_interval:
+            self.interval = max(self.base_interval, self.interval / 1.5)
+
+    def _started(self, pid: int, exec_time: Optional[float]) -> float:
+        """Best known CLOCK_MONOTONIC time at which a process appeared"""
+        if exec_time is not None:
+            return exec_time
+        started = getattr(self.process_manager.scanner, 'started', None)
+        boot_started = started(pid) if started else None
+        if boot_started is not None and hasattr(time, 'CLOCK_BOOTTIME'):
+            # /proc start times count from boot including suspend
+            offset = time.clock_gettime(time.CLOCK_BOOTTIME) - time.monotonic()
+            return boot_started - offset
+        return time.monotonic()
+
+    def enforce(self, events: List[tuple]) -> int:
+        """Check new (pid, exec time) events against the targets and kill matches"""
+        pm = self.process_manager
+        matcher = pm.matcher
+        attrs = matcher.scan_attrs()
+        matches = {}
+        frozen, cloaked = [], []
+        for pid, exec_time in events:
+            info = pm.scanner.read(pid, attrs)
+            target = matcher.match(info.name, info.exe, info.cmdline) if info else None
+            if target is None:
+                continue
+            strategy = pm.strategy_for(target)
+            if strategy == 'freeze':
+                frozen.append(MatchedProcess(pid, info.name, target, info.ppid, info.exe))
+            elif strategy == 'cloak':
+                cloaked.append(MatchedProcess(pid, info.name, target, info.ppid, info.exe))
+            else:
+                matches[pid] = (info.name, self._started(pid, exec_time))
+        if frozen:
+            pm.freeze_processes(frozen)
+        if cloaked:
+            pm.cloak_processes(cloaked)
+        if not matches:
+            return len(frozen) + len(cloaked)
+        report = self.terminator.terminate(list(matches))
+        for pid, (name, started) in matches.items():
+            if report.outcomes.get(pid) in (TERMINATED, KILLED):
+                self.kills += 1
+                pm.killed_processes.append(name)
+                self.latency.record(max(0.0, report.signalled_at - started))
+                self.logger.info(f"Enforcement terminated respawned process: {name} ({pid})")
+        return len(matches) + len(frozen) + len(cloaked)
+
+    def stats(self) -> dict:
+        """Respawn-to-kill latency and CPU usage of the watcher"""
+        return {
+            'source': getattr(self.source, 'name', None),
+            'kills': self.kills,
+            'interval_s': self.interval,
+            'cpu_fraction': self.cpu_fraction,
+            'latency': self.latency.summary(),
+        }
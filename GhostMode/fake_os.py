@@ -0,0 +1,571 @@
+"""
+Simulated OS backend for Ghost Mode
+A synthetic process table, registry, sysfs tree, network links, cgroup
+tree, nftables and command runner that plug into HardwareController, ProcessManager and
+LocationService through their constructor arguments, so activation can
+be tested and benchmarked without devices, winreg or root. Latencies and failure rates are
+configurable and seeded for repeatable runs.
+"""
+import errno
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import psutil
+
+from command_executor import CommandResult, SubprocessRunner, command_name
+from location_service import SENSOR_KEY, SENSOR_VALUE
+from mac_address import ARPHRD_ETHER, IFF_UP, MacRandomizer
+from network_cloak import NetworkCloak
+from proc_scanner import ProcessInfo
+from registry import REG_DWORD, MemoryRegistryBackend, Registry
+from restoration import ProcessRestorer, RestoreResult
+from termination import DENIED, TERMINATED, TerminationReport
+from tracing import span
+
+# Above the largest Linux pid_max (2**22), so psutil never finds a synthetic PID
+SYNTHETIC_PID_BASE = 1 << 23
+# Target applications and how many helper processes each runs
+TARGET_APPS = (('zoom', 6), ('teams', 10), ('slack', 6), ('discord', 4), ('obs', 0))
+FILLER_NAMES = (
+    'bash', 'sshd', 'systemd-journald', 'dbus-daemon', 'NetworkManager', 'pulseaudio',
+    'pipewire', 'Xorg', 'gnome-shell', 'nautilus', 'firefox', 'code', 'python3', 'node',
+    'java', 'postgres', 'redis-server', 'nginx', 'cron', 'rsyslogd', 'containerd', 'dockerd',
+    'gvfsd', 'tracker-miner-fs', 'evolution-data-server', 'ibus-daemon', 'snapd', 'cupsd',
+    'avahi-daemon', 'polkitd', 'udisksd', 'upowerd', 'thermald', 'irqbalance', 'vim', 'tmux',
+)
+# name: (link type, backed by a device, address, allows changes while up)
+NETWORK_LINKS = {
+    'lo': (772, False, '00:00:00:00:00:00', False),
+    'docker0': (ARPHRD_ETHER, False, '02:42:ac:11:00:01', True),
+    'eth0': (ARPHRD_ETHER, True, '3c:52:82:1a:2b:3c', True),
+    'wlan0': (ARPHRD_ETHER, True, 'a4:c3:f0:11:22:33', False),
+}
+KERNEL_THREADS = ('kworker/0:1', 'ksoftirqd/0', 'migration/0', 'rcu_sched', 'kswapd0', 'jbd2/sda1-8')
+
+
+class Latency(NamedTuple):
+    """Normally distributed delay in seconds, never negative"""
+    mean: float
+    jitter: float = 0.25
+
+    def sample(self, rng: random.Random) -> float:
+        if self.mean <= 0:
+            return 0.0
+        return max(0.0, rng.gauss(self.mean, self.mean * self.jitter))
+
+
+class FakeProcessTable:
+    """Synthetic process table that doubles as a ProcessManager scanner
+
+    Holds one init-rooted tree of filler processes, kernel threads and the
+    TARGET_APPS, each app a main process with its helpers as children.
+    reset() restores the table as generated, so repeated activations see
+    the same targets.
+    """
+    def __init__(self, processes: int = 10000, os_type: str = 'Linux', rng: random.Random = None):
+        self.os_type = os_type
+        self.rng = rng or random.Random(0)
+        self._lock = threading.Lock()
+        self._next_pid = SYNTHETIC_PID_BASE
+        self._rows: Dict[int, ProcessInfo] = {}
+        self._generate(processes)
+        self._initial = (dict(self._rows), self._next_pid)
+
+    def _name(self, name: str) -> str:
+        return name + '.exe' if self.os_type == 'Windows' else name
+
+    def _exe(self, name: str) -> str:
+        if self.os_type == 'Windows':
+            return f"C:\\Program Files\\{name}\\{name}.exe"
+        return f"/usr/bin/{name}"
+
+    def _add(self, name: str, ppid: int, exe: Optional[str], cmdline: List[str]) -> int:
+        self._next_pid += 1
+        pid = self._next_pid
+        self._rows[pid] = ProcessInfo(pid, name, ppid, exe, cmdline)
+        return pid
+
+    @property
+    def target_rules(self) -> List[str]:
+        return [self._name(app) for app, _ in TARGET_APPS]
+
+    def _generate(self, processes: int) -> None:
+        rng = self.rng
+        windows = self.os_type == 'Windows'
+        init = self._add('wininit.exe' if windows else 'systemd', 0, self._exe('init'), [self._exe('init')])
+        kthreadd = self._add('System' if windows else 'kthreadd', 0, None, [])
+        session = self._add('explorer.exe' if windows else 'gnome-session', init,
+                            self._exe('session'), [self._exe('session')])
+        for app, helpers in TARGET_APPS:
+            name, exe = self._name(app), self._exe(app)
+            main = self._add(name, session, exe, [exe])
+            for n in range(helpers):
+                self._add(name, main, exe, [exe, '--type=renderer', f'--renderer-client-id={n}'])
+        parents = [init, session]
+        while len(self._rows) < processes:
+            if rng.random() < 0.2:
+                self._add(rng.choice(KERNEL_THREADS), kthreadd, None, [])
+                continue
+            base = rng.choice(FILLER_NAMES)
+            exe = self._exe(base)
+            pid = self._add(self._name(base), rng.choice(parents), exe, [exe, f'--instance={len(self._rows)}'])
+            # Shells and daemons parent later processes, giving the tree some depth
+            if len(parents) < 256 or rng.random() < 0.05:
+                parents.append(pid)
+
+    def reset(self) -> None:
+        with self._lock:
+            rows, self._next_pid = self._initial
+            self._rows = dict(rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def scan(self, attrs: Iterable[str] = ('pid', 'name')) -> Iterator[ProcessInfo]:
+        attrs = set(attrs)
+        full = 'exe' in attrs or 'cmdline' in attrs
+        with self._lock:
+            rows = list(self._rows.values())
+        if full:
+            yield from rows
+        else:
+            for info in rows:
+                yield ProcessInfo(info.pid, info.name, info.ppid)
+
+    def read(self, pid: int, attrs: Iterable[str] = ('pid', 'name')) -> Optional[ProcessInfo]:
+        return self._rows.get(pid)
+
+    def inspect(self, pid: int, attrs: List[str]) -> dict:
+        """Launch details in the shape of psutil.Process.as_dict"""
+        info = self._rows.get(pid)
+        if info is None:
+            raise psutil.NoSuchProcess(pid)
+        return {'exe': info.exe, 'cmdline': info.cmdline, 'cwd': '/', 'environ': {'PATH': '/usr/bin'},
+                'username': 'ghost'}
+
+    def tree(self, pids: Iterable[int]) -> List[int]:
+        """The given PIDs that still exist, followed by all their descendants"""
+        with self._lock:
+            children: Dict[int, List[int]] = {}
+            for info in self._rows.values():
+                children.setdefault(info.ppid, []).append(info.pid)
+            seen, queue = [], [pid for pid in pids if pid in self._rows]
+            while queue:
+                pid = queue.pop()
+                seen.append(pid)
+                queue.extend(children.get(pid, ()))
+        return seen
+
+    def remove(self, pids: Iterable[int]) -> List[ProcessInfo]:
+        with self._lock:
+            return [row for row in (self._rows.pop(pid, None) for pid in pids) if row is not None]
+
+    def spawn(self, name: str, exe: Optional[str], cmdline: List[str], ppid: int = 0) -> int:
+        with self._lock:
+            return self._add(name, ppid or SYNTHETIC_PID_BASE + 1, exe, cmdline)
+
+
+class FakeTerminator:
+    """Terminates synthetic process trees after a simulated signalling delay"""
+    def __init__(self, table: FakeProcessTable, latency: Latency = Latency(0.02),
+                 failure_rate: float = 0.0, rng: random.Random = None):
+        self.table = table
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random(0)
+
+    def terminate(self, pids: Iterable[int]) -> TerminationReport:
+        start = time.monotonic()
+        report = TerminationReport()
+        report.roots = list(pids)
+        with span('terminate', path='simulated'):
+            tree = self.table.tree(report.roots)
+            time.sleep(self.latency.sample(self.rng))
+            report.signalled_at = time.monotonic()
+            doomed = [pid for pid in tree if self.rng.random() >= self.failure_rate]
+            for info in self.table.remove(doomed):
+                report.names[info.pid] = info.name
+                report.outcomes[info.pid] = TERMINATED
+            for pid in set(tree) - set(doomed):
+                report.outcomes[pid] = DENIED
+        report.elapsed = time.monotonic() - start
+        return report
+
+
+class FakeRestorer(ProcessRestorer):
+    """Relaunches applications into the synthetic process table"""
+    def __init__(self, table: FakeProcessTable, latency: Latency = Latency(0.03),
+                 failure_rate: float = 0.0, rng: random.Random = None, max_workers: int = 4):
+        super().__init__(max_workers)
+        self.table = table
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random(0)
+
+    def launch(self, record) -> RestoreResult:
+        start = time.monotonic()
+        time.sleep(self.latency.sample(self.rng))
+        if self.rng.random() < self.failure_rate:
+            return RestoreResult(record.app, False, None, time.monotonic() - start, 'simulated failure')
+        argv = record.cmdline or [record.exe]
+        pid = self.table.spawn(os.path.basename(argv[0]), record.exe, list(argv))
+        return RestoreResult(record.app, True, pid, time.monotonic() - start)
+
+
+class FakeRegistry(MemoryRegistryBackend):
+    """In-memory registry holding the location key, with simulated latency and failures"""
+    def __init__(self, latency: Latency = Latency(0.0005), failure_rate: float = 0.0,
+                 rng: random.Random = None):
+        super().__init__()
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random(0)
+        self.reset()
+
+    def reset(self) -> None:
+        self.keys = {SENSOR_KEY: {SENSOR_VALUE: (1, REG_DWORD)}}
+
+    def _call(self, op: str) -> None:
+        super()._call(op)
+        time.sleep(self.latency.sample(self.rng))
+        if self.rng.random() < self.failure_rate:
+            raise PermissionError(5, 'Access is denied')
+
+
+class FakeNetSyscalls:
+    """Network links for MacRandomizer, laid out like NETWORK_LINKS
+
+    Like most Wi-Fi drivers, a link that does not allow live changes
+    rejects a new address with EBUSY while it is up.
+    """
+    def __init__(self, latency: Latency = Latency(0.002), failure_rate: float = 0.0,
+                 rng: random.Random = None, links: Dict[str, tuple] = None):
+        self.links = links or NETWORK_LINKS
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random(0)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.addresses = {name: link[2] for name, link in self.links.items()}
+        self.flags = {name: IFF_UP for name in self.links}
+
+    def _call(self, op: str) -> None:
+        time.sleep(self.latency.sample(self.rng))
+        with self._lock:
+            self.calls[op] += 1
+            if self.rng.random() < self.failure_rate:
+                raise PermissionError(errno.EPERM, 'Operation not permitted')
+
+    def interfaces(self) -> List[str]:
+        return sorted(self.links)
+
+    def is_ethernet(self, name: str) -> bool:
+        link_type, device, _, _ = self.links[name]
+        return link_type == ARPHRD_ETHER and device
+
+    def get_address(self, name: str) -> str:
+        return self.addresses[name]
+
+    def get_flags(self, name: str) -> int:
+        self._call('get_flags')
+        return self.flags[name]
+
+    def set_flags(self, name: str, flags: int) -> None:
+        self._call('set_flags')
+        self.flags[name] = flags
+
+    def set_address(self, name: str, address: str) -> None:
+        self._call('set_address')
+        if self.flags[name] & IFF_UP and not self.links[name][3]:
+            raise OSError(errno.EBUSY, 'Device or resource busy')
+        self.addresses[name] = address
+
+
+class FakeNft(SubprocessRunner):
+    """Applies `nft -f FILE` transactions to in-memory tables after a simulated delay
+
+    A transaction is checked line by line the way nft checks it: table
+    blocks must be balanced, deleted tables must exist and cgroupv2
+    matches must name an existing group at its real depth under
+    cgroup_root. Any error rejects the whole file and leaves the tables
+    unchanged. Every loaded file is kept in loads.
+    """
+    CGROUP_MATCH = re.compile(r'socket cgroupv2 level (\d+) "([^"]+)"')
+
+    def __init__(self, cgroup_root: str, latency: Latency = Latency(0.01), failure_rate: float = 0.0,
+                 rng: random.Random = None):
+        self.cgroup_root = cgroup_root
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random(0)
+        self.calls = 0
+        self.loads: List[str] = []
+        self.tables: Dict[tuple, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        self.tables = {}
+
+    def run(self, argv, timeout: float = None) -> CommandResult:
+        with span('command', runner='simulated', command='nft'):
+            time.sleep(self.latency.sample(self.rng))
+            with self._lock:
+                self.calls += 1
+                if list(argv[1:2]) != ['-f'] or len(argv) != 3:
+                    return CommandResult(1, '', 'nft: only -f FILE is simulated')
+                with open(argv[2]) as f:
+                    ruleset = f.read()
+                self.loads.append(ruleset)
+                if self.rng.random() < self.failure_rate:
+                    return CommandResult(1, '', 'netlink: Error: Operation not permitted')
+                try:
+                    self.tables = self._apply(ruleset, dict(self.tables))
+                except ValueError as e:
+                    return CommandResult(1, '', f"{argv[2]}:{e}")
+                return CommandResult(0, '')
+
+    def _apply(self, ruleset: str, tables: Dict[tuple, List[str]]) -> Dict[tuple, List[str]]:
+        depth, table = 0, None
+        for number, line in enumerate(ruleset.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if depth:
+                depth += line.count('{') - line.count('}')
+                if depth:
+                    self._check(number, line)
+                    tables[table] = tables[table] + [line]
+                continue
+            words = line.split()
+            if words[:2] == ['delete', 'table'] and len(words) == 4:
+                if tables.pop((words[2], words[3]), None) is None:
+                    raise ValueError(f"{number}: Error: No such file or directory; table {words[3]}")
+            elif words[:1] == ['table'] and len(words) >= 4 and line.endswith(('{', '{}')):
+                table = (words[1], words[2])
+                tables.setdefault(table, [])
+                depth = 0 if line.endswith('{}') else 1
+            else:
+                raise ValueError(f"{number}: Error: syntax error, unexpected {words[0]}")
+        if depth:
+            raise ValueError(f"{number}: Error: syntax error, unexpected end of file")
+        return tables
+
+    def _check(self, number: int, line: str) -> None:
+        match = self.CGROUP_MATCH.search(line)
+        if match is None:
+            return
+        level, path = int(match.group(1)), match.group(2)
+        if not os.path.isdir(os.path.join(self.cgroup_root, path)):
+            raise ValueError(f"{number}: Error: cgroupv2 path fails: No such file or directory")
+        if level != path.strip('/').count('/') + 1:
+            raise ValueError(f"{number}: Error: cgroupv2 level {level} does not match {path}")
+
+
+class FakeNetworkCloak(NetworkCloak):
+    """NetworkCloak over a FakeProcessTable, a cgroup directory tree and FakeNft
+
+    Every synthetic process starts in /user.slice; PIDs missing from the
+    table behave like exited processes.
+    """
+    def __init__(self, table: 'FakeProcessTable', root: str, nft: FakeNft):
+        os.makedirs(os.path.join(root, 'user.slice'), exist_ok=True)
+        open(os.path.join(root, 'cgroup.controllers'), 'a').close()
+        super().__init__(root, runner=nft, tree=table.tree)
+        self.processes = table
+
+    def _current_cgroup(self, pid: int) -> Optional[str]:
+        if self.processes.read(pid) is None:
+            raise ProcessLookupError(pid)
+        return '/user.slice'
+
+
+class FakeSysfs:
+    """Directory tree laid out like /sys, /dev and /proc for DeviceProbe"""
+    def __init__(self, root: str, cameras: int = 2, capture_switches: int = 2):
+        self.sys_root = os.path.join(root, 'sys')
+        self.dev_root = os.path.join(root, 'dev')
+        self.proc_root = os.path.join(root, 'proc')
+        self.cameras = cameras
+        self.capture = [True] * capture_switches
+        self.reset()
+
+    def reset(self) -> None:
+        card = os.path.join(self.proc_root, 'asound', 'card0')
+        for path in (os.path.join(self.sys_root, 'module'), self.dev_root, card):
+            os.makedirs(path, exist_ok=True)
+        for pcm in ('pcm0c', 'pcm0p'):
+            os.makedirs(os.path.join(card, pcm), exist_ok=True)
+        self.load_webcam()
+        self.capture = [True] * len(self.capture)
+
+    def load_webcam(self) -> None:
+        os.makedirs(os.path.join(self.sys_root, 'module', 'uvcvideo'), exist_ok=True)
+        for n in range(self.cameras):
+            open(os.path.join(self.dev_root, f'video{n}'), 'a').close()
+
+    def unload_webcam(self) -> None:
+        shutil.rmtree(os.path.join(self.sys_root, 'module', 'uvcvideo'), ignore_errors=True)
+        for n in range(self.cameras):
+            try:
+                os.unlink(os.path.join(self.dev_root, f'video{n}'))
+            except FileNotFoundError:
+                pass
+
+    def amixer(self) -> str:
+        lines = ["Simple mixer control 'Capture',0", "  Capabilities: cvolume cswitch"]
+        for channel, on in zip(('Front Left', 'Front Right'), self.capture):
+            lines.append(f"  {channel}: Capture 63 [100%] [30.00dB] [{'on' if on else 'off'}]")
+        return '\n'.join(lines) + '\n'
+
+
+class FakeCommandRunner(SubprocessRunner):
+    """Answers device commands from simulated state after a simulated delay
+
+    Linux commands act on a FakeSysfs; Windows PnP and service commands
+    act on in-memory camera and microphone flags. latencies overrides the
+    default latency per program, e.g. {'modprobe': Latency(0.05)}.
+    """
+    def __init__(self, sysfs: FakeSysfs, latency: Latency = Latency(0.005), failure_rate: float = 0.0,
+                 latencies: Dict[str, Latency] = None, rng: random.Random = None):
+        self.sysfs = sysfs
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random(0)
+        self.calls = Counter()
+        self.windows = {'camera': True, 'microphone': True}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        self.windows = {'camera': True, 'microphone': True}
+
+    def run(self, argv, timeout: float = None) -> CommandResult:
+        name = command_name(argv)
+        with span('command', runner='simulated', command=name):
+            time.sleep(self.latencies.get(name, self.latency).sample(self.rng))
+            with self._lock:
+                self.calls[name] += 1
+                if self.rng.random() < self.failure_rate:
+                    return CommandResult(1, '', f"{name}: simulated failure")
+                return self._apply(name, list(argv))
+
+    def _apply(self, name: str, argv: List[str]) -> CommandResult:
+        if name == 'modprobe':
+            if '-r' in argv:
+                self.sysfs.unload_webcam()
+            else:
+                self.sysfs.load_webcam()
+        elif name == 'amixer':
+            if 'set' in argv:
+                on = argv[-1] == 'cap'
+                self.sysfs.capture = [on] * len(self.sysfs.capture)
+            return CommandResult(0, self.sysfs.amixer())
+        elif name == 'powershell':
+            script = argv[-1]
+            device = 'camera' if 'Camera' in script else 'microphone'
+            if 'Disable-PnpDevice' in script:
+                self.windows[device] = False
+            elif '.Count' in script:
+                return CommandResult(0, '1\n' if self.windows[device] else '0\n')
+        elif name == 'net':
+            device = 'camera' if argv[-1] == 'usbvideo' else 'microphone'
+            self.windows[device] = argv[-2] == 'start'
+        return CommandResult(0, '')
+
+
+class SimulatedOS:
+    """A process table, registry, sysfs tree, network links, nftables and command runner, wired together
+
+    hardware(), process_manager() and location_service() build the real
+    services on top of the simulated pieces; controller() builds a one-shot
+    GhostModeController using all three.
+    """
+    def __init__(self, processes: int = 10000, os_type: str = 'Linux',
+                 command_latency: Latency = Latency(0.005), registry_latency: Latency = Latency(0.0005),
+                 net_latency: Latency = Latency(0.002),
+                 terminate_latency: Latency = Latency(0.02), restore_latency: Latency = Latency(0.03),
+                 failure_rate: float = 0.0, seed: int = 0, root: str = None):
+        self.os_type = os_type
+        self.root = root or tempfile.mkdtemp(prefix='ghost-sim-')
+        self.rng = random.Random(seed)
+        self.table = FakeProcessTable(processes, os_type, random.Random(seed))
+        self.sysfs = FakeSysfs(self.root)
+        self.runner = FakeCommandRunner(self.sysfs, command_latency, failure_rate, rng=self.rng)
+        self.registry = FakeRegistry(registry_latency, failure_rate, self.rng)
+        self.net = FakeNetSyscalls(net_latency, failure_rate, self.rng)
+        self.cgroup_root = os.path.join(self.root, 'cgroup')
+        self.nft = FakeNft(self.cgroup_root, failure_rate=failure_rate, rng=self.rng)
+        self.terminator = FakeTerminator(self.table, terminate_latency, failure_rate, self.rng)
+        self.restorer = FakeRestorer(self.table, restore_latency, failure_rate, self.rng)
+        self._probes = []
+        self._registries = []
+
+    def reset(self) -> None:
+        """Bring every simulated device, key and process back to its initial state"""
+        self.table.reset()
+        self.sysfs.reset()
+        self.runner.reset()
+        self.registry.reset()
+        self.net.reset()
+        self.nft.reset()
+        for registry in self._registries:
+            registry.invalidate()
+
+    def hardware(self):
+        from device_probe import DeviceProbe
+        from hardware_control import HardwareController
+        probe = DeviceProbe(self.sysfs.sys_root, self.sysfs.dev_root, self.sysfs.proc_root,
+                            runner=self.runner, use_uevents=False)
+        self._probes.append(probe)
+        hardware = HardwareController(self.runner, probe, MacRandomizer(self.net, rng=self.rng))
+        hardware.os_type = self.os_type
+        return hardware
+
+    def process_manager(self):
+        from process_manager import ProcessManager
+        return ProcessManager(self.table.target_rules, scanner=self.table, terminator=self.terminator,
+                              restorer=self.restorer, inspector=self.table.inspect,
+                              cloak=FakeNetworkCloak(self.table, self.cgroup_root, self.nft))
+
+    def location_service(self):
+        from location_service import LocationService
+        registry = Registry(self.registry)
+        self._registries.append(registry)
+        location = LocationService(registry)
+        location.os_type = self.os_type
+        return location
+
+    def write_config(self) -> str:
+        path = os.path.join(self.root, 'target_processes.txt')
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.table.target_rules) + '\n')
+        return path
+
+    def controller(self, **options):
+        """A GhostModeController whose services all run against this simulation"""
+        from controller import GhostModeController
+        options.setdefault('state_path', os.path.join(self.root, 'state.json'))
+        options.setdefault('audit_path', os.path.join(self.root, 'audit.log'))
+        options.setdefault('enforce', False)
+        controller = GhostModeController(self.write_config(), **options)
+        controller.hardware = self.hardware()
+        process_manager = self.process_manager()
+        process_manager.load_target_processes(controller.config_path)
+        controller.process_manager = process_manager
+        controller.location_service = self.location_service()
+        return controller
+
+    def close(self) -> None:
+        for probe in self._probes:
+            probe.close()
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,173 @@
+"""
+Filesystem change detection for Ghost Mode
+Polls inotify without blocking, falling back to directory mtimes
+"""
+import ctypes
+import errno
+import logging
+import os
+import struct
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+DIR_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+
+_EVENT = struct.Struct('iIII')
+
+
+class WatchEvent(NamedTuple):
+    """One inotify event; path is the watched directory"""
+    path: str
+    mask: int
+    name: str
+
+
+class Inotify:
+    """Non-blocking inotify instance driven through libc"""
+    _libc = None
+
+    @classmethod
+    def _lib(cls):
+        if cls._libc is None:
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            cls._libc = libc
+        return cls._libc
+
+    @classmethod
+    def available(cls) -> bool:
+        # CDLL(None) is Unix-only; on Windows it raises TypeError
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            return hasattr(cls._lib(), 'inotify_init1')
+        except (OSError, TypeError):
+            return False
+
+    def __init__(self):
+        self.fd = self._lib().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.paths: Dict[int, str] = {}
+
+    def add_watch(self, path: str, mask: int = DIR_EVENTS | FILE_EVENTS) -> int:
+        wd = self._lib().inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self.paths[wd] = path
+        return wd
+
+    def read_events(self) -> List[WatchEvent]:
+        """Drain every queued event without blocking"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += length
+                events.append(WatchEvent(self.paths.get(wd, ''), mask, name))
+                if mask & IN_IGNORED:
+                    self.paths.pop(wd, None)
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class MtimeWatch:
+    """Detects changes by comparing directory and file stat signatures"""
+    def __init__(self, paths: Iterable[str]):
+        self.paths = list(paths)
+        self._last = self._signature()
+
+    def _signature(self) -> Tuple[Optional[Tuple[int, int, int]], ...]:
+        signature = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def changed(self) -> bool:
+        current = self._signature()
+        changed, self._last = current != self._last, current
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class ChangeWatcher:
+    """Answers "has anything under these paths changed since last asked?"
+
+    Uses inotify when the kernel offers it and mtime signatures otherwise.
+    Paths that cannot be watched (for example missing ones) are polled by
+    mtime alongside the inotify watches. sysfs and procfs accept watches
+    but never report changes, so callers pair them with kernel uevents.
+    """
+    def __init__(self, paths: Iterable[str], mask: int = DIR_EVENTS | FILE_EVENTS,
+                 use_inotify: bool = True):
+        self.paths = list(paths)
+        self.logger = logging.getLogger(__name__)
+        self.inotify: Optional[Inotify] = None
+        unwatched = self.paths
+        if use_inotify and Inotify.available():
+            try:
+                self.inotify = Inotify()
+                unwatched = []
+                for path in self.paths:
+                    try:
+                        self.inotify.add_watch(path, mask)
+                    except OSError as e:
+                        if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                            self.logger.warning(f"Cannot watch {path}: {e}")
+                        unwatched.append(path)
+            except OSError as e:
+                self.logger.warning(f"inotify unavailable ({e}); polling mtimes")
+                self.inotify = None
+                unwatched = self.paths
+        self.mtime = MtimeWatch(unwatched)
+        self.last_events: List[WatchEvent] = []
+
+    def changed(self) -> bool:
+        """True if any watched path changed since the previous call"""
+        changed = self.mtime.changed()
+        if self.inotify is not None:
+            self.last_events = self.inotify.read_events()
+            changed = changed or bool(self.last_events)
+        return changed
+
+    def close(self) -> None:
+        if self.inotify is not None:
+            self.inotify.close()
+        self.mtime.close()
@@ -0,0 +1,278 @@
+"""
+Ghost Mode command line
+Headless entry point for scripts and hooks; never imports Qt, and only
+imports the services a command needs.
+
+Usage:
+    python ghostmode.py activate|deactivate|status [--json] [--local] [--use-profile NAME]
+                        [--metrics FILE] [--profile DIR]
+    python ghostmode.py profiles [--json]
+    python ghostmode.py daemon [--socket PATH] [--arm] [--triggers] [--metrics-file FILE] [--metrics-port N]
+    python ghostmode.py metrics [--json]
+    python ghostmode.py audit query [--since 7d] [--process zoom.exe] ...
+"""
+import argparse
+import json
+import logging
+import sys
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='ghostmode', description='Ghost Mode command line')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('activate', 'apply every protection not already in effect'),
+                            ('deactivate', 'restore hardware, processes and location'),
+                            ('status', 'show which protections are in effect')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--config', default='config/target_processes.txt', help='target process list')
+        command.add_argument('--state', default='ghost_mode_state.json', help='state journal')
+        command.add_argument('--audit', default='ghost_mode_audit.log', help='audit log')
+        command.add_argument('--json', action='store_true', help='print JSON')
+        command.add_argument('--socket', help='daemon socket (default: per-user runtime dir)')
+        command.add_argument('--local', action='store_true',
+                             help='run in this process even if a daemon is listening')
+        command.add_argument('--metrics', metavar='FILE',
+                             help='trace service calls and write Prometheus metrics to FILE (implies --local)')
+        command.add_argument('--profile', metavar='DIR',
+                             help='write cProfile and tracemalloc captures to DIR (implies --local)')
+        command.add_argument('--use-profile', metavar='NAME',
+                             help='switch to the named profile from config/profiles.ini first')
+
+    profiles = commands.add_parser('profiles', help='list the profiles in config/profiles.ini')
+    profiles.add_argument('--config', default='config/target_processes.txt', help='target process list')
+    profiles.add_argument('--state', default='ghost_mode_state.json', help='state journal')
+    profiles.add_argument('--json', action='store_true', help='print JSON')
+
+    daemon = commands.add_parser('daemon', help='own the services and serve clients over a Unix socket')
+    daemon.add_argument('--config', default='config/target_processes.txt', help='target process list')
+    daemon.add_argument('--state', default='ghost_mode_state.json', help='state journal')
+    daemon.add_argument('--audit', default='ghost_mode_audit.log', help='audit log')
+    daemon.add_argument('--socket', help='socket path (default: per-user runtime dir)')
+    daemon.add_argument('--arm', action='store_true',
+                        help='keep a panic kill plan ready so activation only executes it')
+    daemon.add_argument('--triggers', action='store_true',
+                        help='activate and deactivate automatically by the rules in config/triggers.ini')
+    daemon.add_argument('--metrics-file', metavar='FILE',
+                        help='trace service calls and rewrite FILE in the Prometheus text format after each toggle')
+    daemon.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='trace service calls and serve them at http://127.0.0.1:PORT/metrics')
+
+    metrics = commands.add_parser('metrics', help="print the daemon's span metrics")
+    metrics.add_argument('--socket', help='daemon socket (default: per-user runtime dir)')
+    metrics.add_argument('--json', action='store_true', help='print per-span summaries as JSON')
+
+    audit = commands.add_parser('audit', help='inspect the audit trail')
+    audit_commands = audit.add_subparsers(dest='audit_command', required=True)
+    query = audit_commands.add_parser('query', help='search audit records')
+    query.add_argument('--log', default='ghost_mode_audit.log', help='audit log to query')
+    query.add_argument('--since', help='ISO date/time or age such as 7d, 12h')
+    query.add_argument('--until', help='ISO date/time or age such as 1d')
+    query.add_argument('--process', help='process name that was matched or terminated')
+    query.add_argument('--failed', help='stage or flag that failed (webcam, hardware, location, ...)')
+    query.add_argument('--event', choices=['activation', 'deactivation'])
+    query.add_argument('--last', action='store_true', help='only the most recent match')
+    query.add_argument('--limit', type=int)
+    query.add_argument('--count', action='store_true', help='print the number of matches')
+    query.add_argument('--archives', action='store_true', help='also scan rotated .gz archives')
+    query.add_argument('--json', action='store_true', help='print raw JSON records')
+    return parser
+
+
+def print_summary(summary: dict, as_json: bool) -> None:
+    if as_json:
+        print(json.dumps(summary))
+        return
+    if summary.get('superseded'):
+        print(f"{summary['kind']} superseded by a newer request")
+        return
+    if summary.get('error'):
+        print(f"{summary['kind']} failed: {summary['error']}")
+        return
+    for record in summary['stages']:
+        if record.get('skipped'):
+            state = 'already in effect'
+        else:
+            state = f"{'ok' if record['ok'] else 'FAILED'} in {record['elapsed']:.2f}s"
+            if record.get('error'):
+                state += f" ({record['error']})"
+        print(f"{record['name']:>12}: {state}")
+    saved = f", ~{summary['estimated_saved']:.1f}s saved" if summary['skipped'] else ''
+    print(f"{summary['kind']} {'succeeded' if summary['ok'] else 'failed'} in {summary['elapsed']:.2f}s{saved}")
+
+
+def print_report(report, as_json: bool) -> None:
+    print_summary(report.to_dict(), as_json)
+
+
+def print_status(status: dict, as_json: bool) -> int:
+    if as_json:
+        print(json.dumps(status))
+    else:
+        for name, value in status['protections'].items():
+            state = 'unknown' if value is None else ('on' if value else 'off')
+            print(f"{name:>12}: {state} ({status['sources'][name]})")
+        if status.get('profile'):
+            print(f"{'profile':>12}: {status['profile']}")
+        if status['pending_restore']:
+            print(f"{'restore':>12}: {', '.join(status['pending_restore'])}")
+        if status.get('cloaked'):
+            print(f"{'cloaked':>12}: {status['cloaked']} processes")
+        if status.get('running'):
+            print(f"{'running':>12}: {status['running']}")
+        panic = status.get('panic')
+        if panic:
+            objective = panic['objective']
+            met = {True: 'met', False: 'MISSED', None: 'no samples'}[objective['met']]
+            print(f"{'panic':>12}: {'armed' if panic['armed'] else 'disarmed'}, "
+                  f"{panic['planned']} planned, p99 {panic['latency']['p99_ms']:.0f} ms "
+                  f"(objective {objective['threshold_ms']:.0f} ms: {met})")
+        triggers = status.get('triggers')
+        if triggers:
+            print(f"{'triggers':>12}: {triggers['rules']} rules on {', '.join(triggers['sources']) or 'the clock'}, "
+                  f"{triggers['fired']} fired, {triggers['actions']} actions, "
+                  f"p99 {triggers['latency']['p99_ms']:.0f} ms")
+    return 0 if status['active'] else 3
+
+
+def run_client_command(args):
+    """Forward the command to a running daemon; None if there is none to ask"""
+    import socket
+    # Tracing and profiling measure this process, so they always run locally
+    if args.local or args.metrics or args.profile or not hasattr(socket, 'AF_UNIX'):
+        return None
+    from daemon import DaemonClient
+    client = DaemonClient(args.socket)
+    if not client.alive():
+        return None
+    fields = {'profile': args.use_profile} if args.use_profile and args.command != 'status' else {}
+    try:
+        result = client.request(args.command, **fields)
+    except RuntimeError as e:
+        print(f"{args.command} failed: {e}", file=sys.stderr)
+        return 2
+    if args.command == 'status':
+        return print_status(result, args.json)
+    print_summary(result, args.json)
+    return 0 if result.get('ok') or result.get('superseded') else 1
+
+
+def run_profiles_command(args) -> int:
+    from controller import GhostModeController
+    controller = GhostModeController(args.config, args.state, enforce=False)
+    try:
+        selected = controller.profile.name
+        profiles = [dict(p._asdict(), selected=p.name == selected)
+                    for p in controller.profiles.profiles.values()]
+    finally:
+        controller.close()
+    if args.json:
+        print(json.dumps(profiles))
+        return 0
+    for profile in profiles:
+        mark = '*' if profile['selected'] else ' '
+        print(f"{mark} {profile['name']:<12} {len(profile['targets']):>4} targets  "
+              f"{' '.join(profile['protections'])}")
+    return 0
+
+
+def run_metrics_command(args) -> int:
+    from daemon import DaemonClient
+    client = DaemonClient(args.socket)
+    if not client.alive():
+        print("No Ghost Mode daemon is listening", file=sys.stderr)
+        return 1
+    result = client.request('metrics')
+    if not result['enabled']:
+        print("Tracing is off; start the daemon with --metrics-file or --metrics-port", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(result['spans']))
+    else:
+        sys.stdout.write(result['text'])
+    return 0
+
+
+def run_daemon_command(args) -> int:
+    from command_executor import CommandExecutor
+    from controller import GhostModeController
+    from daemon import run_daemon
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    server = None
+    if args.metrics_file or args.metrics_port:
+        import tracing
+        tracing.enable()
+        if args.metrics_port:
+            server = tracing.MetricsServer(port=args.metrics_port)
+    # The daemon outlives each request, so warm shells and enforcement pay off
+    executor = CommandExecutor()
+    executor.warm()
+    controller = GhostModeController(args.config, args.state, args.audit, runner=executor,
+                                     metrics_path=args.metrics_file)
+    if args.arm:
+        controller.panic.arm()
+    try:
+        run_daemon(controller, args.socket, controller.triggers if args.triggers else None)
+    finally:
+        executor.close()
+        if server is not None:
+            server.close()
+    return 0
+
+
+def run_service_command(args) -> int:
+    from contextlib import nullcontext
+    import tracing
+    from controller import GhostModeController
+    if args.metrics or args.profile:
+        tracing.enable()
+    # A one-shot process cannot keep an enforcement watcher alive
+    controller = GhostModeController(args.config, args.state, args.audit, enforce=False,
+                                     metrics_path=args.metrics)
+    if args.use_profile:
+        try:
+            controller.select_profile(args.use_profile)
+        except KeyError as e:
+            print(e.args[0], file=sys.stderr)
+            controller.close()
+            return 2
+    session = tracing.ProfileSession(args.profile, args.command) if args.profile else nullcontext()
+    try:
+        with session:
+            if args.command == 'status':
+                status = controller.status()
+            elif args.command == 'activate':
+                report = controller.activate()
+            else:
+                report = controller.deactivate()
+        if args.profile:
+            for kind, path in session.paths.items():
+                print(f"{kind} profile: {path}", file=sys.stderr)
+        if args.command == 'status':
+            controller.export_metrics()
+            return print_status(status, args.json)
+        print_report(report, args.json)
+        return 0 if report.ok else 1
+    finally:
+        controller.close()
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'audit' and args.audit_command == 'query':
+        from audit_query import run_query
+        return run_query(args)
+    if args.command == 'daemon':
+        return run_daemon_command(args)
+    if args.command == 'metrics':
+        return run_metrics_command(args)
+    if args.command == 'profiles':
+        return run_profiles_command(args)
+    code = run_client_command(args)
+    if code is not None:
+        return code
+    return run_service_command(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
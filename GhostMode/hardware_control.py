@@ -4,15 +4,27 @@ Handles webcam, microphone, and other device controls
 """
 import logging
 import platform
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
+from command_executor import SubprocessRunner
+from device_probe import DeviceProbe
+from mac_address import MacRandomizer
 
 class HardwareController:
     """Controls hardware devices for privacy"""
-    def __init__(self):
+    def __init__(self, runner=None, probe=None, mac=None):
         self.os_type = platform.system()
         self.logger = logging.getLogger(__name__)
         self.devices_disabled = False
+        # SubprocessRunner or a CommandExecutor pool of warm shell sessions
+        self.runner = runner or SubprocessRunner()
+        self.probe = probe or DeviceProbe(runner=self.runner)
+        self.mac = mac or MacRandomizer()
+    
+    def _run_chains(self, *chains: List[List[str]]) -> list:
+        """Run independent command chains in parallel; each chain runs in order"""
+        with ThreadPoolExecutor(max_workers=len(chains)) as pool:
+            return list(pool.map(lambda chain: [self.runner.run(cmd) for cmd in chain], chains))
     
     def disable_webcam(self) -> bool:
         """Disable webcam hardware"""
@@ -23,7 +35,7 @@ class HardwareController:
                     'powershell', '-Command',
                     'Get-PnpDevice -Class Camera | Disable-PnpDevice -Confirm:$false'
                 ]
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                result = self.runner.run(cmd)
                 success = (result.returncode == 0)
                 if not success:
                     # Fallback: disable usbvideo driver service
@@ -31,17 +43,15 @@ class HardwareController:
                         'reg', 'add', r'HKLM\SYSTEM\CurrentControlSet\Services\usbvideo',
                         '/v', 'Start', '/t', 'REG_DWORD', '/d', '4', '/f'
                     ]
-                    subprocess.run(reg_cmd, capture_output=True, text=True)
-                    subprocess.run(['net', 'stop', 'usbvideo'], capture_output=True, text=True)
+                    self.runner.run(reg_cmd)
+                    self.runner.run(['net', 'stop', 'usbvideo'])
                     success = True
                 self.logger.info(f"Webcam disable success: {success}")
                 return success
             else:
                 # Linux: Unload webcam kernel module
-                result = subprocess.run(
-                    ['sudo', 'modprobe', '-r', 'uvcvideo'],
-                    capture_output=True, text=True
-                )
+                result = self.runner.run(['sudo', 'modprobe', '-r', 'uvcvideo'])
+                self.probe.invalidate()
                 self.logger.info(f"Webcam disable result: {result.stdout}")
                 return result.returncode == 0
         except Exception as e:
@@ -57,46 +67,52 @@ class HardwareController:
                     'powershell', '-Command',
                     'Get-PnpDevice -Class AudioEndpoint | Where-Object {$_.FriendlyName -like "*Microphone*"} | Disable-PnpDevice -Confirm:$false'
                 ]
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                result = self.runner.run(cmd)
                 success = (result.returncode == 0)
                 if not success:
                     # Fallback: stop audio services
-                    subprocess.run(['net', 'stop', 'AudioEndpointBuilder'], capture_output=True, text=True)
-                    subprocess.run(['net', 'stop', 'Audiosrv'], capture_output=True, text=True)
+                    self.runner.run(['net', 'stop', 'AudioEndpointBuilder'])
+                    self.runner.run(['net', 'stop', 'Audiosrv'])
                     success = True
                 self.logger.info(f"Microphone disable success: {success}")
                 return success
             else:
                 # Linux: Mute using ALSA
-                result = subprocess.run(
-                    ['amixer', 'set', 'Capture', 'nocap'],
-                    capture_output=True, text=True
-                )
+                result = self.runner.run(['amixer', 'set', 'Capture', 'nocap'])
+                # Mixer changes raise no events, so drop the cached switch state
+                self.probe.invalidate()
                 self.logger.info(f"Microphone disable result: {result.stdout}")
                 return result.returncode == 0
         except Exception as e:
             self.logger.error(f"Error disabling microphone: {e}")
             return False
     
-    def randomize_mac_address(self, interface: str = 'wlan0') -> bool:
-        """Randomize MAC address (Linux only)"""
+    def randomize_mac_address(self, interface: str = None) -> bool:
+        """Randomize MAC address of one interface, or of every physical one (Linux only)"""
         if self.os_type != 'Linux':
             self.logger.warning("MAC randomization only supported on Linux")
             return False
             
         try:
-            # Disable interface
-            subprocess.run(['sudo', 'ifconfig', interface, 'down'], check=True)
-            # Randomize MAC
-            subprocess.run(['sudo', 'macchanger', '-r', interface], check=True)
-            # Enable interface
-            subprocess.run(['sudo', 'ifconfig', interface, 'up'], check=True)
-            self.logger.info(f"Randomized MAC address for {interface}")
-            return True
+            results = self.mac.randomize([interface] if interface else None)
+            if not results:
+                self.logger.warning("No network interface to randomize")
+                return False
+            return all(results.values())
         except Exception as e:
             self.logger.error(f"Error randomizing MAC: {e}")
             return False
     
+    def restore_mac_address(self) -> bool:
+        """Restore the MAC addresses changed by randomize_mac_address"""
+        if self.os_type != 'Linux':
+            return True
+        try:
+            return all(self.mac.restore().values())
+        except Exception as e:
+            self.logger.error(f"Error restoring MAC: {e}")
+            return False
+    
     def activate_protections(self) -> bool:
         """Enable all hardware protections"""
         success = True
@@ -116,20 +132,41 @@ class HardwareController:
                 'reg', 'add', r'HKLM\SYSTEM\CurrentControlSet\Services\usbvideo',
                 '/v', 'Start', '/t', 'REG_DWORD', '/d', '3', '/f'
             ]
-            subprocess.run(reg_cmd, capture_output=True, text=True)
-            subprocess.run(['net', 'start', 'usbvideo'], capture_output=True, text=True)
-            # Restart audio services
-            subprocess.run(['net', 'start', 'AudioEndpointBuilder'], capture_output=True, text=True)
-            subprocess.run(['net', 'start', 'Audiosrv'], capture_output=True, text=True)
+            # The webcam chain and the audio chain are independent of each other
+            self._run_chains(
+                [reg_cmd, ['net', 'start', 'usbvideo']],
+                # Restart audio services
+                [['net', 'start', 'AudioEndpointBuilder'], ['net', 'start', 'Audiosrv']]
+            )
         self.devices_disabled = False
+        self.probe.invalidate()
         return success
     
+    def _windows_devices_off(self, pnp_filter: str) -> bool:
+        """True if no matching PnP device is present and working"""
+        cmd = [
+            'powershell', '-Command',
+            f'@(Get-PnpDevice {pnp_filter} -PresentOnly -Status OK -ErrorAction SilentlyContinue).Count'
+        ]
+        result = self.runner.run(cmd)
+        return result.returncode == 0 and result.stdout.strip() == '0'
+    
     def check_webcam_status(self) -> bool:
         """Check if webcam is disabled"""
-        # TODO: Implement proper status check
-        return False
+        try:
+            if self.os_type == 'Windows':
+                return self._windows_devices_off('-Class Camera')
+            return self.probe.webcam_state().disabled
+        except Exception as e:
+            self.logger.error(f"Webcam status check failed: {e}")
+            return False
     
     def check_microphone_status(self) -> bool:
         """Check if microphone is disabled"""
-        # TODO: Implement proper status check
-        return False
+        try:
+            if self.os_type == 'Windows':
+                return self._windows_devices_off('-Class AudioEndpoint -FriendlyName "*Microphone*"')
+            return self.probe.microphone_state().disabled
+        except Exception as e:
+            self.logger.error(f"Microphone status check failed: {e}")
+            return False
@@ -5,14 +5,42 @@ Handles GPS spoofing on Windows
 import logging
 import platform
 import random
-import winreg
+
+from registry import Registry
+
+SENSOR_KEY = "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\Sensor\\Overrides\\{BFA794E4-F964-4FDB-90F6-51056BFE4B44}"
+SENSOR_VALUE = "SensorPermissionState"
 
 class LocationService:
-    """Manages location spoofing functionality"""
-    def __init__(self):
+    """Manages location spoofing functionality
+
+    Registry access goes through a caching Registry; pass one built on
+    MemoryRegistryBackend to run without winreg.
+    """
+    def __init__(self, registry: Registry = None):
         self.os_type = platform.system()
         self.logger = logging.getLogger(__name__)
         self.original_location = None
+        self.registry = registry or Registry()
+    
+    def prepare(self) -> bool:
+        """Open the sensor override key ahead of time so spoofing only writes a value"""
+        if self.os_type != 'Windows':
+            return False
+        try:
+            self.registry.open(SENSOR_KEY)
+            return True
+        except Exception as e:
+            self.logger.warning(f"Could not pre-open location key: {e}")
+            return False
+    
+    def release(self) -> None:
+        """Close the key handles kept open since prepare() or first use"""
+        self.registry.close()
+    
+    def transaction(self):
+        """Batch the registry writes of one activation or deactivation"""
+        return self.registry.transaction()
     
     def spoof_location(self, lat=None, long=None) -> bool:
         """Spoof GPS location on Windows"""
@@ -31,13 +59,7 @@ class LocationService:
             self.original_location = self.get_current_location()
             
             # Windows location is stored in registry
-            key = winreg.OpenKey(
-                winreg.HKEY_LOCAL_MACHINE,
-                "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\Sensor\\Overrides\\{BFA794E4-F964-4FDB-90F6-51056BFE4B44}",
-                0, winreg.KEY_WRITE)
-                
-            winreg.SetValueEx(key, "SensorPermissionState", 0, winreg.REG_DWORD, 0)
-            winreg.CloseKey(key)
+            self.registry.set(SENSOR_KEY, SENSOR_VALUE, 0)
             
             # Additional spoofing would require more complex implementation
             self.logger.info(f"Location spoofed to: {lat}, {long}")
@@ -54,13 +76,7 @@ class LocationService:
             
         try:
             if self.os_type == 'Windows':
-                key = winreg.OpenKey(
-                    winreg.HKEY_LOCAL_MACHINE,
-                    "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\Sensor\\Overrides\\{BFA794E4-F964-4FDB-90F6-51056BFE4B44}",
-                    0, winreg.KEY_WRITE)
-                    
-                winreg.SetValueEx(key, "SensorPermissionState", 0, winreg.REG_DWORD, 1)
-                winreg.CloseKey(key)
+                self.registry.set(SENSOR_KEY, SENSOR_VALUE, 1)
                 
                 self.logger.info("Restored original location settings")
                 return True
@@ -75,14 +91,7 @@ class LocationService:
         # just checks if location services are enabled
         try:
             if self.os_type == 'Windows':
-                key = winreg.OpenKey(
-                    winreg.HKEY_LOCAL_MACHINE,
-                    "SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\Sensor\\Overrides\\{BFA794E4-F964-4FDB-90F6-51056BFE4B44}",
-                    0, winreg.KEY_READ)
-                    
-                val, _ = winreg.QueryValueEx(key, "SensorPermissionState")
-                winreg.CloseKey(key)
-                return (val,)
+                return (self.registry.get(SENSOR_KEY, SENSOR_VALUE),)
             
             return (None,)
         except Exception:
@@ -0,0 +1,187 @@
+"""
+MAC address randomization for Ghost Mode
+Lists interfaces from /sys/class/net, sets addresses with ioctl calls and
+remembers the original addresses so they can be put back
+"""
+import errno
+import logging
+import os
+import random
+import socket
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from tracing import span
+
+ARPHRD_ETHER = 1
+SIOCGIFFLAGS = 0x8913
+SIOCSIFFLAGS = 0x8914
+SIOCSIFHWADDR = 0x8924
+IFF_UP = 0x1
+# Longest prefix that still leaves one octet random
+MAX_PREFIX_OCTETS = 5
+
+
+def parse_mac(text: str) -> bytes:
+    return bytes(int(part, 16) for part in text.split(':'))
+
+
+def parse_prefix(text: str) -> bytes:
+    """Parse an address prefix of 1 to MAX_PREFIX_OCTETS octets; raises ValueError otherwise
+
+    At least one octet must stay random, or every link would get the same
+    address and one already using it could never be given another.
+    """
+    prefix = parse_mac(text)
+    if not 1 <= len(prefix) <= MAX_PREFIX_OCTETS:
+        raise ValueError(f"MAC prefix {text!r} must have 1 to {MAX_PREFIX_OCTETS} octets")
+    return prefix
+
+
+def format_mac(raw: bytes) -> str:
+    return ':'.join(f'{b:02x}' for b in raw)
+
+
+def random_mac(rng: random.Random, prefix: bytes = b'') -> str:
+    """A random unicast address with the locally administered bit set
+
+    prefix fixes the leading octets, e.g. a private OUI; its first octet
+    is still forced to a locally administered unicast value, so a
+    generated address never collides with a vendor-assigned one.
+    """
+    prefix = prefix[:MAX_PREFIX_OCTETS]
+    raw = bytearray(prefix + bytes(rng.getrandbits(8) for _ in range(6 - len(prefix))))
+    raw[0] = (raw[0] & 0xFC) | 0x02
+    return format_mac(bytes(raw))
+
+
+class NetSyscalls:
+    """The kernel calls MacRandomizer needs: sysfs reads and interface ioctls
+
+    Replace with a fake (see fake_os.FakeNetSyscalls) to run without root.
+    """
+    def __init__(self, root: str = '/sys/class/net'):
+        self.root = root
+
+    def _read(self, name: str, attr: str) -> str:
+        with open(os.path.join(self.root, name, attr)) as f:
+            return f.read().strip()
+
+    def interfaces(self) -> List[str]:
+        return sorted(os.listdir(self.root))
+
+    def is_ethernet(self, name: str) -> bool:
+        """An Ethernet-type link (wired or Wi-Fi) on real hardware, not lo, bridges or veths"""
+        try:
+            return (int(self._read(name, 'type')) == ARPHRD_ETHER
+                    and os.path.exists(os.path.join(self.root, name, 'device')))
+        except (OSError, ValueError):
+            return False
+
+    def get_address(self, name: str) -> str:
+        return self._read(name, 'address')
+
+    def _ioctl(self, request: int, ifreq: bytes) -> bytes:
+        # fcntl only exists on Unix
+        import fcntl
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            return fcntl.ioctl(sock.fileno(), request, ifreq)
+
+    def get_flags(self, name: str) -> int:
+        result = self._ioctl(SIOCGIFFLAGS, struct.pack('16sH22x', name.encode(), 0))
+        return struct.unpack_from('H', result, 16)[0]
+
+    def set_flags(self, name: str, flags: int) -> None:
+        self._ioctl(SIOCSIFFLAGS, struct.pack('16sH22x', name.encode(), flags))
+
+    def set_address(self, name: str, address: str) -> None:
+        """Set the hardware address; raises EBUSY if the driver needs the link down"""
+        self._ioctl(SIOCSIFHWADDR, struct.pack('16sH6s16x', name.encode(), ARPHRD_ETHER, parse_mac(address)))
+
+
+class MacRandomizer:
+    """Randomizes and restores the MAC addresses of several interfaces at once
+
+    Each interface is handled on its own worker: its address is set while
+    the link stays up where the driver allows it, otherwise the link is
+    taken down around the change. The first address seen for an interface
+    is kept until it is restored, so repeated activations do not lose it.
+    """
+    def __init__(self, syscalls: NetSyscalls = None, prefix: str = '', rng: random.Random = None,
+                 names: Iterable[str] = ()):
+        self.syscalls = syscalls or NetSyscalls()
+        self.configure(names, prefix)
+        self.rng = rng or random.SystemRandom()
+        self.originals: Dict[str, str] = {}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def configure(self, names: Iterable[str] = (), prefix: str = '') -> None:
+        """Limit randomize() to names (empty: every physical link) and set the address prefix"""
+        self.names = frozenset(names)
+        self.prefix = parse_prefix(prefix) if prefix else b''
+
+    def interfaces(self) -> List[str]:
+        return [name for name in self.syscalls.interfaces()
+                if self.syscalls.is_ethernet(name) and (not self.names or name in self.names)]
+
+    def _set(self, name: str, address: str) -> None:
+        try:
+            self.syscalls.set_address(name, address)
+            return
+        except OSError as e:
+            if e.errno != errno.EBUSY:
+                raise
+        flags = self.syscalls.get_flags(name)
+        self.syscalls.set_flags(name, flags & ~IFF_UP)
+        try:
+            self.syscalls.set_address(name, address)
+        finally:
+            self.syscalls.set_flags(name, flags)
+
+    def _randomize(self, name: str) -> bool:
+        try:
+            with span('mac', op='randomize'):
+                current = self.syscalls.get_address(name)
+                address = random_mac(self.rng, self.prefix)
+                while address == current:
+                    address = random_mac(self.rng, self.prefix)
+                self._set(name, address)
+            with self._lock:
+                self.originals.setdefault(name, current)
+            self.logger.info(f"Randomized MAC address for {name}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error randomizing MAC of {name}: {e}")
+            return False
+
+    def _restore(self, name: str, address: str) -> bool:
+        try:
+            with span('mac', op='restore'):
+                self._set(name, address)
+            with self._lock:
+                self.originals.pop(name, None)
+            self.logger.info(f"Restored MAC address of {name}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error restoring MAC of {name}: {e}")
+            return False
+
+    def _map(self, func, items: list) -> List[bool]:
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=len(items)) as pool:
+            return list(pool.map(lambda args: func(*args), items))
+
+    def randomize(self, names: Iterable[str] = None) -> Dict[str, bool]:
+        """Give each interface (default: every physical Ethernet-type one) a new address"""
+        names = list(names) if names is not None else self.interfaces()
+        return dict(zip(names, self._map(self._randomize, [(name,) for name in names])))
+
+    def restore(self) -> Dict[str, bool]:
+        """Put back every address changed since the last restore"""
+        with self._lock:
+            items = list(self.originals.items())
+        return dict(zip([name for name, _ in items], self._map(self._restore, items)))
@@ -5,13 +5,13 @@ import sys
 import logging
 import ctypes
 import os
-from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QSystemTrayIcon, QMenu, QAction, QMessageBox, QLabel
+from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QSystemTrayIcon, QMenu, QAction, QActionGroup, QMessageBox, QLabel
 from PyQt5.QtCore import Qt, QObject, pyqtSignal
 from PyQt5.QtGui import QIcon, QKeySequence, QPixmap, QPainter, QBrush, QPen
-from hardware_control import HardwareController
-from process_manager import ProcessManager
-from location_service import LocationService
-from audit_logger import AuditLogger
+from command_executor import CommandExecutor
+from controller import GhostModeController
+from orchestrator import STARTED
+import tracing
 
 def is_admin():
     """Check if running with admin privileges"""
@@ -20,21 +20,62 @@ def is_admin():
     except:
         return False
 
+def daemon_running():
+    """True if a Ghost Mode daemon is serving this user"""
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        return False
+    from daemon import DaemonClient
+    return DaemonClient().alive()
+
 class GhostSignals(QObject):
-    """Signals for hotkey events"""
+    """Signals for hotkey and trigger events"""
     toggle_requested = pyqtSignal()
+    # action, profile ('' for none), rule name; emitted from the trigger worker
+    trigger_fired = pyqtSignal(str, str, str)
+
+class PipelineSignals(QObject):
+    """Signals carrying pipeline progress from worker threads to the GUI"""
+    stage_started = pyqtSignal(str)
+    stage_finished = pyqtSignal(str, bool, float)
+    activation_finished = pyqtSignal(object)
+    deactivation_finished = pyqtSignal(object)
 
 class GhostModeApp(QMainWindow):
     """Main application window for Ghost Mode"""
     def __init__(self):
         super().__init__()
+        if daemon_running():
+            # A second controller would race the daemon over devices, processes and the journal
+            QMessageBox.critical(
+                self,
+                "Ghost Mode Daemon Running",
+                "A Ghost Mode daemon is already running.\n"
+                "Use ghostmode.py activate|deactivate|status, or stop the daemon first."
+            )
+            sys.exit(1)
         self.ghost_active = False
         self.signals = GhostSignals()
-        self.hardware = HardwareController()
-        self.process_manager = ProcessManager()
-        self.process_manager.load_target_processes('config/target_processes.txt')
-        self.location_service = LocationService()
-        self.audit_logger = AuditLogger()
+        self.signals.trigger_fired.connect(self.on_trigger_fired)
+        # Warm shell sessions so device commands skip interpreter startup
+        self.command_executor = CommandExecutor()
+        self.command_executor.warm()
+        # GHOST_MODE_METRICS=FILE traces service calls into a Prometheus textfile
+        metrics_path = os.environ.get('GHOST_MODE_METRICS')
+        if metrics_path:
+            tracing.enable()
+        # Services and reconciliation are shared with the headless CLI
+        self.controller = GhostModeController(runner=self.command_executor, metrics_path=metrics_path)
+        self.hardware = self.controller.hardware
+        self.process_manager = self.controller.process_manager
+        self.location_service = self.controller.location_service
+        self.pipeline_running = False
+        self.pending_trigger = None
+        self.pipeline_signals = PipelineSignals()
+        self.pipeline_signals.stage_started.connect(self.on_stage_started)
+        self.pipeline_signals.stage_finished.connect(self.on_stage_finished)
+        self.pipeline_signals.activation_finished.connect(self.on_activation_finished)
+        self.pipeline_signals.deactivation_finished.connect(self.on_deactivation_finished)
         
         if not is_admin():
             QMessageBox.warning(
@@ -62,6 +103,10 @@ class GhostModeApp(QMainWindow):
         self.status_label = QLabel("Location: Unknown", self)
         self.status_label.setGeometry(50, 160, 200, 20)
         
+        # Pipeline progress label
+        self.progress_label = QLabel("", self)
+        self.progress_label.setGeometry(50, 20, 200, 20)
+        
     def setup_tray_icon(self):
         """Create system tray icon"""
         self.tray_icon = QSystemTrayIcon(self)
@@ -84,9 +129,25 @@ class GhostModeApp(QMainWindow):
             self.tray_icon.setIcon(QIcon(pixmap))
             
         tray_menu = QMenu()
-        toggle_action = QAction("Toggle Ghost Mode", self)
-        toggle_action.triggered.connect(self.toggle_ghost_mode)
-        tray_menu.addAction(toggle_action)
+        self.toggle_action = QAction("Toggle Ghost Mode", self)
+        self.toggle_action.triggered.connect(lambda: self.toggle_ghost_mode())
+        tray_menu.addAction(self.toggle_action)
+        
+        # Keeps a kill plan ready so the hotkey only has to execute it
+        arm_action = QAction("Arm Panic Hotkey", self)
+        arm_action.setCheckable(True)
+        arm_action.toggled.connect(self.set_panic_armed)
+        tray_menu.addAction(arm_action)
+        
+        # Follows config/triggers.ini: process, device, network and time rules
+        triggers_action = QAction("Automatic Triggers", self)
+        triggers_action.setCheckable(True)
+        triggers_action.toggled.connect(self.set_triggers_enabled)
+        tray_menu.addAction(triggers_action)
+        
+        # Rebuilt each time it opens, so edits to profiles.ini show up
+        self.profile_menu = tray_menu.addMenu("Profile")
+        self.profile_menu.aboutToShow.connect(self.populate_profile_menu)
         
         quit_action = QAction("Exit", self)
         quit_action.triggered.connect(sys.exit)
@@ -104,85 +165,207 @@ class GhostModeApp(QMainWindow):
         
     def setup_logging(self):
         """Configure application logging"""
+        # General logs stay out of the audit trail, which AuditLogger owns
         logging.basicConfig(
-            filename='ghost_mode_audit.log',
+            filename='ghost_mode.log',
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
         
     def toggle_ghost_mode(self, state=None):
-        """Toggle ghost mode on/off"""
+        """Toggle ghost mode on/off; the state changes when the pipeline finishes"""
+        if self.pipeline_running:
+            logging.info("Ghost Mode pipeline already running; ignoring toggle")
+            self.toggle_btn.setChecked(self.ghost_active)
+            return
         if state is None:
             state = not self.ghost_active
         if state:
             self.activate_ghost_mode()
-            self.toggle_btn.setText("Deactivate Ghost Mode")
         else:
             self.deactivate_ghost_mode()
-            self.toggle_btn.setText("Activate Ghost Mode")
-        self.ghost_active = state
+        
+    def set_pipeline_running(self, running):
+        """Disable the toggles while a pipeline runs so clicks cannot race it"""
+        self.pipeline_running = running
+        self.toggle_btn.setEnabled(not running)
+        self.toggle_action.setEnabled(not running)
+        
+    def show_ghost_active(self, active):
+        """Record the state a finished pipeline left and show it"""
+        self.ghost_active = active
+        self.toggle_btn.setChecked(active)
+        self.toggle_btn.setText("Deactivate Ghost Mode" if active else "Activate Ghost Mode")
+    
+    def populate_profile_menu(self):
+        """List the profiles, checking the selected one"""
+        self.profile_menu.clear()
+        self.controller.profiles.refresh()
+        group = QActionGroup(self.profile_menu)
+        selected = self.controller.profile.name
+        for name in self.controller.profiles.profiles:
+            action = QAction(name, self.profile_menu, checkable=True)
+            action.setChecked(name == selected)
+            action.triggered.connect(lambda checked, name=name: self.select_profile(name))
+            group.addAction(action)
+            self.profile_menu.addAction(action)
     
+    def select_profile(self, name):
+        """Switch profiles; targets apply at once, protections on the next activation"""
+        try:
+            self.controller.select_profile(name)
+            logging.info(f"Selected profile {name}")
+        except KeyError as e:
+            logging.error(f"Could not select profile: {e}")
+        
+    def set_panic_armed(self, armed):
+        """Arm or disarm the pre-computed panic plan"""
+        if armed:
+            self.controller.panic.arm()
+        else:
+            self.controller.panic.disarm()
+        logging.info(f"Panic hotkey {'armed' if armed else 'disarmed'}")
+        
+    def set_triggers_enabled(self, enabled):
+        """Start or stop following the trigger rules"""
+        if enabled:
+            self.controller.triggers.start(
+                lambda action, profile, rule: self.signals.trigger_fired.emit(action, profile or '', rule)
+            )
+        else:
+            self.controller.triggers.stop()
+        logging.info(f"Automatic triggers {'enabled' if enabled else 'disabled'}")
+        
+    def on_trigger_fired(self, action, profile, rule):
+        """Apply a fired trigger rule on the GUI thread"""
+        if self.pipeline_running:
+            # Applied once the running pipeline finishes; a newer trigger replaces it
+            self.pending_trigger = (action, profile, rule)
+            return
+        active = action == 'activate'
+        if active == self.ghost_active and not profile:
+            return
+        if profile:
+            self.select_profile(profile)
+        self.tray_icon.showMessage("Ghost Mode", f"Trigger {rule}: {action}", QSystemTrayIcon.Information)
+        self.toggle_ghost_mode(active)
+        
     def activate_ghost_mode(self):
         """Enable all privacy protections"""
+        if self.pipeline_running:
+            logging.info("Ghost Mode pipeline already running; ignoring activation")
+            return
         logging.info("Activating Ghost Mode")
-        # Hardware protections
-        hw_ok = self.hardware.activate_protections()
-        # Terminate target processes
-        proc_ok = self.process_manager.kill_processes()
-        # Spoof location or randomize MAC
-        loc_ok = False
-        if self.hardware.os_type == 'Windows':
-            loc_ok = self.location_service.spoof_location()
+        self.set_pipeline_running(True)
+        # Webcam, microphone, processes and location/MAC run concurrently;
+        # only protections not already in effect are applied, from the
+        # armed panic plan if there is one
+        self.controller.activate_async(
+            self.report_stage_progress, self.pipeline_signals.activation_finished.emit
+        )
+        
+    def deactivate_ghost_mode(self):
+        """Disable privacy protections"""
+        if self.pipeline_running:
+            logging.info("Ghost Mode pipeline already running; ignoring deactivation")
+            return
+        logging.info("Deactivating Ghost Mode")
+        self.set_pipeline_running(True)
+        self.controller.deactivate_async(
+            self.report_stage_progress, self.pipeline_signals.deactivation_finished.emit
+        )
+        
+    def report_stage_progress(self, event, name, result):
+        """Forward stage progress from worker threads to the GUI thread"""
+        if event == STARTED:
+            self.pipeline_signals.stage_started.emit(name)
         else:
-            loc_ok = self.hardware.randomize_mac_address()
+            self.pipeline_signals.stage_finished.emit(name, result.ok, result.elapsed)
+        
+    def on_stage_started(self, name):
+        """Show which stage is running"""
+        self.progress_label.setText(f"{name}...")
+        
+    def on_stage_finished(self, name, ok, elapsed):
+        """Show the outcome of a finished stage"""
+        self.progress_label.setText(f"{name} {'done' if ok else 'failed'} ({elapsed:.1f}s)")
+        
+    def pipeline_summary(self, verb, result):
+        """Elapsed time plus the stages reconciliation found already done"""
+        text = f"{verb} in {result.elapsed:.1f}s"
+        if result.skipped:
+            text += f" ({len(result.skipped)} skipped, ~{result.saved:.1f}s saved)"
+        return text
+        
+    def update_location_label(self, loc_state):
+        """Update location status label"""
+        if self.hardware.os_type == 'Windows':
+            loc_text = 'Off' if loc_state and loc_state[0] == 0 else 'On'
+            self.status_label.setText(f"Location: {loc_text}")
+        
+    def on_activation_finished(self, result):
+        """Notify and audit once every activation stage has finished"""
+        self.set_pipeline_running(False)
+        hw_ok = result.stage_ok('webcam') and result.stage_ok('microphone')
+        # Active if any protection took effect, so the next toggle undoes it;
+        # if every stage failed nothing is active and the next toggle retries
+        self.show_ghost_active(any(result.stage_ok(name) for name in result.desired))
+        self.hardware.devices_disabled = hw_ok
+        proc_ok = result.stage_ok('processes')
+        loc_ok = result.stage_ok('location')
+        snapshot = result.context.get('snapshot')
+        loc_state = result.context.get('location_state', ())
+        self.progress_label.setText(self.pipeline_summary("Activated", result))
         # Show notification
         messages = []
         messages.append(f"Hardware {'disabled' if hw_ok else 'disable failed'}")
-        messages.append(f"Processes {'terminated' if proc_ok else 'termination failed'}")
+        messages.append(f"Processes {'terminated' if proc_ok else 'termination failed'} ({len(snapshot or ())} matched)")
         if self.hardware.os_type == 'Windows':
             messages.append(f"Location {'spoofed' if loc_ok else 'spoof failed'}")
         else:
             messages.append(f"MAC {'randomized' if loc_ok else 'randomize failed'}")
+        panic = result.context.get('panic')
+        if panic:
+            messages.append(f"Panic plan executed in {panic['latency'] * 1000:.0f} ms")
         self.tray_icon.showMessage("Ghost Mode Activated", "\n".join(messages), QSystemTrayIcon.Information)
-        # Update location status label
-        if self.hardware.os_type == 'Windows':
-            loc_state = self.location_service.get_current_location()
-            loc_text = 'Off' if loc_state and loc_state[0] == 0 else 'On'
-            self.status_label.setText(f"Location: {loc_text}")
+        self.update_location_label(loc_state)
         # Audit log activation
-        loc_state = self.location_service.get_current_location() if self.hardware.os_type == 'Windows' else ()
-        self.audit_logger.log_activation(
-            self.process_manager.killed_processes, hw_ok, loc_ok, loc_state
-        )
+        self.controller.record_activation(result)
+        self.run_pending_trigger()
         
-    def deactivate_ghost_mode(self):
-        """Disable privacy protections"""
-        logging.info("Deactivating Ghost Mode")
-        # Restore hardware
-        hw_ok = self.hardware.deactivate_protections()
-        # Restart processes if needed
-        proc_ok = self.process_manager.restore_processes()
-        # Restore location settings
-        loc_ok = False
-        if self.hardware.os_type == 'Windows':
-            loc_ok = self.location_service.restore_location()
+    def on_deactivation_finished(self, result):
+        """Notify and audit once every deactivation stage has finished"""
+        self.set_pipeline_running(False)
+        # A failed restore leaves protections in effect; the next toggle retries it
+        self.show_ghost_active(not result.ok)
+        hw_ok = result.stage_ok('hardware')
+        proc_ok = result.stage_ok('processes')
+        loc_ok = result.stage_ok('location')
+        snapshot = result.context.get('snapshot')
+        running = snapshot.running_targets if snapshot else []
+        loc_state = result.context.get('location_state', ())
+        if result.context.get('enforcement'):
+            logging.info(f"Enforcement statistics: {result.context['enforcement']}")
+        self.progress_label.setText(self.pipeline_summary("Deactivated", result))
         # Show notification
         messages = []
         messages.append(f"Hardware {'restored' if hw_ok else 'restore failed'}")
-        messages.append(f"Processes {'restored' if proc_ok else 'restore failed'}")
+        messages.append(f"Processes {'restored' if proc_ok else 'restore failed'} ({len(self.process_manager.last_restore)} apps)")
+        if running:
+            messages.append(f"Still running: {', '.join(running)}")
         if self.hardware.os_type == 'Windows':
             messages.append(f"Location {'restored' if loc_ok else 'restore failed'}")
         self.tray_icon.showMessage("Ghost Mode Deactivated", "\n".join(messages), QSystemTrayIcon.Information)
-        # Update location status label
-        if self.hardware.os_type == 'Windows':
-            loc_state = self.location_service.get_current_location()
-            loc_text = 'Off' if loc_state and loc_state[0] == 0 else 'On'
-            self.status_label.setText(f"Location: {loc_text}")
+        self.update_location_label(loc_state)
         # Audit log deactivation
-        loc_state = self.location_service.get_current_location() if self.hardware.os_type == 'Windows' else ()
-        self.audit_logger.log_deactivation(
-            [p for p in self.process_manager.target_processes if self.process_manager.is_process_running(p)], hw_ok, loc_ok, loc_state
-        )
+        self.controller.record_deactivation(result)
+        self.run_pending_trigger()
+        
+    def run_pending_trigger(self):
+        """Apply the newest trigger that fired while a pipeline was running"""
+        pending, self.pending_trigger = self.pending_trigger, None
+        if pending:
+            self.on_trigger_fired(*pending)
 
 def main():
     app = QApplication(sys.argv)
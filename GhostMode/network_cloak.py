@@ -0,0 +1,179 @@
+"""
+Network cloaking for Ghost Mode
+Cuts target processes off the network instead of killing them: they are
+moved into a dedicated cgroup v2 group whose sockets nftables drops
+"""
+import logging
+import os
+import tempfile
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import psutil
+
+from proc_scanner import own_lineage
+from tracing import span
+
+TABLE = 'ghostmode'
+GROUP = 'ghostmode-cloak'
+
+
+class CloakRecord(NamedTuple):
+    """A cloaked process and the cgroup it came from"""
+    pid: int
+    name: str
+    cgroup: Optional[str] = None
+
+
+def process_tree(pids: Iterable[int]) -> List[int]:
+    """The given PIDs that still exist, followed by all their descendants
+
+    Ghost Mode and its ancestors are left out, along with their trees.
+    """
+    tree = []
+    lineage = own_lineage()
+    for pid in pids:
+        if pid in lineage:
+            continue
+        try:
+            proc = psutil.Process(pid)
+            children = proc.children(recursive=True)
+        except psutil.Error:
+            continue
+        tree.append(pid)
+        tree.extend(child.pid for child in children)
+    return tree
+
+
+def build_ruleset(group: str = GROUP, table: str = TABLE) -> str:
+    """One nft transaction that (re)creates the table dropping group's traffic
+
+    The rules match the group as an ancestor of each socket's cgroup, so
+    the ruleset is the same size whether one app is cloaked or hundreds.
+    Declaring and deleting the table first makes a reload replace it
+    whole instead of failing or appending duplicate rules.
+    """
+    path = group.strip('/')
+    match = f'socket cgroupv2 level {path.count("/") + 1} "{path}" counter drop'
+    return '\n'.join([
+        f"table inet {table} {{}}",
+        f"delete table inet {table}",
+        f"table inet {table} {{",
+        "\tchain output {",
+        "\t\ttype filter hook output priority filter; policy accept;",
+        f"\t\t{match}",
+        "\t}",
+        "\tchain input {",
+        "\t\ttype filter hook input priority filter; policy accept;",
+        f"\t\t{match}",
+        "\t}",
+        "}",
+    ]) + '\n'
+
+
+def build_teardown(table: str = TABLE) -> str:
+    """One nft transaction removing the table, whether or not it exists"""
+    return f"table inet {table} {{}}\ndelete table inet {table}\n"
+
+
+class NetworkCloak:
+    """Blocks all traffic of processes by moving them into a cloaked cgroup
+
+    The nftables ruleset is loaded before any process is moved, so each
+    one is cut off the moment it joins the group; children forked later
+    inherit the group. uncloak() moves processes back to their original
+    cgroups and drops the table in one transaction. runner runs
+    ['nft', '-f', FILE] (see command_executor); tree(pids) expands PIDs
+    to their process trees. Both can be replaced by fakes (fake_os).
+    """
+    def __init__(self, root: str = '/sys/fs/cgroup', group: str = GROUP, proc_root: str = '/proc',
+                 runner=None, tree=None, table: str = TABLE):
+        if runner is None:
+            from command_executor import SubprocessRunner
+            runner = SubprocessRunner()
+        self.root = root
+        self.group = group
+        self.path = os.path.join(root, group)
+        self.proc_root = proc_root
+        self.runner = runner
+        self.tree = tree or process_tree
+        self.table = table
+        self.loaded = False
+        self.logger = logging.getLogger(__name__)
+
+    def available(self) -> bool:
+        """cgroup v2 is mounted at root and we may create groups there"""
+        return (
+            os.path.exists(os.path.join(self.root, 'cgroup.controllers'))
+            and os.access(self.root, os.W_OK)
+        )
+
+    def _current_cgroup(self, pid: int) -> Optional[str]:
+        with open(f"{self.proc_root}/{pid}/cgroup") as f:
+            for line in f:
+                if line.startswith('0::'):
+                    return line[3:].strip()
+        return None
+
+    def _write(self, path: str, value: str) -> None:
+        with open(path, 'a') as f:
+            f.write(value)
+
+    def _load(self, ruleset: str) -> None:
+        """Apply a ruleset as a single nft transaction; raises OSError if nft rejects it"""
+        fd, path = tempfile.mkstemp(prefix='ghostmode-', suffix='.nft')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(ruleset)
+            with span('nft', op='load'):
+                result = self.runner.run(['nft', '-f', path])
+        finally:
+            os.unlink(path)
+        if result.returncode != 0:
+            raise OSError(f"nft failed ({result.returncode}): {(result.stderr or result.stdout).strip()}")
+
+    def cloak(self, procs: Dict[int, str]) -> List[CloakRecord]:
+        """Cloak processes and their descendants; raises OSError if the ruleset cannot be loaded"""
+        if not self.available():
+            raise OSError(f"no writable cgroup v2 hierarchy at {self.root}")
+        os.makedirs(self.path, exist_ok=True)
+        if not self.loaded:
+            self._load(build_ruleset(self.group, self.table))
+            self.loaded = True
+        records = []
+        target = os.path.join(self.path, 'cgroup.procs')
+        with span('cloak', op='move'):
+            # Matched helpers are also descendants of a matched parent
+            for pid in dict.fromkeys(self.tree(list(procs))):
+                try:
+                    original = self._current_cgroup(pid)
+                    self._write(target, str(pid))
+                except (FileNotFoundError, ProcessLookupError):
+                    continue
+                records.append(CloakRecord(pid, procs.get(pid, ''), original))
+        return records
+
+    def uncloak(self, records: List[CloakRecord]) -> bool:
+        """Move records back to their cgroups and remove the ruleset"""
+        ok = True
+        for record in records:
+            target = os.path.join(self.root, (record.cgroup or '/').lstrip('/'), 'cgroup.procs')
+            try:
+                self._write(target, str(record.pid))
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            except OSError as e:
+                self.logger.warning(f"Could not move {record.pid} back to {record.cgroup}: {e}")
+                ok = False
+        try:
+            self._load(build_teardown(self.table))
+        except OSError as e:
+            self.logger.error(f"Could not remove nftables table {self.table}: {e}")
+            ok = False
+        # Even if the teardown failed: a stale table matches the removed
+        # group's id, so the next cloak() must load it against the new one
+        self.loaded = False
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+        return ok
@@ -0,0 +1,192 @@
+"""
+Pipeline orchestration for Ghost Mode
+Runs independent activation/deactivation stages concurrently off the GUI thread
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from tracing import profiled_call, span
+
+STARTED = 'started'
+FINISHED = 'finished'
+
+
+class Stage(NamedTuple):
+    """One unit of pipeline work; func returns True on success"""
+    name: str
+    func: Callable[[], bool]
+    timeout: float = 10.0
+
+
+class StageResult(NamedTuple):
+    """Outcome of a single stage"""
+    name: str
+    ok: bool
+    elapsed: float
+    error: Optional[str] = None
+    timed_out: bool = False
+
+
+class PipelineResult:
+    """Results of one pipeline run, plus values stages left in context"""
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.results: Dict[str, StageResult] = {}
+        self.context: dict = {}
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(result.ok for result in self.results.values())
+
+    def stage_ok(self, name: str) -> bool:
+        result = self.results.get(name)
+        return bool(result and result.ok)
+
+    def to_records(self) -> List[dict]:
+        return [result._asdict() for result in self.results.values()]
+
+
+class PipelineOrchestrator:
+    """Runs stages on a shared worker pool with per-stage timeouts
+
+    Progress callbacks are invoked from worker threads as
+    on_progress(event, stage_name, result) where event is 'started' or
+    'finished'; GUI callers should forward them through Qt signals.
+    """
+    def __init__(self, max_workers: int = 4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ghost-stage')
+        self.logger = logging.getLogger(__name__)
+
+    def _call(self, kind: str, stage: Stage, on_progress) -> StageResult:
+        if on_progress:
+            on_progress(STARTED, stage.name, None)
+        start = time.monotonic()
+        try:
+            with span('stage', kind=kind, stage=stage.name):
+                ok = bool(profiled_call(stage.func))
+            return StageResult(stage.name, ok, time.monotonic() - start)
+        except Exception as e:
+            self.logger.error(f"Stage {stage.name} failed: {e}")
+            return StageResult(stage.name, False, time.monotonic() - start, str(e))
+
+    def run(self, kind: str, stages: List[Stage], on_progress=None,
+            context: dict = None) -> PipelineResult:
+        """Run all stages concurrently and wait for them or their timeouts"""
+        pipeline = PipelineResult(kind)
+        if context is not None:
+            pipeline.context = context
+        start = time.monotonic()
+        pending = {}
+        for stage in stages:
+            future = self.executor.submit(self._call, kind, stage, on_progress)
+            pending[future] = (stage, start + stage.timeout)
+
+        while pending:
+            next_deadline = min(deadline for _, deadline in pending.values())
+            done, _ = wait(pending, timeout=max(0.0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(pending):
+                stage, deadline = pending[future]
+                if future in done:
+                    result = future.result()
+                elif now >= deadline:
+                    # The worker keeps running; its late result is discarded
+                    self.logger.warning(f"Stage {stage.name} timed out after {stage.timeout}s")
+                    result = StageResult(stage.name, False, now - start, 'timeout', True)
+                else:
+                    continue
+                del pending[future]
+                pipeline.results[stage.name] = result
+                if on_progress:
+                    on_progress(FINISHED, stage.name, result)
+
+        pipeline.elapsed = time.monotonic() - start
+        self.logger.info(f"{kind} pipeline finished in {pipeline.elapsed:.3f}s: {pipeline.to_records()}")
+        return pipeline
+
+    def run_async(self, kind: str, stages: List[Stage], on_progress=None,
+                  on_finished: Callable[[PipelineResult], None] = None,
+                  context: dict = None) -> threading.Thread:
+        """Run a pipeline on its own thread and hand the result to on_finished"""
+        def runner():
+            result = self.run(kind, stages, on_progress, context)
+            if on_finished:
+                on_finished(result)
+        thread = threading.Thread(target=runner, name=f'ghost-{kind}', daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+def build_activation_stages(hardware, process_manager, location_service, context: dict,
+                            timeouts: Dict[str, float] = None, enforce: bool = True,
+                            plan=None) -> List[Stage]:
+    """Independent stages that together activate ghost mode
+
+    enforce=False skips the enforcement watcher, for one-shot callers that
+    exit right after activating. A KillPlan from panic mode replaces the
+    process table walk with the processes it already resolved.
+    """
+    timeouts = timeouts or {}
+
+    def processes():
+        snapshot = plan.snapshot if plan is not None else process_manager.snapshot()
+        context['snapshot'] = snapshot
+        ok = process_manager.kill_processes(snapshot, plan)
+        if enforce:
+            # Keep killing targets that respawn while ghost mode stays on
+            process_manager.start_enforcement()
+        return ok
+
+    def location():
+        if hardware.os_type == 'Windows':
+            # One registry transaction; the state read back comes from its cache
+            with location_service.transaction():
+                ok = location_service.spoof_location()
+            context['location_state'] = location_service.get_current_location()
+            return ok
+        context['location_state'] = ()
+        return hardware.randomize_mac_address()
+
+    return [
+        Stage('webcam', hardware.disable_webcam, timeouts.get('webcam', 15.0)),
+        Stage('microphone', hardware.disable_microphone, timeouts.get('microphone', 15.0)),
+        Stage('processes', processes, timeouts.get('processes', 15.0)),
+        Stage('location', location, timeouts.get('location', 15.0)),
+    ]
+
+
+def build_deactivation_stages(hardware, process_manager, location_service, context: dict,
+                              timeouts: Dict[str, float] = None) -> List[Stage]:
+    """Independent stages that together deactivate ghost mode"""
+    timeouts = timeouts or {}
+
+    def processes():
+        # Stop enforcement first so restored processes are not killed again
+        context['enforcement'] = process_manager.stop_enforcement()
+        ok = process_manager.restore_processes()
+        # One process table walk serves both the notification and the audit
+        context['snapshot'] = process_manager.snapshot()
+        return ok
+
+    def location():
+        if hardware.os_type == 'Windows':
+            with location_service.transaction():
+                ok = location_service.restore_location()
+            context['location_state'] = location_service.get_current_location()
+            return ok
+        context['location_state'] = ()
+        return hardware.restore_mac_address()
+
+    return [
+        Stage('hardware', hardware.deactivate_protections, timeouts.get('hardware', 15.0)),
+        Stage('processes', processes, timeouts.get('processes', 30.0)),
+        Stage('location', location, timeouts.get('location', 15.0)),
+    ]
@@ -0,0 +1,316 @@
+"""
+Armed panic mode for Ghost Mode
+Keeps a kill plan current in the background so a panic trigger only has
+to execute it instead of scanning, resolving and probing from scratch
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import psutil
+
+from enforcement import open_event_source
+from orchestrator import FINISHED
+from process_manager import ProcessSnapshot
+from process_matcher import DEFAULT_STRATEGY
+from proc_scanner import MatchedProcess, own_lineage
+from reconcile import (
+    LOCATION, MICROPHONE, PROCESSES, UNKNOWN, WEBCAM, ReconcileReport,
+    build_activation_actions, desired_state
+)
+from restoration import capture_launch_records
+from stats import LatencyHistogram, LatencyObjective
+from termination import TerminationEngine, TerminationReport
+
+LATENCY_METRIC = 'panic.latency'
+DEVICE_PROTECTIONS = (WEBCAM, MICROPHONE, LOCATION)
+
+
+def process_tree(children: Dict[int, List[int]], pid: int) -> List[int]:
+    """A PID followed by its known descendants"""
+    pids, queue = [], [pid]
+    while queue:
+        current = queue.pop()
+        pids.append(current)
+        queue.extend(children.get(current, ()))
+    return pids
+
+
+class KillPlan:
+    """Everything a panic trigger needs, resolved ahead of time
+
+    A plan is never modified once built; the arming thread builds a new one
+    and swaps it in, so a trigger can use whichever plan it reads without
+    taking a lock.
+    """
+    def __init__(self, matches: Dict[int, MatchedProcess], children: Dict[int, List[int]],
+                 handles: Dict[int, psutil.Process], names: Dict[int, str], launch_records: list,
+                 targets: List[str], observed: dict, sources: dict, terminator: TerminationEngine):
+        self.matches = matches
+        self.children = children
+        self.handles = handles
+        self.names = names
+        self.launch_records = launch_records
+        self.observed = observed
+        self.sources = sources
+        self.terminator = terminator
+        self.snapshot = ProcessSnapshot(list(matches.values()), targets)
+        self.built_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.built_at
+
+    def resolve(self, pids: Iterable[int]) -> List[psutil.Process]:
+        """Planned handles for the given PIDs and their descendants"""
+        seen = {}
+        lineage = own_lineage()
+        for pid in pids:
+            if pid in lineage:
+                continue
+            for member in process_tree(self.children, pid):
+                handle = self.handles.get(member)
+                if handle is not None:
+                    seen.setdefault(member, handle)
+        return list(seen.values())
+
+    def terminate(self, pids: List[int]) -> TerminationReport:
+        return self.terminator.terminate_resolved(self.resolve(pids), pids, self.names)
+
+
+class PanicArm:
+    """Keeps a KillPlan current while armed and executes it when triggered
+
+    While armed, a background thread follows process exec events (proc
+    connector, else the /proc diff) to extend the plan, and rebuilds it from
+    a full process walk every rescan_interval seconds, which also drops
+    exited processes and re-observes webcam, microphone and location state.
+    A trigger signals the planned handles with a short grace period and runs
+    only the device stages still needed. Trigger-to-last-protection latency
+    is accumulated in a histogram kept in the state journal and evaluated
+    against objective.
+    """
+    def __init__(self, controller, interval: float = 0.1, rescan_interval: float = 5.0,
+                 grace_period: float = 0.5, objective: LatencyObjective = LatencyObjective(1.0, 0.95),
+                 source=None):
+        self.controller = controller
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+        self.objective = objective
+        self.terminator = TerminationEngine(grace_period)
+        self.source = source
+        self.plan: Optional[KillPlan] = None
+        self.spent = False
+        self.triggers = 0
+        self.refreshes = 0
+        self.latency = LatencyHistogram.from_dict(controller.journal.metrics.get(LATENCY_METRIC, {}))
+        self.logger = logging.getLogger(__name__)
+        self._owns_source = source is None
+        self._stop = threading.Event()
+        self._trigger_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def armed(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def arm(self) -> None:
+        """Resolve everything a trigger touches and keep it current"""
+        if self.armed:
+            return
+        if self._thread is not None:
+            # A spent plan's thread is on its way out; let it close its source
+            self._thread.join()
+        controller = self.controller
+        warm = getattr(controller.hardware.runner, 'warm', None)
+        if warm:
+            warm()
+        controller.location_service.prepare()
+        try:
+            # Listen before the first walk so nothing started in between is missed
+            if self._owns_source:
+                self.source = open_event_source(self.logger)
+            else:
+                self.source.open()
+            self.refresh()
+        except Exception:
+            # disarm() only releases what a started arming thread holds
+            controller.location_service.release()
+            raise
+        self.spent = False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(self.source,),
+                                        name='ghost-panic-arm', daemon=True)
+        self._thread.start()
+        self.logger.info(f"Panic mode armed: {len(self.plan.matches)} processes planned")
+
+    def disarm(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread is None:
+            # Never armed, so the location key was never opened on our behalf
+            return
+        self._thread.join(timeout)
+        self._thread = None
+        self.controller.location_service.release()
+
+    def _run(self, source) -> None:
+        next_rescan = time.monotonic() + self.rescan_interval
+        try:
+            while not self._stop.is_set():
+                events = source.poll(self.interval)
+                if self._stop.is_set():
+                    break
+                try:
+                    if time.monotonic() >= next_rescan:
+                        self.refresh()
+                        next_rescan = time.monotonic() + self.rescan_interval
+                    elif events:
+                        self._extend(events)
+                except Exception as e:
+                    self.logger.error(f"Panic plan refresh failed: {e}")
+        finally:
+            source.close()
+
+    def refresh(self) -> KillPlan:
+        """Rebuild the plan from one walk of the process table"""
+        pm = self.controller.process_manager
+        match = pm.matcher.match
+        attrs = pm.matcher.scan_attrs() + ['ppid']
+        matches, children, names = {}, {}, {}
+        for info in pm.scanner.scan(attrs):
+            children.setdefault(info.ppid, []).append(info.pid)
+            names[info.pid] = info.name
+            target = match(info.name, info.exe, info.cmdline)
+            if target is None:
+                continue
+            matches[info.pid] = self._matched(info, target)
+        observed, sources = self.controller.reconciler.observe(DEVICE_PROTECTIONS)
+        self.refreshes += 1
+        return self._publish(matches, children, names, observed, sources)
+
+    def _matched(self, info, target: str) -> MatchedProcess:
+        exe = info.exe
+        if exe is None:
+            # Launch records group by executable, so resolve it as snapshot() does
+            detail = self.controller.process_manager.scanner.read(info.pid, ('pid', 'name', 'exe'))
+            exe = detail.exe if detail else None
+        return MatchedProcess(info.pid, info.name, target, info.ppid, exe)
+
+    def _extend(self, events: List[tuple]) -> None:
+        """Add newly exec'd targets, and children of planned processes, to the plan"""
+        plan = self.plan
+        pm = self.controller.process_manager
+        attrs = pm.matcher.scan_attrs() + ['ppid']
+        matches, children, names = dict(plan.matches), dict(plan.children), dict(plan.names)
+        changed = False
+        for pid, _ in events:
+            if pid in plan.handles or pid in plan.matches:
+                continue
+            info = pm.scanner.read(pid, attrs)
+            if info is None:
+                continue
+            target = pm.matcher.match(info.name, info.exe, info.cmdline)
+            if target is None and info.ppid not in plan.handles:
+                continue
+            children[info.ppid] = children.get(info.ppid, []) + [pid]
+            names[pid] = info.name
+            if target is not None:
+                matches[pid] = self._matched(info, target)
+            changed = True
+        if changed:
+            self._publish(matches, children, names, plan.observed, plan.sources)
+
+    def _publish(self, matches, children, names, observed, sources) -> KillPlan:
+        pm = self.controller.process_manager
+        previous = self.plan
+        to_kill = [m for m in matches.values() if pm.strategy_for(m.target) == DEFAULT_STRATEGY]
+        handles = {}
+        for root in to_kill:
+            for pid in process_tree(children, root.pid):
+                handle = previous.handles.get(pid) if previous else None
+                if handle is None or not handle.is_running():
+                    try:
+                        handle = psutil.Process(pid)
+                    except psutil.Error:
+                        continue
+                handles[pid] = handle
+        if previous is not None and {m.pid for m in to_kill} == {
+                m.pid for m in previous.matches.values() if pm.strategy_for(m.target) == DEFAULT_STRATEGY}:
+            launch_records = previous.launch_records
+        else:
+            launch_records = capture_launch_records(to_kill, self.logger, pm.inspector)
+        names = {pid: names.get(pid, '') for pid in handles}
+        self.plan = KillPlan(matches, children, handles, names, launch_records,
+                             pm.target_processes, observed, sources, self.terminator)
+        return self.plan
+
+    def trigger(self, on_progress=None, started: float = None) -> ReconcileReport:
+        """Execute the current plan; started is when the trigger fired (monotonic)"""
+        started = started if started is not None else time.monotonic()
+        with self._trigger_lock:
+            plan = self.plan
+            if plan is None:
+                raise RuntimeError("Panic mode is not armed")
+            # The plan is spent; enforcement takes over from here
+            self._stop.set()
+            self.spent = True
+            controller = self.controller
+            context = {'panic': {'plan_age': round(started - plan.built_at, 3)}}
+            actions = build_activation_actions(
+                controller.hardware, controller.process_manager, controller.location_service,
+                context, enforce=controller.enforce, plan=plan
+            )
+            observed, sources = dict(plan.observed), dict(plan.sources)
+            # The plan itself is the process check, so that stage always runs
+            observed[PROCESSES], sources[PROCESSES] = None, UNKNOWN
+            finished = {}
+
+            def progress(event, name, result):
+                if event == FINISHED:
+                    finished[name] = time.monotonic() - started
+                if on_progress:
+                    on_progress(event, name, result)
+
+            report = controller.reconciler.apply(
+                'activation', desired_state(True, controller.profile.protections), actions, observed, sources, progress, context
+            )
+            latency = max(finished.values(), default=time.monotonic() - started)
+            self.latency.record(latency)
+            self.triggers += 1
+            verdict = self.objective.evaluate(self.latency)
+            context['panic'].update(latency=round(latency, 4), stages=finished, objective=verdict)
+            controller.journal.metrics[LATENCY_METRIC] = self.latency.to_dict()
+            controller.journal.save()
+            if latency > self.objective.threshold:
+                self.logger.warning(
+                    f"Panic trigger took {latency * 1000:.0f} ms, over the "
+                    f"{self.objective.threshold * 1000:.0f} ms objective"
+                )
+            self.logger.info(f"Panic plan executed in {latency * 1000:.1f} ms: {finished}")
+            return report
+
+    def trigger_async(self, on_progress=None, on_finished=None) -> threading.Thread:
+        started = time.monotonic()
+
+        def runner():
+            report = self.trigger(on_progress, started)
+            if on_finished:
+                on_finished(report)
+        thread = threading.Thread(target=runner, name='ghost-panic', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        plan = self.plan
+        return {
+            'armed': self.armed,
+            'source': getattr(self.source, 'name', None),
+            'planned': len(plan.matches) if plan else 0,
+            'handles': len(plan.handles) if plan else 0,
+            'plan_age_s': round(plan.age, 3) if plan else None,
+            'refreshes': self.refreshes,
+            'triggers': self.triggers,
+            'latency': self.latency.summary(),
+            'objective': self.objective.evaluate(self.latency),
+        }
@@ -0,0 +1,203 @@
+"""
+Process table scanners for Ghost Mode
+Swappable backends that enumerate running processes for ProcessManager
+"""
+import logging
+import os
+import sys
+import threading
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import psutil
+
+# Linux truncates comm to TASK_COMM_LEN - 1 characters
+COMM_MAX_LEN = 15
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+class ProcessInfo(NamedTuple):
+    """Minimal view of a process as reported by a scanner"""
+    pid: int
+    name: str
+    ppid: int = 0
+    exe: Optional[str] = None
+    cmdline: Optional[List[str]] = None
+
+
+class MatchedProcess(NamedTuple):
+    """A running process that matched a target rule"""
+    pid: int
+    name: str
+    target: str
+    ppid: int
+    exe: Optional[str]
+
+
+class PsutilScanner:
+    """Portable scanner backed by psutil.process_iter"""
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _info(info: dict) -> ProcessInfo:
+        return ProcessInfo(
+            info['pid'], info.get('name') or '', info.get('ppid') or 0,
+            info.get('exe'), info.get('cmdline')
+        )
+
+    def read(self, pid: int, attrs: Iterable[str] = ('pid', 'name')) -> Optional[ProcessInfo]:
+        """Read a single process, or None if it has exited"""
+        try:
+            return self._info(psutil.Process(pid).as_dict(list(attrs)))
+        except psutil.NoSuchProcess:
+            return None
+
+    def scan(self, attrs: Iterable[str] = ('pid', 'name')) -> Iterator[ProcessInfo]:
+        """Yield every running process with the requested attributes"""
+        for proc in psutil.process_iter(list(attrs)):
+            yield self._info(proc.info)
+
+
+class ProcfsScanner:
+    """Linux scanner that reads /proc directly
+
+    Each scan lists /proc with os.scandir and reads only /proc/<pid>/stat,
+    which carries the name, parent PID and start time in one file. Names and
+    the optional exe/cmdline fields are cached per PID and reused while the
+    start time and comm are unchanged, so a recycled or exec'd PID is re-read.
+
+    One scanner is shared by the enforcement, panic and trigger threads, so
+    each thread reads into its own buffer and the cache is locked.
+    """
+    def __init__(self, root: str = '/proc', buffer_size: int = 4096):
+        self.root = root
+        self.logger = logging.getLogger(__name__)
+        self.buffer_size = buffer_size
+        self._local = threading.local()
+        # pid -> [start_time, raw comm, name, exe, cmdline]
+        self._cache: Dict[int, list] = {}
+        self._lock = threading.Lock()
+
+    def _read(self, path: str) -> bytes:
+        """Read a small procfs file into this thread's buffer"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = bytearray(self.buffer_size)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            while True:
+                n = os.readv(fd, [buffer])
+                if n < len(buffer):
+                    return bytes(buffer[:n])
+                # File did not fit; grow the buffer and read it again
+                buffer = self._local.buffer = bytearray(len(buffer) * 2)
+                os.lseek(fd, 0, os.SEEK_SET)
+        finally:
+            os.close(fd)
+
+    def _read_cmdline(self, pid: int) -> List[str]:
+        raw = self._read(f"{self.root}/{pid}/cmdline")
+        return [arg.decode('utf-8', 'replace') for arg in raw.split(b'\0') if arg]
+
+    def read(self, pid: int, attrs: Iterable[str] = ('pid', 'name')) -> Optional[ProcessInfo]:
+        """Read a single process, or None if it has exited"""
+        try:
+            stat = self._read(f"{self.root}/{pid}/stat")
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            with self._lock:
+                self._cache.pop(pid, None)
+            return None
+        # comm may itself contain spaces or parentheses, so split on the last ')'
+        lparen = stat.find(b'(')
+        rparen = stat.rfind(b')')
+        fields = stat[rparen + 2:].split()
+        try:
+            ppid = int(fields[1])
+            start_time = int(fields[19])
+        except (IndexError, ValueError):
+            return None
+
+        comm = stat[lparen + 1:rparen]
+        with self._lock:
+            entry = self._cache.get(pid)
+        # A changed comm with the same start time means the process exec'd
+        if entry is None or entry[0] != start_time or entry[1] != comm:
+            name = comm.decode('utf-8', 'replace')
+            entry = [start_time, comm, name, None, None]
+            with self._lock:
+                self._cache[pid] = entry
+            if len(name) >= COMM_MAX_LEN:
+                # Recover the full name from argv[0] the same way psutil does
+                try:
+                    entry[4] = self._read_cmdline(pid)
+                    if entry[4]:
+                        base = os.path.basename(entry[4][0])
+                        if base.startswith(name):
+                            entry[2] = base
+                except OSError:
+                    pass
+
+        if 'exe' in attrs and entry[3] is None:
+            try:
+                entry[3] = os.readlink(f"{self.root}/{pid}/exe")
+            except OSError:
+                entry[3] = ''
+        if 'cmdline' in attrs and entry[4] is None:
+            try:
+                entry[4] = self._read_cmdline(pid)
+            except OSError:
+                entry[4] = []
+        return ProcessInfo(
+            pid, entry[2], ppid,
+            (entry[3] or None) if 'exe' in attrs else None,
+            entry[4] if 'cmdline' in attrs else None
+        )
+
+    def started(self, pid: int) -> Optional[float]:
+        """Start time of a scanned PID in seconds since boot (CLOCK_BOOTTIME)"""
+        with self._lock:
+            entry = self._cache.get(pid)
+        if entry is None:
+            return None
+        return entry[0] / CLOCK_TICKS
+
+    def pids(self) -> List[int]:
+        """List the PIDs currently present in procfs"""
+        with os.scandir(self.root) as it:
+            return [int(entry.name) for entry in it if entry.name.isdigit()]
+
+    def scan(self, attrs: Iterable[str] = ('pid', 'name')) -> Iterator[ProcessInfo]:
+        """Yield every running process with the requested attributes"""
+        attrs = frozenset(attrs)
+        seen = set()
+        for pid in self.pids():
+            info = self.read(pid, attrs)
+            if info is not None:
+                seen.add(pid)
+                yield info
+        # Forget processes that exited since the previous scan
+        with self._lock:
+            for pid in self._cache.keys() - seen:
+                del self._cache[pid]
+
+
+def own_lineage() -> frozenset:
+    """PIDs of this process and its ancestors, which are never terminated, frozen or cloaked
+
+    A broad rule such as glob:*python* can match Ghost Mode itself or the
+    shell and terminal that started it; signalling those would stop the
+    pipeline midway.
+    """
+    pids = [os.getpid()]
+    try:
+        pids += [parent.pid for parent in psutil.Process(pids[0]).parents()]
+    except psutil.Error:
+        pids.append(os.getppid())
+    return frozenset(pids)
+
+
+def default_scanner():
+    """Pick the fastest scanner available on this platform"""
+    if sys.platform.startswith('linux') and os.path.exists('/proc/self/stat'):
+        return ProcfsScanner()
+    return PsutilScanner()
@@ -4,16 +4,99 @@ Handles terminating and monitoring applications
 """
 import logging
 import os
-import psutil
-from typing import List
+import time
+from typing import Dict, List
+from process_matcher import DEFAULT_STRATEGY, ProcessMatcher, TargetSet
+from proc_scanner import MatchedProcess, default_scanner
+from termination import KILLED, TERMINATED, TerminationEngine
+from enforcement import EnforcementWatcher
+from restoration import ProcessRestorer, capture_launch_records, inspect_process
+from suspension import Suspender
+from network_cloak import NetworkCloak
+from tracing import count, span
+
+class ProcessSnapshot:
+    """Target processes found by a single walk of the process table"""
+    def __init__(self, matches: List[MatchedProcess], targets: List[str]):
+        self.matches = matches
+        self.taken_at = time.time()
+        self._targets = targets
+    
+    @property
+    def pids(self) -> List[int]:
+        return [m.pid for m in self.matches]
+    
+    def by_target(self) -> Dict[str, List[MatchedProcess]]:
+        """Group matched processes by the rule that matched them"""
+        grouped = {}
+        for m in self.matches:
+            grouped.setdefault(m.target, []).append(m)
+        return grouped
+    
+    @property
+    def running_targets(self) -> List[str]:
+        """Target rules with at least one running process, in config order"""
+        grouped = self.by_target()
+        return [t for t in self._targets if t in grouped]
+    
+    def to_records(self) -> List[dict]:
+        """Plain dictionaries for the audit log"""
+        return [m._asdict() for m in self.matches]
+    
+    def __len__(self) -> int:
+        return len(self.matches)
 
 class ProcessManager:
     """Manages application processes for privacy"""
-    def __init__(self, target_processes: List[str] = None):
+    def __init__(self, target_processes: List[str] = None, scanner=None,
+                 grace_period: float = 3.0, terminator=None, restorer=None,
+                 inspector=None, cloak=None):
         self.target_processes = target_processes or []
         self.killed_processes = []
+        # Any object with scan(attrs) yielding ProcessInfo; see proc_scanner
+        self.scanner = scanner or default_scanner()
+        # terminate(pids) -> TerminationReport, restore(records), and
+        # inspector(pid, attrs) -> dict; fake_os provides simulated ones
+        self.terminator = terminator or TerminationEngine(grace_period)
+        self.inspector = inspector or inspect_process
+        self.last_snapshot = None
+        self.last_termination = None
+        self.enforcement = None
+        # Called periodically by the enforcement watcher to pick up edited targets
+        self.refresh = None
+        self.restorer = restorer or ProcessRestorer()
+        self.launch_records = []
+        self.last_restore = []
+        self.suspender = Suspender()
+        self.suspended = []
+        self.thawed = []
+        # cloak(procs) -> CloakRecords and uncloak(records); see network_cloak
+        self.cloak = cloak or NetworkCloak()
+        self.cloaked = []
+        self.uncloaked = []
         self.logger = logging.getLogger(__name__)
     
+    @property
+    def target_processes(self) -> List[str]:
+        return self.targets.rules
+    
+    @target_processes.setter
+    def target_processes(self, targets: List[str]) -> None:
+        # Compile once per target list so scans never rebuild it per process
+        self.targets = TargetSet.compile(targets)
+    
+    @property
+    def matcher(self) -> ProcessMatcher:
+        return self.targets.matcher
+    
+    @property
+    def strategies(self) -> dict:
+        return self.targets.strategies
+    
+    def strategy_for(self, target: str) -> str:
+        """How matches of a target rule are handled: 'kill', 'freeze' or 'cloak'"""
+        return self.strategies.get(target, DEFAULT_STRATEGY)
+    
     def load_target_processes(self, file_path: str) -> None:
         """Load target processes from config file"""
         try:
@@ -27,33 +110,139 @@ class ProcessManager:
         except Exception as e:
             self.logger.error(f"Error loading target processes: {e}")
     
-    def kill_processes(self) -> bool:
-        """Terminate all target processes"""
+    def snapshot(self) -> ProcessSnapshot:
+        """Walk the process table once and collect every target match"""
+        matches = []
+        match = self.matcher.match
+        attrs = self.matcher.scan_attrs() + ['ppid']
+        try:
+            with span('scan'):
+                for info in self.scanner.scan(attrs):
+                    target = match(info.name, info.exe, info.cmdline)
+                    if target is None:
+                        continue
+                    exe = info.exe
+                    if exe is None:
+                        # Resolve exe paths for matches only, not the whole table
+                        detail = self.scanner.read(info.pid, ('pid', 'name', 'exe'))
+                        exe = detail.exe if detail else None
+                    matches.append(MatchedProcess(info.pid, info.name, target, info.ppid, exe))
+        except Exception as e:
+            self.logger.error(f"Error scanning processes: {e}")
+        count('processes_matched', len(matches))
+        self.last_snapshot = ProcessSnapshot(matches, self.target_processes)
+        return self.last_snapshot
+    
+    def running_targets(self) -> Dict[str, List[MatchedProcess]]:
+        """Running target processes grouped by rule, from one scan"""
+        return self.snapshot().by_target()
+    
+    def kill_processes(self, snapshot: ProcessSnapshot = None, plan=None) -> bool:
+        """Terminate all target processes
+
+        An armed KillPlan (see panic.py) brings its own snapshot, launch
+        records and process handles, so nothing is looked up here.
+        """
         self.killed_processes = []
+        if plan is not None:
+            snapshot = self.last_snapshot = plan.snapshot
+        elif snapshot is None:
+            snapshot = self.snapshot()
+        to_freeze = [m for m in snapshot.matches if self.strategy_for(m.target) == 'freeze']
+        to_cloak = [m for m in snapshot.matches if self.strategy_for(m.target) == 'cloak']
+        to_kill = [m for m in snapshot.matches if self.strategy_for(m.target) == DEFAULT_STRATEGY]
         success = True
-        for proc in psutil.process_iter(['pid', 'name']):
-            try:
-                if proc.info['name'].lower() in [p.lower() for p in self.target_processes]:
-                    psutil.Process(proc.info['pid']).terminate()
-                    self.killed_processes.append(proc.info['name'])
-                    self.logger.info(f"Terminated process: {proc.info['name']}")
-            except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
-                self.logger.warning(f"Could not terminate process: {e}")
-                success = False
-        return success
-    
-    def restore_processes(self) -> None:
-        """Attempt to restart killed processes"""
-        # TODO: Implement process restoration
-        self.logger.info(f"Processes to restore: {self.killed_processes}")
+        if to_freeze:
+            success = self.freeze_processes(to_freeze)
+        if to_cloak:
+            success = self.cloak_processes(to_cloak) and success
+        if not to_kill:
+            return success
+        # Record how to relaunch each app before it disappears, keeping
+        # records of apps terminated earlier that are not restored yet
+        captured = plan.launch_records if plan is not None else capture_launch_records(to_kill, self.logger, self.inspector)
+        apps = {r.app for r in captured}
+        self.launch_records = [r for r in self.launch_records if r.app not in apps] + captured
+        if plan is not None:
+            report = plan.terminate([m.pid for m in to_kill])
+        else:
+            report = self.terminator.terminate([m.pid for m in to_kill])
+        self.last_termination = report
+        for info in to_kill:
+            outcome = report.outcomes.get(info.pid)
+            if outcome in (TERMINATED, KILLED):
+                self.killed_processes.append(info.name)
+                self.logger.info(f"Terminated process: {info.name} ({outcome})")
+            else:
+                self.logger.warning(f"Could not terminate process {info.name} ({info.pid}): {outcome}")
+        return report.ok and success
+    
+    def freeze_processes(self, matches: List[MatchedProcess]) -> bool:
+        """Suspend matched process trees instead of terminating them"""
+        frozen = {r.pid for r in self.suspended}
+        pids = [m.pid for m in matches if m.pid not in frozen]
+        records = self.suspender.suspend(pids)
+        self.suspended.extend(records)
+        for record in records:
+            self.logger.info(f"Suspended process: {record.name} ({record.pid}) via {record.mechanism}")
+        return len(records) >= len(pids)
+    
+    def cloak_processes(self, matches: List[MatchedProcess]) -> bool:
+        """Block the network traffic of matched process trees instead of terminating them"""
+        cloaked = {r.pid for r in self.cloaked}
+        procs = {m.pid: m.name for m in matches if m.pid not in cloaked}
+        if not procs:
+            return True
+        try:
+            records = self.cloak.cloak(procs)
+        except OSError as e:
+            self.logger.error(f"Could not cloak {sorted(set(procs.values()))}: {e}")
+            return False
+        self.cloaked.extend(records)
+        for record in records:
+            if record.pid in procs:
+                self.logger.info(f"Cloaked process: {record.name} ({record.pid})")
+        return procs.keys() <= {r.pid for r in records}
+    
+    def start_enforcement(self, **options) -> None:
+        """Keep killing target processes that start while ghost mode is on"""
+        if self.enforcement is None or not self.enforcement.running:
+            self.enforcement = EnforcementWatcher(self, **options)
+            self.enforcement.start()
+    
+    def stop_enforcement(self) -> dict:
+        """Stop the enforcement watcher and return its statistics"""
+        if self.enforcement is None:
+            return {}
+        self.enforcement.stop()
+        stats = self.enforcement.stats()
+        self.enforcement = None
+        return stats
+    
+    def restore_processes(self) -> bool:
+        """Thaw suspended processes, uncloak cloaked ones and relaunch the ones that were terminated"""
+        self.thawed = self.suspended
+        thaw_ok = self.suspender.resume(self.suspended) if self.suspended else True
+        self.suspended = []
+        self.uncloaked = self.cloaked
+        thaw_ok = (self.cloak.uncloak(self.cloaked) if self.cloaked else True) and thaw_ok
+        self.cloaked = []
+        self.logger.info(f"Processes to restore: {[r.app for r in self.launch_records]}")
+        self.last_restore = self.restorer.restore(self.launch_records)
+        for result in self.last_restore:
+            if not result.ok:
+                self.logger.warning(f"Could not restore {result.app}: {result.error}")
+        self.launch_records = []
         self.killed_processes = []
+        return thaw_ok and all(result.ok for result in self.last_restore)
     
     def is_process_running(self, process_name: str) -> bool:
         """Check if a specific process is running"""
+        matcher = ProcessMatcher([process_name])
         try:
             return any(
-                proc.info['name'].lower() == process_name.lower()
-                for proc in psutil.process_iter(['pid', 'name'])
+                matcher.match(info.name, info.exe, info.cmdline)
+                for info in self.scanner.scan(matcher.scan_attrs())
             )
         except Exception as e:
             self.logger.error(f"Error checking process status: {e}")
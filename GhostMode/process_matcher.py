@@ -0,0 +1,211 @@
+"""
+Process matching for Ghost Mode
+Compiles target rules into a single matcher built once per target list
+"""
+import fnmatch
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Rule prefixes understood in config/target_processes.txt. A bare entry is an
+# exact (case-insensitive) process name, or a glob if it contains wildcards.
+RULE_PREFIXES = ('glob:', 're:', 'exe:', 'cmd:')
+GLOB_CHARS = frozenset('*?[')
+# Optional trailing "@strategy" token choosing what happens to a match
+STRATEGIES = ('kill', 'freeze', 'cloak')
+DEFAULT_STRATEGY = 'kill'
+# Regex rules that cannot share the combined pattern: backreferences and
+# named groups change meaning once group numbers shift, and global inline
+# flags are only allowed at the very start of a pattern. False positives
+# (say an escaped backslash before a digit) only cost a separate regex.
+STANDALONE_RE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+REGEX_FLAGS = re.IGNORECASE | re.DOTALL
+
+
+def split_strategy(entry: str) -> tuple:
+    """Split a config entry into (rule, strategy)"""
+    entry = entry.strip()
+    head, _, last = entry.rpartition(' ')
+    if head and last.startswith('@') and last[1:].lower() in STRATEGIES:
+        return head.strip(), last[1:].lower()
+    return entry, DEFAULT_STRATEGY
+
+
+class ProcessMatcher:
+    """Precompiled index over target process rules
+
+    Exact names live in a frozenset so the common case costs one hash lookup.
+    Glob and regex name rules, exe-path rules and cmdline-substring rules are
+    each folded into one combined regex with a named group per rule, so a
+    process is checked with at most one regex pass per field. Regex rules
+    must match the whole name; cmdline rules match anywhere in the line.
+    The rare regex rule that cannot be folded (see STANDALONE_RE) is
+    compiled on its own; it still wins over later name rules.
+    """
+    def __init__(self, rules: Iterable[str] = ()):
+        self.rules: List[str] = []
+        self._exact = {}
+        name_parts, exe_parts, cmd_parts = [], [], []
+        self._groups = {}
+        standalone = []
+        seen = set()
+        for rule in rules:
+            rule = rule.strip()
+            if not rule or rule in seen:
+                continue
+            seen.add(rule)
+            self.rules.append(rule)
+            kind, value = self.parse_rule(rule)
+            if kind == 'name':
+                self._exact.setdefault(value.lower(), rule)
+                continue
+            if kind == 're' and STANDALONE_RE.search(value):
+                standalone.append((value, rule))
+                continue
+            group = f"r{len(self._groups)}"
+            self._groups[group] = rule
+            if kind == 'glob':
+                name_parts.append(f"(?P<{group}>{fnmatch.translate(value.lower())})")
+            elif kind == 're':
+                name_parts.append(f"(?P<{group}>(?:{value})\\Z)")
+            elif kind == 'exe':
+                exe_parts.append(f"(?P<{group}>{fnmatch.translate(value.lower())})")
+            elif kind == 'cmd':
+                cmd_parts.append(f"(?P<{group}>{re.escape(value)})")
+        self._compile(*(self._join(parts) for parts in (name_parts, exe_parts, cmd_parts)),
+                      standalone)
+
+    def _compile(self, name_pattern: Optional[str], exe_pattern: Optional[str],
+                 cmd_pattern: Optional[str], standalone: List[Tuple[str, str]] = ()) -> None:
+        self.exact_names = frozenset(self._exact)
+        self._patterns = (name_pattern, exe_pattern, cmd_pattern)
+        self._name_re, self._exe_re, self._cmd_re = (
+            None if pattern is None else re.compile(pattern, REGEX_FLAGS)
+            for pattern in self._patterns
+        )
+        self._standalone = list(standalone)
+        # Position of each rule, so a standalone rule only wins over later ones
+        self._order = {rule: n for n, rule in enumerate(self.rules)}
+        self._standalone_re = [(re.compile(value, REGEX_FLAGS), rule) for value, rule in standalone]
+
+    def to_state(self) -> dict:
+        """Everything parsing produced, as JSON-compatible data"""
+        return {'rules': self.rules, 'exact': self._exact, 'groups': self._groups,
+                'patterns': list(self._patterns), 'standalone': self._standalone}
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'ProcessMatcher':
+        """Rebuild a matcher from to_state() without parsing any rule"""
+        matcher = cls.__new__(cls)
+        matcher.rules = list(state['rules'])
+        matcher._exact = dict(state['exact'])
+        matcher._groups = dict(state['groups'])
+        matcher._compile(*state['patterns'], [tuple(pair) for pair in state['standalone']])
+        return matcher
+
+    @staticmethod
+    def parse_rule(rule: str) -> tuple:
+        """Split a rule into (kind, value)"""
+        for prefix in RULE_PREFIXES:
+            if rule.startswith(prefix):
+                return prefix[:-1], rule[len(prefix):].strip()
+        if GLOB_CHARS.intersection(rule):
+            return 'glob', rule
+        return 'name', rule
+
+    @classmethod
+    def check_rule(cls, rule: str) -> None:
+        """Raise ValueError if a rule could not be compiled into a matcher"""
+        kind, value = cls.parse_rule(rule.strip())
+        if kind == 're':
+            try:
+                re.compile(value if STANDALONE_RE.search(value) else f"(?:{value})\\Z")
+            except re.error as e:
+                raise ValueError(f"invalid regex in {rule!r}: {e}") from None
+
+    @staticmethod
+    def _join(parts: List[str]) -> Optional[str]:
+        return '|'.join(parts) if parts else None
+
+    @property
+    def needs_exe(self) -> bool:
+        """Whether any rule inspects the executable path"""
+        return self._exe_re is not None
+
+    @property
+    def needs_cmdline(self) -> bool:
+        """Whether any rule inspects the command line"""
+        return self._cmd_re is not None
+
+    def scan_attrs(self) -> List[str]:
+        """Process attributes a scan must collect for these rules"""
+        attrs = ['pid', 'name']
+        if self.needs_exe:
+            attrs.append('exe')
+        if self.needs_cmdline:
+            attrs.append('cmdline')
+        return attrs
+
+    def match(self, name: Optional[str], exe: Optional[str] = None,
+              cmdline=None) -> Optional[str]:
+        """Return the rule matching a process, or None"""
+        if name:
+            lowered = name.lower()
+            rule = self._exact.get(lowered)
+            if rule is not None:
+                return rule
+            if self._name_re is not None:
+                m = self._name_re.match(lowered)
+                rule = self._groups[m.lastgroup] if m else None
+            for pattern, standalone in self._standalone_re:
+                if rule is not None and self._order[standalone] > self._order[rule]:
+                    break
+                if pattern.fullmatch(lowered):
+                    return standalone
+            if rule is not None:
+                return rule
+        if exe and self._exe_re is not None:
+            m = self._exe_re.match(exe.lower())
+            if m:
+                return self._groups[m.lastgroup]
+        if cmdline and self._cmd_re is not None:
+            if not isinstance(cmdline, str):
+                cmdline = ' '.join(cmdline)
+            m = self._cmd_re.search(cmdline)
+            if m:
+                return self._groups[m.lastgroup]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+
+class TargetSet(NamedTuple):
+    """Target rules in config order, the strategy of each, and their matcher
+
+    ProcessManager swaps the whole set in one assignment, so a scan never
+    pairs one list's matcher with another list's strategies.
+    """
+    rules: List[str]
+    strategies: Dict[str, str]
+    matcher: ProcessMatcher
+
+    @classmethod
+    def compile(cls, entries: Iterable[str]) -> 'TargetSet':
+        """Parse config entries, each a rule with an optional @strategy"""
+        rules, strategies = [], {}
+        for entry in entries:
+            rule, strategy = split_strategy(entry)
+            rules.append(rule)
+            strategies[rule] = strategy
+        return cls(rules, strategies, ProcessMatcher(rules))
+
+    def to_state(self) -> dict:
+        return {'rules': self.rules, 'strategies': self.strategies, 'matcher': self.matcher.to_state()}
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'TargetSet':
+        return cls(list(state['rules']), dict(state['strategies']),
+                   ProcessMatcher.from_state(state['matcher']))
@@ -0,0 +1,276 @@
+"""
+Target profiles for Ghost Mode
+Named profiles in config/profiles.ini choose the target rules, which
+protections activation applies and how MAC addresses are randomized. The
+config directory is watched so edits apply without a restart (the
+enforcement watcher re-applies them while ghost mode is on), and
+compiled target sets are cached on disk by a hash of their rules.
+"""
+import configparser
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from mac_address import parse_prefix
+from process_matcher import ProcessMatcher, TargetSet, split_strategy
+from reconcile import PROTECTIONS
+from tracing import count, span
+
+PROFILES_FILE = 'profiles.ini'
+CACHE_FILE = 'ghost_mode_targets.cache'
+DEFAULT_PROFILE = 'default'
+CACHE_VERSION = 2
+
+
+class Profile(NamedTuple):
+    """A named choice of target entries, protections and MAC settings"""
+    name: str
+    targets: Tuple[str, ...]
+    protections: Tuple[str, ...] = PROTECTIONS
+    # Links to randomize; empty means every physical one
+    mac_interfaces: Tuple[str, ...] = ()
+    mac_prefix: str = ''
+
+    @property
+    def key(self) -> str:
+        """Checksum of the target entries; profiles sharing a list share its compiled form
+
+        CRC-32 rather than a cryptographic hash, since hashlib alone would
+        add milliseconds to every CLI start; cache lookups compare the
+        stored entries, so a collision only costs a recompile.
+        """
+        data = '\n'.join(self.targets).encode()
+        return f"{zlib.crc32(data):08x}-{len(data)}"
+
+
+def read_target_file(path: str) -> List[str]:
+    """Entries of a target list file, skipping blank lines and comments"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def check_targets(targets: Tuple[str, ...], where: str) -> Tuple[str, ...]:
+    """Return targets, or raise ValueError naming where the first invalid entry is"""
+    for entry in targets:
+        try:
+            ProcessMatcher.check_rule(split_strategy(entry)[0])
+        except ValueError as e:
+            raise ValueError(f"{where}: {e}") from None
+    return targets
+
+
+def parse_profiles(path: str, sources: List[str] = None) -> Dict[str, Profile]:
+    """Parse profiles.ini; raises ValueError or OSError if it is invalid
+
+    Each section is a profile. targets_file names target lists relative to
+    the file, targets lists entries inline, one per line; both use the
+    target_processes.txt syntax. Keys in [DEFAULT] apply to every profile.
+    The target list files read are appended to sources.
+    """
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        with open(path) as f:
+            parser.read_file(f)
+    except configparser.Error as e:
+        raise ValueError(f"{path}: {e}") from e
+    base = os.path.dirname(path)
+    profiles = {}
+    for name in parser.sections():
+        section = parser[name]
+        targets = []
+        for file_name in section.get('targets_file', '').split():
+            file_path = os.path.join(base, file_name)
+            if sources is not None:
+                sources.append(file_path)
+            targets += read_target_file(file_path)
+        targets += [line.strip() for line in section.get('targets', '').splitlines() if line.strip()]
+        protections = tuple(section.get('protections', ' '.join(PROTECTIONS)).split())
+        unknown = set(protections) - set(PROTECTIONS)
+        if unknown:
+            raise ValueError(f"profile {name!r}: unknown protections {sorted(unknown)}; "
+                             f"expected some of {PROTECTIONS}")
+        prefix = section.get('mac_prefix', '').strip()
+        try:
+            if prefix:
+                parse_prefix(prefix)
+        except ValueError:
+            raise ValueError(f"profile {name!r}: mac_prefix {prefix!r} is not 1 to 5 colon-separated "
+                             f"hex octets") from None
+        profiles[name] = Profile(name, check_targets(tuple(targets), f"profile {name!r}"), protections,
+                                 tuple(section.get('mac_interfaces', '').split()), prefix)
+    if not profiles:
+        raise ValueError(f"{path}: no profiles defined")
+    return profiles
+
+
+class TargetCache:
+    """Compiled TargetSets kept in memory and in a JSON file, keyed by Profile.key
+
+    A set found in the file is rebuilt without parsing any rule; only its
+    combined regexes are compiled again. The file holds the max_entries
+    most recently added sets and is replaced atomically on each addition.
+    """
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = 16):
+        self.path = path
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+        self._memory: Dict[str, TargetSet] = {}
+        self._entries: Optional[Dict[str, dict]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self._entries = data['entries']
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                self.logger.warning(f"Ignoring unreadable target cache {self.path}: {e}")
+        return self._entries
+
+    def _save(self) -> None:
+        entries = self._load()
+        while len(entries) > self.max_entries:
+            del entries[next(iter(entries))]
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(prefix='.ghost_targets.', dir=os.path.dirname(os.path.abspath(self.path)))
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'entries': entries}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            # The cache only saves time; running without it is fine
+            self.logger.warning(f"Could not write target cache {self.path}: {e}")
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def get(self, profile: Profile) -> TargetSet:
+        key = profile.key
+        with self._lock:
+            targets = self._memory.get(key)
+            if targets is not None:
+                count('target_cache', result='memory')
+                return targets
+            state = self._load().get(key)
+            if state is not None and state.get('entries') != list(profile.targets):
+                state = None
+            if state is not None:
+                try:
+                    with span('targets', op='load'):
+                        targets = TargetSet.from_state(state)
+                    count('target_cache', result='disk')
+                except (KeyError, TypeError, ValueError, re.error) as e:
+                    self.logger.warning(f"Discarding cached targets of profile {profile.name}: {e}")
+            if targets is None:
+                count('target_cache', result='miss')
+                with span('targets', op='compile'):
+                    targets = TargetSet.compile(profile.targets)
+                self._entries[key] = dict(targets.to_state(), entries=list(profile.targets))
+                self._save()
+            if len(self._memory) >= self.max_entries:
+                del self._memory[next(iter(self._memory))]
+            self._memory[key] = targets
+            return targets
+
+
+class ProfileStore:
+    """Profiles from profiles.ini, reloaded when their files change
+
+    Without profiles.ini there is one profile, 'default', that applies
+    every protection to the entries of targets_path. A reload parses into
+    a new dict and swaps it in with one assignment; if the new file is
+    invalid, the profiles loaded before stay in use. With watch=True the
+    directories holding the files are watched (inotify where available)
+    and refresh() reloads only after a change.
+    """
+    def __init__(self, path: str, targets_path: str, cache: TargetCache = None, watch: bool = True):
+        self.path = path
+        self.targets_path = targets_path
+        self.cache = cache or TargetCache()
+        self.watch = watch
+        self.logger = logging.getLogger(__name__)
+        self.profiles: Dict[str, Profile] = {}
+        self.reloads = 0
+        self.watcher = None  # fs_watch.ChangeWatcher while watching
+        self._watched: List[str] = []
+        # refresh() runs from the enforcement thread as well as the caller's
+        self._lock = threading.RLock()
+        self.reload()
+
+    def _read(self, sources: List[str]) -> Dict[str, Profile]:
+        if os.path.exists(self.path):
+            return parse_profiles(self.path, sources)
+        targets = check_targets(tuple(read_target_file(self.targets_path)), self.targets_path)
+        return {DEFAULT_PROFILE: Profile(DEFAULT_PROFILE, targets)}
+
+    def _watch(self, paths: List[str]) -> None:
+        # Directories catch editors that save by renaming a new file into
+        # place; the files themselves catch in-place writes when polling mtimes
+        files = {os.path.abspath(p) for p in paths}
+        watched = sorted(files | {os.path.dirname(p) for p in files})
+        if watched == self._watched:
+            return
+        # Only long-lived callers watch, so one-shot ones skip loading ctypes
+        from fs_watch import ChangeWatcher
+        if self.watcher is not None:
+            self.watcher.close()
+        self.watcher = ChangeWatcher(watched)
+        self._watched = watched
+
+    def reload(self) -> bool:
+        """Parse the files again; True if any profile changed"""
+        with self._lock:
+            sources = [self.path, self.targets_path]
+            try:
+                with span('profiles', op='parse'):
+                    profiles = self._read(sources)
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Keeping previous profiles; could not load {self.path}: {e}")
+                if not self.profiles:
+                    self.profiles = {DEFAULT_PROFILE: Profile(DEFAULT_PROFILE, ())}
+                return False
+            finally:
+                if self.watch:
+                    self._watch(sources)
+            if profiles == self.profiles:
+                return False
+            self.profiles = profiles
+            self.reloads += 1
+            self.logger.info(f"Loaded profiles: {sorted(profiles)}")
+            return True
+
+    def refresh(self) -> bool:
+        """Reload if a watched directory changed since the last call"""
+        with self._lock:
+            if self.watcher is None or not self.watcher.changed():
+                return False
+            return self.reload()
+
+    def default(self) -> str:
+        profiles = self.profiles
+        return DEFAULT_PROFILE if DEFAULT_PROFILE in profiles else next(iter(profiles), DEFAULT_PROFILE)
+
+    def get(self, name: str = None) -> Profile:
+        """The named profile, or the default one; raises KeyError if unknown"""
+        profiles = self.profiles
+        name = name or self.default()
+        if name not in profiles:
+            raise KeyError(f"unknown profile {name!r}; expected one of {sorted(profiles)}")
+        return profiles[name]
+
+    def targets(self, profile: Profile) -> TargetSet:
+        return self.cache.get(profile)
+
+    def close(self) -> None:
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
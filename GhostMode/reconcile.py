@@ -0,0 +1,339 @@
+"""
+Desired-state reconciliation for Ghost Mode
+Applies only the protections that are not already in effect and journals
+the resulting state so a restarted app can resume without re-probing
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from orchestrator import Stage, build_activation_stages, build_deactivation_stages
+from tracing import span
+
+WEBCAM = 'webcam'
+MICROPHONE = 'microphone'
+PROCESSES = 'processes'
+LOCATION = 'location'
+PROTECTIONS = (WEBCAM, MICROPHONE, PROCESSES, LOCATION)
+
+PROBE = 'probe'
+JOURNAL = 'journal'
+UNKNOWN = 'unknown'
+
+
+class Protection(NamedTuple):
+    """A piece of ghost mode state
+
+    observe returns True if the protection is in effect, False if not, or
+    None when it cannot tell. Protections without an observer rely on the
+    journal alone; volatile ones are probed on every reconcile.
+    """
+    name: str
+    observe: Optional[Callable[[], Optional[bool]]] = None
+    volatile: bool = False
+
+
+class Action(NamedTuple):
+    """A stage and the protection states it establishes when it succeeds"""
+    stage: Stage
+    effects: Dict[str, bool]
+
+
+def current_boot_id() -> str:
+    """Identifies this boot so journaled device state is not trusted across reboots"""
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            return f.read().strip()
+    except OSError:
+        import psutil
+        return str(int(psutil.boot_time()))
+
+
+class StateJournal:
+    """Last known protection states, stage durations and metrics, persisted as JSON
+
+    Writes go to a temporary file that replaces the journal atomically, so
+    a crash mid-write leaves the previous journal intact.
+    """
+    def __init__(self, path: str = 'ghost_mode_state.json', boot_id: str = None,
+                 alpha: float = 0.3):
+        self.path = path
+        self.boot_id = boot_id or current_boot_id()
+        self.alpha = alpha
+        self.state: Dict[str, dict] = {}
+        self.durations: Dict[str, float] = {}
+        # Free-form data a later process needs to undo this one's work
+        self.session: dict = {}
+        # Accumulated measurements such as latency histograms, kept across boots
+        self.metrics: Dict[str, dict] = {}
+        self.logger = logging.getLogger(__name__)
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable state journal {self.path}: {e}")
+            return
+        self.durations = {k: float(v) for k, v in data.get('durations', {}).items()}
+        self.metrics = data.get('metrics', {})
+        # Device and process state does not survive a reboot; durations do
+        if data.get('boot_id') == self.boot_id:
+            self.state = data.get('state', {})
+            self.session = data.get('session', {})
+
+    def save(self) -> None:
+        data = {'boot_id': self.boot_id, 'updated': time.time(), 'state': self.state,
+                'durations': self.durations, 'session': self.session, 'metrics': self.metrics}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix='.ghost_state.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.logger.error(f"Could not write state journal {self.path}: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def get(self, name: str, max_age: float = None) -> Optional[bool]:
+        entry = self.state.get(name)
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry['at'] > max_age:
+            return None
+        return entry['value']
+
+    def set(self, name: str, value: Optional[bool]) -> None:
+        if value is None:
+            self.state.pop(name, None)
+        else:
+            self.state[name] = {'value': value, 'at': time.time()}
+
+    def record_duration(self, key: str, elapsed: float) -> None:
+        previous = self.durations.get(key)
+        self.durations[key] = elapsed if previous is None else (
+            self.alpha * elapsed + (1 - self.alpha) * previous
+        )
+
+    def estimate(self, key: str) -> float:
+        return self.durations.get(key, 0.0)
+
+
+class ReconcileReport:
+    """Pipeline outcome plus what reconciliation skipped
+
+    Offers the same ok/stage_ok/context/to_records interface as
+    PipelineResult; skipped stages count as successful.
+    """
+    def __init__(self, kind: str, desired: Dict[str, bool], observed: Dict[str, Optional[bool]],
+                 sources: Dict[str, str], skipped: List[str], saved: float, pipeline):
+        self.kind = kind
+        self.desired = desired
+        self.observed = observed
+        self.sources = sources
+        self.skipped = skipped
+        self.saved = saved
+        self.pipeline = pipeline
+        self.context = pipeline.context
+        self.results = pipeline.results
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.pipeline.ok
+
+    def stage_ok(self, name: str) -> bool:
+        return name in self.skipped or self.pipeline.stage_ok(name)
+
+    def to_records(self) -> List[dict]:
+        records = self.pipeline.to_records()
+        records.extend({'name': name, 'ok': True, 'skipped': True} for name in self.skipped)
+        return records
+
+    def summary(self) -> dict:
+        return {
+            'kind': self.kind,
+            'ran': list(self.pipeline.results),
+            'skipped': self.skipped,
+            'estimated_saved': round(self.saved, 3),
+            'elapsed': round(self.elapsed, 3),
+            'sources': self.sources,
+        }
+
+    def to_dict(self) -> dict:
+        """Summary plus outcome and per-stage records, for JSON output"""
+        data = self.summary()
+        data['ok'] = self.ok
+        data['stages'] = self.to_records()
+        if 'panic' in self.context:
+            data['panic'] = self.context['panic']
+        return data
+
+
+class Reconciler:
+    """Diffs observed protection state against desired state and runs only the difference
+
+    Journaled state from the current boot stands in for a probe if it is
+    younger than trust_window seconds, or indefinitely for protections that
+    cannot be observed at all.
+    """
+    def __init__(self, orchestrator, journal: StateJournal, protections: List[Protection],
+                 trust_window: float = 60.0):
+        self.orchestrator = orchestrator
+        self.journal = journal
+        self.protections = {p.name: p for p in protections}
+        self.trust_window = trust_window
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def observe(self, names) -> Tuple[Dict[str, Optional[bool]], Dict[str, str]]:
+        observed, sources = {}, {}
+        for name in names:
+            protection = self.protections[name]
+            if not protection.volatile:
+                max_age = None if protection.observe is None else self.trust_window
+                value = self.journal.get(name, max_age)
+                if value is not None:
+                    observed[name], sources[name] = value, JOURNAL
+                    continue
+            if protection.observe is None:
+                observed[name], sources[name] = None, UNKNOWN
+                continue
+            try:
+                with span('observe', protection=name):
+                    observed[name] = protection.observe()
+            except Exception as e:
+                self.logger.warning(f"Could not observe {name}: {e}")
+                observed[name] = None
+            sources[name] = PROBE if observed[name] is not None else UNKNOWN
+        return observed, sources
+
+    def reconcile(self, kind: str, desired: Dict[str, bool], actions: List[Action],
+                  on_progress=None, context: dict = None) -> ReconcileReport:
+        """Run the actions whose effects are still missing"""
+        with self._lock:
+            start = time.monotonic()
+            observed, sources = self.observe(desired)
+            return self._apply(kind, desired, actions, observed, sources, on_progress, context, start)
+
+    def apply(self, kind: str, desired: Dict[str, bool], actions: List[Action],
+              observed: Dict[str, Optional[bool]], sources: Dict[str, str],
+              on_progress=None, context: dict = None) -> ReconcileReport:
+        """Reconcile against state observed earlier, e.g. by an armed panic plan"""
+        with self._lock:
+            return self._apply(kind, desired, actions, observed, sources, on_progress, context,
+                               time.monotonic())
+
+    def _apply(self, kind, desired, actions, observed, sources, on_progress, context,
+               start: float) -> ReconcileReport:
+        missing = {name for name, value in desired.items() if observed[name] != value}
+        to_run, skipped = [], []
+        for action in actions:
+            if any(name in missing and desired[name] == value
+                   for name, value in action.effects.items()):
+                to_run.append(action)
+            else:
+                skipped.append(action.stage.name)
+        saved = sum(self.journal.estimate(f"{kind}.{name}") for name in skipped)
+        pipeline = self.orchestrator.run(kind, [a.stage for a in to_run], on_progress, context)
+
+        for name, value in observed.items():
+            if sources[name] == PROBE:
+                self.journal.set(name, value)
+        for action in to_run:
+            result = pipeline.results[action.stage.name]
+            for name, value in action.effects.items():
+                # A failed stage leaves its protections in an unknown state
+                self.journal.set(name, value if result.ok else None)
+            if not result.timed_out:
+                self.journal.record_duration(f"{kind}.{action.stage.name}", result.elapsed)
+        self.journal.save()
+
+        report = ReconcileReport(kind, desired, observed, sources, skipped, saved, pipeline)
+        report.elapsed = time.monotonic() - start
+        self.logger.info(f"Reconciled {kind}: {report.summary()}")
+        return report
+
+    def reconcile_async(self, kind: str, desired: Dict[str, bool], actions: List[Action],
+                        on_progress=None, on_finished: Callable[[ReconcileReport], None] = None,
+                        context: dict = None) -> threading.Thread:
+        """Reconcile on its own thread and hand the report to on_finished"""
+        def runner():
+            report = self.reconcile(kind, desired, actions, on_progress, context)
+            if on_finished:
+                on_finished(report)
+        thread = threading.Thread(target=runner, name=f'ghost-reconcile-{kind}', daemon=True)
+        thread.start()
+        return thread
+
+
+def build_protections(hardware, process_manager, location_service,
+                      enforce: bool = True) -> List[Protection]:
+    """Observers for each protection ghost mode manages
+
+    With enforce=False the process protection only requires that no target
+    is running, since no watcher outlives a one-shot activation.
+    """
+    def processes():
+        # Targets can respawn at any time, so this is probed on every reconcile
+        enforcing = process_manager.enforcement is not None and process_manager.enforcement.running
+        if (enforcing or not enforce) and not process_manager.snapshot():
+            return True
+        pending = process_manager.launch_records or process_manager.suspended or process_manager.cloaked
+        if not enforcing and not pending:
+            return False
+        return None
+
+    def location():
+        value = location_service.get_current_location()[0]
+        return None if value is None else value == 0
+
+    return [
+        Protection(WEBCAM, hardware.check_webcam_status),
+        Protection(MICROPHONE, hardware.check_microphone_status),
+        Protection(PROCESSES, processes, volatile=True),
+        # A randomized MAC cannot be told apart from the original; trust the journal
+        Protection(LOCATION, location if hardware.os_type == 'Windows' else None),
+    ]
+
+
+def build_activation_actions(hardware, process_manager, location_service, context: dict,
+                             timeouts: Dict[str, float] = None, enforce: bool = True,
+                             plan=None) -> List[Action]:
+    stages = {s.name: s for s in build_activation_stages(
+        hardware, process_manager, location_service, context, timeouts, enforce, plan
+    )}
+    return [
+        Action(stages['webcam'], {WEBCAM: True}),
+        Action(stages['microphone'], {MICROPHONE: True}),
+        Action(stages['processes'], {PROCESSES: True}),
+        Action(stages['location'], {LOCATION: True}),
+    ]
+
+
+def build_deactivation_actions(hardware, process_manager, location_service, context: dict,
+                               timeouts: Dict[str, float] = None) -> List[Action]:
+    stages = {s.name: s for s in build_deactivation_stages(
+        hardware, process_manager, location_service, context, timeouts
+    )}
+    return [
+        Action(stages['hardware'], {WEBCAM: False, MICROPHONE: False}),
+        Action(stages['processes'], {PROCESSES: False}),
+        Action(stages['location'], {LOCATION: False}),
+    ]
+
+
+def desired_state(active: bool, protections: Tuple[str, ...] = PROTECTIONS) -> Dict[str, bool]:
+    return {name: active for name in protections}
@@ -0,0 +1,214 @@
+"""
+Registry access for Ghost Mode
+Caches open key handles and values in front of winreg, writes through to
+the backend, and can batch writes into one transaction. An in-memory
+backend with the same interface as winreg lets registry code run on Linux.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from tracing import count, span
+
+HKEY_LOCAL_MACHINE = 0x80000002
+KEY_READ = 0x20019
+KEY_WRITE = 0x20006
+REG_DWORD = 4
+
+_MISSING = object()
+
+
+def winreg_backend():
+    """The real winreg module; it only exists on Windows, so import it on first use"""
+    import winreg
+    return winreg
+
+
+class MemoryRegistryBackend:
+    """In-memory stand-in for the winreg functions Registry uses
+
+    keys maps a key path to {value name: (value, type)}; only listed keys
+    can be opened, as with an existing key on Windows.
+    """
+    HKEY_LOCAL_MACHINE = HKEY_LOCAL_MACHINE
+    KEY_READ = KEY_READ
+    KEY_WRITE = KEY_WRITE
+    REG_DWORD = REG_DWORD
+
+    def __init__(self, keys: Dict[str, Dict[str, tuple]] = None):
+        self.keys = {path: dict(values) for path, values in (keys or {}).items()}
+        self.operations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, op: str) -> None:
+        with self._lock:
+            self.operations[op] = self.operations.get(op, 0) + 1
+
+    def OpenKey(self, root, path: str, reserved: int = 0, access: int = KEY_READ) -> Tuple[str, int]:
+        self._call('open')
+        if path not in self.keys:
+            raise FileNotFoundError(2, 'The system cannot find the file specified', path)
+        return path, access
+
+    def CloseKey(self, key) -> None:
+        with self._lock:
+            self.operations['close'] = self.operations.get('close', 0) + 1
+
+    def SetValueEx(self, key, name: str, reserved: int, type_: int, value) -> None:
+        self._call('set')
+        path, access = key
+        # KEY_WRITE shares its STANDARD_RIGHTS bit with KEY_READ
+        if not access & (KEY_WRITE & ~KEY_READ):
+            raise PermissionError(5, 'Access is denied')
+        with self._lock:
+            self.keys[path][name] = (value, type_)
+
+    def QueryValueEx(self, key, name: str) -> tuple:
+        self._call('query')
+        try:
+            return self.keys[key[0]][name]
+        except KeyError:
+            raise FileNotFoundError(2, 'The system cannot find the file specified', name)
+
+
+class Registry:
+    """Cached, transactional access to registry values under one root
+
+    Each key is opened once, for reading and writing if allowed, and the
+    handle is kept until close(). Values read are cached for ttl seconds,
+    since other programs (such as the Settings app) may change them; writes
+    go straight to the backend and update the cache. Inside transaction(),
+    writes are buffered, visible to reads, and flushed together on exit;
+    other threads wait for the flush rather than see a partial batch.
+    """
+    def __init__(self, backend=None, root: int = HKEY_LOCAL_MACHINE, ttl: float = 2.0):
+        self._backend = backend
+        self.root = root
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._handles: Dict[str, Tuple[object, bool]] = {}
+        self._values: Dict[Tuple[str, str], Tuple[float, object]] = {}
+        self._pending: Optional[Dict[Tuple[str, str], Tuple[object, int]]] = None
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = winreg_backend()
+        return self._backend
+
+    def _open(self, path: str, write: bool):
+        """A cached handle to path, reopened for writing if a read-only one is cached"""
+        cached = self._handles.get(path)
+        if cached is not None and (cached[1] or not write):
+            return cached[0]
+        backend = self.backend
+        with span('registry', op='open'):
+            try:
+                handle = backend.OpenKey(self.root, path, 0, backend.KEY_READ | backend.KEY_WRITE)
+                writable = True
+            except PermissionError:
+                if write:
+                    raise
+                # Unelevated: reads still work, writes will fail when tried
+                handle = backend.OpenKey(self.root, path, 0, backend.KEY_READ)
+                writable = False
+        if cached is not None:
+            backend.CloseKey(cached[0])
+        self._handles[path] = (handle, writable)
+        return handle
+
+    def open(self, path: str) -> bool:
+        """Open path ahead of time; True if the handle allows writes"""
+        with self._lock:
+            self._open(path, False)
+            return self._handles[path][1]
+
+    def get(self, path: str, name: str, default=None):
+        with self._lock:
+            if self._pending is not None and (path, name) in self._pending:
+                return self._pending[(path, name)][0]
+            cached = self._values.get((path, name))
+            now = time.monotonic()
+            if cached is not None and now - cached[0] < self.ttl:
+                count('registry_cache', result='hit')
+                value = cached[1]
+            else:
+                count('registry_cache', result='miss')
+                handle = self._open(path, False)
+                try:
+                    with span('registry', op='query'):
+                        value = self.backend.QueryValueEx(handle, name)[0]
+                except FileNotFoundError:
+                    value = _MISSING
+                self._values[(path, name)] = (now, value)
+        return default if value is _MISSING else value
+
+    def set(self, path: str, name: str, value, type_: int = REG_DWORD) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending[(path, name)] = (value, type_)
+                return
+            self._write(path, [(name, value, type_)])
+
+    def _write(self, path: str, values: List[tuple]) -> None:
+        try:
+            handle = self._open(path, True)
+            with span('registry', op='set'):
+                for name, value, type_ in values:
+                    self.backend.SetValueEx(handle, name, 0, type_, value)
+                    self._values[(path, name)] = (time.monotonic(), value)
+        except Exception:
+            # Part of the batch may have landed; read back rather than guess
+            for name, _, _ in values:
+                self._values.pop((path, name), None)
+            raise
+
+    @contextmanager
+    def transaction(self):
+        """Buffer writes and flush them together, one handle per key
+
+        Nested transactions join the outermost one. If the block raises,
+        the buffered writes are discarded.
+        """
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1:
+                self._pending = {}
+            try:
+                yield self
+            except BaseException:
+                if self._depth == 1:
+                    self._pending = None
+                raise
+            finally:
+                self._depth -= 1
+            if self._depth == 0:
+                pending, self._pending = self._pending, None
+                by_key: Dict[str, List[tuple]] = {}
+                for (path, name), (value, type_) in pending.items():
+                    by_key.setdefault(path, []).append((name, value, type_))
+                for path, values in by_key.items():
+                    self._write(path, values)
+
+    def invalidate(self, path: str = None) -> None:
+        """Forget cached values, all of them or those under path"""
+        with self._lock:
+            if path is None:
+                self._values.clear()
+            else:
+                for key in [key for key in self._values if key[0] == path]:
+                    del self._values[key]
+
+    def close(self) -> None:
+        with self._lock:
+            handles, self._handles = self._handles, {}
+            self._values.clear()
+            for handle, _ in handles.values():
+                try:
+                    self.backend.CloseKey(handle)
+                except OSError as e:
+                    self.logger.warning(f"Could not close registry key: {e}")
@@ -0,0 +1,153 @@
+"""
+Process restoration for Ghost Mode
+Captures launch records before termination and relaunches them afterwards
+"""
+import getpass
+import logging
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import psutil
+
+from tracing import span
+
+# Environment variables a desktop app needs to come back in the same session
+ENV_ALLOWLIST = frozenset({
+    'PATH', 'HOME', 'USER', 'LOGNAME', 'SHELL', 'LANG', 'LANGUAGE',
+    'DISPLAY', 'WAYLAND_DISPLAY', 'XAUTHORITY', 'DBUS_SESSION_BUS_ADDRESS',
+    'XDG_RUNTIME_DIR', 'XDG_SESSION_TYPE', 'XDG_CURRENT_DESKTOP',
+    'XDG_DATA_DIRS', 'XDG_CONFIG_DIRS', 'PULSE_SERVER',
+    'SYSTEMROOT', 'APPDATA', 'LOCALAPPDATA', 'USERPROFILE', 'TEMP', 'TMP',
+})
+ENV_PREFIXES = ('LC_',)
+
+
+class LaunchRecord(NamedTuple):
+    """Everything needed to start an application again"""
+    app: str
+    exe: Optional[str]
+    cmdline: List[str]
+    cwd: Optional[str]
+    env: Dict[str, str]
+    username: Optional[str]
+    pid: int
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LaunchRecord':
+        return cls(**{field: data.get(field) for field in cls._fields})
+
+
+class RestoreResult(NamedTuple):
+    """Outcome of relaunching one application"""
+    app: str
+    ok: bool
+    pid: Optional[int]
+    elapsed: float
+    error: Optional[str] = None
+
+
+def filter_environment(environ: Optional[dict]) -> Dict[str, str]:
+    """Keep only the session variables an application needs"""
+    if not environ:
+        return {}
+    return {
+        key: value for key, value in environ.items()
+        if key in ENV_ALLOWLIST or key.startswith(ENV_PREFIXES)
+    }
+
+
+def inspect_process(pid: int, attrs: List[str]) -> dict:
+    """Launch details of a live process; raises psutil.NoSuchProcess once it exits"""
+    return psutil.Process(pid).as_dict(attrs)
+
+
+def capture_launch_records(matches: Iterable, logger=None, inspect=inspect_process) -> List[LaunchRecord]:
+    """Capture one launch record per application from matched processes
+
+    Matches are grouped by executable (or name) and only the top-most
+    process of each group is inspected, so an app with dozens of helper
+    processes yields a single record and a single relaunch.
+    """
+    logger = logger or logging.getLogger(__name__)
+    matches = list(matches)
+    matched_pids = {m.pid for m in matches}
+    groups = {}
+    for m in matches:
+        key = m.exe or m.name
+        current = groups.get(key)
+        # Prefer a process whose parent is not itself part of the app
+        if current is None or (current.ppid in matched_pids and m.ppid not in matched_pids):
+            groups[key] = m
+
+    records = []
+    with span('launch_capture'):
+        for key, m in groups.items():
+            try:
+                info = inspect(m.pid, ['exe', 'cmdline', 'cwd', 'environ', 'username'])
+            except psutil.NoSuchProcess:
+                continue
+            cmdline = info.get('cmdline') or []
+            exe = info.get('exe') or m.exe
+            if not cmdline and not exe:
+                logger.warning(f"No launch information for {m.name} ({m.pid})")
+                continue
+            records.append(LaunchRecord(
+                os.path.basename(exe) if exe else m.name, exe, cmdline, info.get('cwd'),
+                filter_environment(info.get('environ')), info.get('username'), m.pid
+            ))
+    return records
+
+
+class ProcessRestorer:
+    """Relaunches applications concurrently through a bounded worker pool"""
+    def __init__(self, max_workers: int = 4, settle_time: float = 0.2):
+        self.max_workers = max_workers
+        self.settle_time = settle_time
+        self.logger = logging.getLogger(__name__)
+
+    def _launch_options(self, record: LaunchRecord) -> dict:
+        options = {
+            'stdin': subprocess.DEVNULL,
+            'stdout': subprocess.DEVNULL,
+            'stderr': subprocess.DEVNULL,
+            'env': record.env or None,
+        }
+        if record.cwd and os.path.isdir(record.cwd):
+            options['cwd'] = record.cwd
+        if os.name == 'posix':
+            options['start_new_session'] = True
+            # When elevated, hand the app back to the user who owned it
+            if os.geteuid() == 0 and record.username and record.username != getpass.getuser():
+                options['user'] = record.username
+        return options
+
+    def launch(self, record: LaunchRecord) -> RestoreResult:
+        """Start one application and confirm it survives the settle time"""
+        start = time.monotonic()
+        try:
+            proc = subprocess.Popen(record.cmdline or [record.exe], **self._launch_options(record))
+            elapsed = time.monotonic() - start
+            try:
+                code = proc.wait(self.settle_time)
+            except subprocess.TimeoutExpired:
+                code = None
+            ok = code in (None, 0)
+            error = None if ok else f"exited with {code}"
+            self.logger.info(f"Restored {record.app} as {proc.pid} in {elapsed:.3f}s")
+            return RestoreResult(record.app, ok, proc.pid, elapsed, error)
+        except Exception as e:
+            self.logger.error(f"Error restoring {record.app}: {e}")
+            return RestoreResult(record.app, False, None, time.monotonic() - start, str(e))
+
+    def restore(self, records: List[LaunchRecord]) -> List[RestoreResult]:
+        """Relaunch all records concurrently"""
+        if not records:
+            return []
+        with span('restore'), ThreadPoolExecutor(max_workers=min(self.max_workers, len(records))) as pool:
+            return list(pool.map(self.launch, records))
@@ -0,0 +1,150 @@
+"""
+Latency statistics for Ghost Mode
+Small in-process summaries used to report timing of background work
+"""
+import bisect
+import threading
+from collections import deque
+from typing import NamedTuple
+
+
+class LatencyStats:
+    """Running latency summary with percentiles over recent samples"""
+    def __init__(self, window: int = 1024):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile over the retained window"""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+        return ordered[rank]
+
+    def summary(self) -> dict:
+        """Summary in milliseconds"""
+        return {
+            'count': self.count,
+            'min_ms': (self.min or 0.0) * 1000,
+            'mean_ms': self.mean * 1000,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': (self.max or 0.0) * 1000,
+        }
+
+
+# Upper bounds in seconds; samples above the last bound land in an overflow bucket
+DEFAULT_BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram that can be persisted and accumulated
+
+    Unlike LatencyStats it keeps every sample ever recorded, in buckets, so
+    rare events such as panic triggers can be held to an objective across
+    restarts via to_dict/from_dict.
+    """
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def fraction_within(self, seconds: float) -> float:
+        """Share of samples known to be at most seconds; exact when seconds is a bound"""
+        if not self.count:
+            return 0.0
+        within = sum(n for bound, n in zip(self.bounds, self.counts) if bound <= seconds)
+        return within / self.count
+
+    def percentile(self, pct: float) -> float:
+        """Upper bound of the bucket holding the nearest-rank percentile"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(pct / 100.0 * self.count)))
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """Summary in milliseconds, with cumulative bucket counts keyed by bound"""
+        cumulative, seen = {}, 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            cumulative[f'le_{bound * 1000:g}ms'] = seen
+        return {
+            'count': self.count,
+            'mean_ms': self.mean * 1000,
+            'p50_ms': self.percentile(50) * 1000,
+            'p90_ms': self.percentile(90) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': (self.max or 0.0) * 1000,
+            'buckets': cumulative,
+        }
+
+    def to_dict(self) -> dict:
+        return {'bounds': list(self.bounds), 'counts': list(self.counts),
+                'total': self.total, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'LatencyHistogram':
+        histogram = cls(data.get('bounds') or DEFAULT_BOUNDS)
+        counts = data.get('counts') or []
+        if len(counts) == len(histogram.counts):
+            histogram.counts = [int(n) for n in counts]
+            histogram.count = sum(histogram.counts)
+            histogram.total = float(data.get('total', 0.0))
+            histogram.max = data.get('max')
+        return histogram
+
+
+class LatencyObjective(NamedTuple):
+    """Service-level objective: target share of samples within threshold seconds"""
+    threshold: float
+    target: float = 0.95
+
+    def evaluate(self, histogram: LatencyHistogram) -> dict:
+        attained = histogram.fraction_within(self.threshold)
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'target': self.target,
+            'attained': round(attained, 4),
+            # Nothing measured yet is neither a pass nor a failure
+            'met': attained >= self.target if histogram.count else None,
+            'samples': histogram.count,
+        }
@@ -0,0 +1,207 @@
+"""
+Process suspension for Ghost Mode
+Freezes target process trees instead of killing them, and thaws them later
+"""
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import psutil
+
+from proc_scanner import own_lineage
+
+CGROUP = 'cgroup'
+SIGNAL = 'signal'
+
+
+class SuspendRecord(NamedTuple):
+    """A suspended process and how it was suspended"""
+    pid: int
+    name: str
+    mechanism: str
+    cgroup: Optional[str] = None
+
+
+class CgroupFreezer:
+    """Freezes processes by moving them into a frozen cgroup v2 group"""
+    mechanism = CGROUP
+
+    def __init__(self, root: str = '/sys/fs/cgroup', group: str = 'ghostmode-freeze',
+                 proc_root: str = '/proc', settle_timeout: float = 1.0):
+        self.root = root
+        self.path = os.path.join(root, group)
+        self.proc_root = proc_root
+        self.settle_timeout = settle_timeout
+        self.logger = logging.getLogger(__name__)
+
+    def available(self) -> bool:
+        """cgroup v2 is mounted at root and we may create groups there"""
+        return (
+            os.path.exists(os.path.join(self.root, 'cgroup.controllers'))
+            and os.access(self.root, os.W_OK)
+        )
+
+    def _current_cgroup(self, pid: int) -> Optional[str]:
+        with open(f"{self.proc_root}/{pid}/cgroup") as f:
+            for line in f:
+                if line.startswith('0::'):
+                    return line[3:].strip()
+        return None
+
+    def _write(self, path: str, value: str, mode: str = 'w') -> None:
+        with open(path, mode) as f:
+            f.write(value)
+
+    def _wait_frozen(self, frozen: bool) -> None:
+        events = os.path.join(self.path, 'cgroup.events')
+        if not os.path.exists(events):
+            return
+        wanted = f"frozen {int(frozen)}"
+        deadline = time.monotonic() + self.settle_timeout
+        while time.monotonic() < deadline:
+            with open(events) as f:
+                if wanted in f.read().splitlines():
+                    return
+            time.sleep(0.005)
+        self.logger.warning(f"cgroup did not report '{wanted}' within {self.settle_timeout}s")
+
+    def freeze(self, procs: Dict[int, str]) -> List[SuspendRecord]:
+        """Freeze what can be moved into the group; processes left out have no record
+
+        If the group itself cannot be frozen, the processes already moved
+        are put back before the error is raised.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        records = []
+        for pid, name in procs.items():
+            try:
+                original = self._current_cgroup(pid)
+                self._write(os.path.join(self.path, 'cgroup.procs'), str(pid), 'a')
+                records.append(SuspendRecord(pid, name, CGROUP, original))
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            except OSError as e:
+                # e.g. EBUSY or EACCES; the caller can still SIGSTOP it
+                self.logger.warning(f"Could not move {name} ({pid}) into {self.path}: {e}")
+        try:
+            self._write(os.path.join(self.path, 'cgroup.freeze'), '1')
+        except OSError:
+            self._move_back(records)
+            raise
+        self._wait_frozen(True)
+        return records
+
+    def thaw(self, records: List[SuspendRecord]) -> bool:
+        try:
+            self._write(os.path.join(self.path, 'cgroup.freeze'), '0')
+        except FileNotFoundError:
+            # The group is gone (removed, or lost with a reboot); nothing is
+            # frozen, but any records left still need their original cgroups
+            return self._move_back(records)
+        self._wait_frozen(False)
+        return self._move_back(records)
+
+    def _move_back(self, records: List[SuspendRecord]) -> bool:
+        """Return processes to their original cgroups and drop the group"""
+        ok = True
+        for record in records:
+            target = os.path.join(self.root, (record.cgroup or '/').lstrip('/'), 'cgroup.procs')
+            try:
+                self._write(target, str(record.pid), 'a')
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            except OSError as e:
+                self.logger.warning(f"Could not move {record.pid} back to {record.cgroup}: {e}")
+                ok = False
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+        return ok
+
+
+class SignalFreezer:
+    """Freezes processes with SIGSTOP and thaws them with SIGCONT"""
+    mechanism = SIGNAL
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+    def available(self) -> bool:
+        return True
+
+    def freeze(self, procs: Dict[int, str]) -> List[SuspendRecord]:
+        records = []
+        for pid, name in procs.items():
+            try:
+                psutil.Process(pid).suspend()
+                records.append(SuspendRecord(pid, name, SIGNAL))
+            except psutil.NoSuchProcess:
+                continue
+            except psutil.AccessDenied as e:
+                self.logger.warning(f"Could not suspend {name} ({pid}): {e}")
+        return records
+
+    def thaw(self, records: List[SuspendRecord]) -> bool:
+        ok = True
+        for record in records:
+            try:
+                psutil.Process(record.pid).resume()
+            except psutil.NoSuchProcess:
+                continue
+            except psutil.AccessDenied as e:
+                self.logger.warning(f"Could not resume {record.name} ({record.pid}): {e}")
+                ok = False
+        return ok
+
+
+class Suspender:
+    """Suspends whole process trees with the best available mechanism"""
+    def __init__(self, cgroup: CgroupFreezer = None, signal: SignalFreezer = None):
+        self.cgroup = cgroup or CgroupFreezer()
+        self.signal = signal or SignalFreezer()
+        self.logger = logging.getLogger(__name__)
+
+    def _expand(self, pids: Iterable[int]) -> Dict[int, str]:
+        """Add every descendant so helpers are frozen with their parent"""
+        procs = {}
+        # Only an ancestor's tree can contain us, so sparing roots is enough
+        lineage = own_lineage()
+        for pid in pids:
+            if pid in lineage:
+                continue
+            try:
+                proc = psutil.Process(pid)
+                procs[pid] = proc.name()
+                for child in proc.children(recursive=True):
+                    procs.setdefault(child.pid, child.name())
+            except psutil.Error:
+                continue
+        return procs
+
+    def suspend(self, pids: Iterable[int]) -> List[SuspendRecord]:
+        procs = self._expand(pids)
+        if not procs:
+            return []
+        if self.cgroup.available():
+            try:
+                records = self.cgroup.freeze(procs)
+            except OSError as e:
+                self.logger.warning(f"cgroup freeze failed ({e}); falling back to SIGSTOP")
+            else:
+                frozen = {r.pid for r in records}
+                missed = {pid: name for pid, name in procs.items() if pid not in frozen}
+                return records + self.signal.freeze(missed) if missed else records
+        return self.signal.freeze(procs)
+
+    def resume(self, records: List[SuspendRecord]) -> bool:
+        """Thaw records with the mechanism each one was suspended by"""
+        ok = True
+        cgroup_records = [r for r in records if r.mechanism == CGROUP]
+        signal_records = [r for r in records if r.mechanism == SIGNAL]
+        if cgroup_records:
+            ok = self.cgroup.thaw(cgroup_records) and ok
+        if signal_records:
+            ok = self.signal.thaw(signal_records) and ok
+        return ok
@@ -0,0 +1,186 @@
+"""
+Process termination for Ghost Mode
+Batch terminate -> wait -> kill escalation over whole process trees
+"""
+import logging
+import time
+from collections import Counter
+from typing import Dict, Iterable, List
+
+import psutil
+
+from proc_scanner import own_lineage
+from tracing import count, span
+
+TERMINATED = 'terminated'
+KILLED = 'killed'
+GONE = 'gone'
+DENIED = 'access_denied'
+SURVIVED = 'survived'
+# Ghost Mode or one of its ancestors; see proc_scanner.own_lineage
+SPARED = 'spared'
+
+# Poll interval while waiting, so exited zombies are noticed promptly
+WAIT_SLICE = 0.05
+
+
+class TerminationReport:
+    """Per-PID outcome of a termination batch"""
+    def __init__(self):
+        self.outcomes: Dict[int, str] = {}
+        self.names: Dict[int, str] = {}
+        self.roots: List[int] = []
+        self.signalled_at = None
+        self.elapsed = 0.0
+
+    def pids_with(self, *outcomes: str) -> List[int]:
+        return [pid for pid, outcome in self.outcomes.items() if outcome in outcomes]
+
+    @property
+    def ok(self) -> bool:
+        """True when nothing was denied or survived SIGKILL"""
+        return not self.pids_with(DENIED, SURVIVED)
+
+    def to_records(self) -> List[dict]:
+        return [
+            {'pid': pid, 'name': self.names.get(pid, ''), 'outcome': outcome}
+            for pid, outcome in self.outcomes.items()
+        ]
+
+
+class TerminationEngine:
+    """Terminates matched processes and their descendants in batches
+
+    Every process in the set is stopped first so no parent can respawn a
+    helper mid-batch, then sent SIGTERM and resumed. Survivors of the grace
+    period are sent SIGKILL together, so total time is bounded by
+    grace_period + kill_timeout regardless of how many processes matched.
+    """
+    def __init__(self, grace_period: float = 3.0, kill_timeout: float = 1.0,
+                 include_children: bool = True):
+        self.grace_period = grace_period
+        self.kill_timeout = kill_timeout
+        self.include_children = include_children
+        self.logger = logging.getLogger(__name__)
+
+    def _collect(self, pids: Iterable[int], report: TerminationReport) -> List[psutil.Process]:
+        """Resolve PIDs to processes, expanding each into its descendants"""
+        procs = {}
+        # Only an ancestor's tree can contain us, so sparing roots is enough
+        lineage = own_lineage()
+        for pid in pids:
+            if pid in procs:
+                continue
+            if pid in lineage:
+                report.outcomes[pid] = SPARED
+                continue
+            try:
+                proc = psutil.Process(pid)
+                procs[pid] = proc
+                report.roots.append(pid)
+                if self.include_children:
+                    for child in proc.children(recursive=True):
+                        procs.setdefault(child.pid, child)
+            except psutil.NoSuchProcess:
+                report.outcomes[pid] = GONE
+            except psutil.AccessDenied:
+                report.outcomes[pid] = DENIED
+        for pid, proc in procs.items():
+            try:
+                report.names[pid] = proc.name()
+            except psutil.Error:
+                report.names[pid] = ''
+        return list(procs.values())
+
+    def _signal(self, procs: List[psutil.Process], action: str,
+                report: TerminationReport) -> List[psutil.Process]:
+        """Apply one signal method to every process, returning those reached"""
+        reached = []
+        for proc in procs:
+            try:
+                getattr(proc, action)()
+                reached.append(proc)
+            except psutil.NoSuchProcess:
+                report.outcomes[proc.pid] = GONE
+            except psutil.AccessDenied:
+                report.outcomes[proc.pid] = DENIED
+        return reached
+
+    @staticmethod
+    def _wait(procs: List[psutil.Process], timeout: float) -> List[psutil.Process]:
+        """Wait for processes to exit, returning those still alive"""
+        deadline = time.monotonic() + timeout
+        alive = procs
+        while alive:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _, alive = psutil.wait_procs(alive, timeout=min(WAIT_SLICE, remaining))
+            # Orphans of an unreaped parent linger as zombies; they are dead
+            alive = [p for p in alive if not _is_zombie(p)]
+        return alive
+
+    def terminate(self, pids: Iterable[int]) -> TerminationReport:
+        """Terminate the given processes and their trees"""
+        start = time.monotonic()
+        report = TerminationReport()
+        with span('terminate', path='lookup'):
+            procs = self._collect(pids, report)
+            return self._terminate(procs, report, start)
+
+    def terminate_resolved(self, procs: Iterable[psutil.Process], roots: Iterable[int] = (),
+                           names: Dict[int, str] = None) -> TerminationReport:
+        """Terminate processes resolved ahead of time, such as an armed kill plan
+
+        Skips PID lookup and tree expansion. psutil refuses to signal a handle
+        whose PID has since been reused, so stale handles come back as gone.
+        """
+        start = time.monotonic()
+        report = TerminationReport()
+        report.roots = list(roots)
+        lineage = own_lineage()
+        for pid in lineage.intersection(report.roots):
+            report.outcomes[pid] = SPARED
+        procs = [proc for proc in procs if proc.pid not in lineage]
+        names = names or {}
+        for proc in procs:
+            report.names[proc.pid] = names.get(proc.pid, '')
+        with span('terminate', path='planned'):
+            return self._terminate(procs, report, start)
+
+    def _terminate(self, procs: List[psutil.Process], report: TerminationReport,
+                   start: float) -> TerminationReport:
+        stopped = self._signal(procs, 'suspend', report)
+        signalled = self._signal(stopped, 'terminate', report)
+        # Resume everything stopped, not just those signalled, so a process
+        # that refused SIGTERM is not left frozen
+        self._signal(stopped, 'resume', report)
+        report.signalled_at = time.monotonic()
+
+        alive = self._wait(signalled, self.grace_period)
+        alive_pids = {p.pid for p in alive}
+        for proc in signalled:
+            if proc.pid not in alive_pids:
+                report.outcomes[proc.pid] = TERMINATED
+
+        if alive:
+            self.logger.info(f"Escalating to SIGKILL for {len(alive)} processes")
+            killed = self._signal(alive, 'kill', report)
+            survivors = {p.pid for p in self._wait(killed, self.kill_timeout)}
+            for proc in killed:
+                report.outcomes[proc.pid] = SURVIVED if proc.pid in survivors else KILLED
+
+        report.elapsed = time.monotonic() - start
+        for outcome, n in Counter(report.outcomes.values()).items():
+            count('processes_signalled', n, outcome=outcome)
+        self.logger.info(
+            f"Termination batch of {len(report.outcomes)} processes finished in {report.elapsed:.3f}s"
+        )
+        return report
+
+
+def _is_zombie(proc: psutil.Process) -> bool:
+    try:
+        return proc.status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return True
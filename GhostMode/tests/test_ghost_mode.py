@@ -4,12 +4,57 @@ Unit tests for Ghost Mode application
 import unittest
 import sys
 import os
+import io
+import json
+import random
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import psutil
+from contextlib import redirect_stdout
 from unittest.mock import MagicMock, patch
 
 # Import modules to test
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from hardware_control import HardwareController
 from process_manager import ProcessManager
+from process_matcher import ProcessMatcher, split_strategy
+from proc_scanner import ProcfsScanner, PsutilScanner
+from termination import DENIED, KILLED, SPARED, TERMINATED, TerminationEngine
+from enforcement import EnforcementWatcher, ProcConnectorSource, ProcDiffSource
+from stats import LatencyHistogram, LatencyObjective, LatencyStats
+from restoration import filter_environment
+from suspension import CGROUP, SIGNAL, CgroupFreezer, SignalFreezer, SuspendRecord, Suspender
+from command_executor import CommandExecutor, CommandResult, ShellSession
+from device_probe import DeviceProbe, UeventSource
+from fs_watch import ChangeWatcher
+from reconcile import (
+    JOURNAL, PROBE, Action, Protection, Reconciler, StateJournal, build_protections
+)
+from audit_logger import FSYNC_BATCH, AuditLogger, read_records
+from audit_query import AuditQuery, record_terms
+import ghostmode
+from controller import GhostModeController
+from daemon import DaemonClient, GhostDaemon, private_dir
+from panic import LATENCY_METRIC, PanicArm
+import tracing
+from fake_os import NETWORK_LINKS, SYNTHETIC_PID_BASE, FakeNetSyscalls, FakeNft, Latency, SimulatedOS
+from network_cloak import NetworkCloak, build_ruleset, build_teardown, process_tree
+from triggers import (
+    DEVICE, NETWORK, PROCESS, TIME, Event, LinkEvents, ProcessEvents, Rule, Schedule, TriggerEngine, parse_rules
+)
+from mac_address import IFF_UP, SIOCSIFHWADDR, MacRandomizer, NetSyscalls, random_mac
+from registry import KEY_READ, REG_DWORD, MemoryRegistryBackend, Registry
+from location_service import SENSOR_KEY, SENSOR_VALUE, LocationService
+from process_matcher import TargetSet
+from profiles import ProfileStore, TargetCache, parse_profiles
+from restoration import LaunchRecord
+from orchestrator import (
+    FINISHED, STARTED, PipelineOrchestrator, Stage, build_activation_stages, build_deactivation_stages
+)
 
 class TestHardwareController(unittest.TestCase):
     """Test hardware control functionality"""
@@ -49,9 +94,17 @@ class TestHardwareController(unittest.TestCase):
 class TestProcessManager(unittest.TestCase):
     """Test process management functionality"""
     
+    @patch('psutil.wait_procs', side_effect=lambda procs, timeout: (procs, []))
+    @patch('psutil.Process')
     @patch('psutil.process_iter')
-    def test_kill_processes(self, mock_process_iter):
+    def test_kill_processes(self, mock_process_iter, mock_process, mock_wait):
         """Test process termination"""
+        def make_process(pid):
+            proc = MagicMock(pid=pid)
+            proc.children.return_value = []
+            proc.as_dict.return_value = {'pid': pid, 'name': '', 'exe': None}
+            return proc
+        mock_process.side_effect = make_process
         # Create mock processes
         mock_proc1 = MagicMock()
         mock_proc1.info = {'name': 'zoom.exe', 'pid': 123}
@@ -60,7 +113,7 @@ class TestProcessManager(unittest.TestCase):
         
         mock_process_iter.return_value = [mock_proc1, mock_proc2]
         
-        pm = ProcessManager(['zoom.exe', 'chrome.exe'])
+        pm = ProcessManager(['zoom.exe', 'chrome.exe'], scanner=PsutilScanner())
         result = pm.kill_processes()
         
         self.assertTrue(result)
@@ -73,5 +126,1783 @@ class TestProcessManager(unittest.TestCase):
             pm.load_target_processes('dummy_path.txt')
             self.assertEqual(pm.target_processes, ['zoom.exe', 'chrome.exe'])
 
+class TestProcessMatcher(unittest.TestCase):
+    """Test compiled target matching"""
+    
+    def test_exact_names_case_insensitive(self):
+        """Test exact names match regardless of case"""
+        matcher = ProcessMatcher(['Zoom.exe', 'chrome.exe'])
+        self.assertEqual(matcher.match('ZOOM.EXE'), 'Zoom.exe')
+        self.assertIsNone(matcher.match('zoom'))
+        self.assertEqual(matcher.scan_attrs(), ['pid', 'name'])
+        
+    def test_pattern_rules(self):
+        """Test glob, regex, exe and cmdline rules"""
+        matcher = ProcessMatcher([
+            'chrome*', 're:teams(\\.exe)?', 'exe:/opt/zoom/*', 'cmd:--type=renderer'
+        ])
+        self.assertEqual(matcher.match('chrome_crashpad'), 'chrome*')
+        self.assertEqual(matcher.match('Teams.exe'), 're:teams(\\.exe)?')
+        self.assertIsNone(matcher.match('teamsupdater'))
+        self.assertEqual(matcher.match('zoom', exe='/opt/zoom/ZoomLauncher'), 'exe:/opt/zoom/*')
+        self.assertEqual(
+            matcher.match('electron', cmdline=['electron', '--type=renderer']),
+            'cmd:--type=renderer'
+        )
+        self.assertEqual(matcher.scan_attrs(), ['pid', 'name', 'exe', 'cmdline'])
+
+    def test_unfoldable_regex_rules(self):
+        """Test backreferences, named groups and global flags keep their meaning"""
+        rules = ['re:(ab)\\1', 're:(?P<x>z)o(?P=x)', 're:(?s)sky.*', 're:(te)ams', 'glob:ab*']
+        for rule in rules:
+            ProcessMatcher.check_rule(rule)
+        matcher = ProcessMatcher(rules)
+        self.assertEqual(matcher.match('abab'), 're:(ab)\\1')
+        self.assertEqual(matcher.match('abba'), 'glob:ab*')
+        self.assertEqual(matcher.match('zoz'), 're:(?P<x>z)o(?P=x)')
+        self.assertEqual(matcher.match('Skype'), 're:(?s)sky.*')
+        self.assertEqual(matcher.match('teams'), 're:(te)ams')
+        self.assertIsNone(matcher.match('zoo'))
+        restored = ProcessMatcher.from_state(json.loads(json.dumps(matcher.to_state())))
+        self.assertEqual(restored.match('abab'), 're:(ab)\\1')
+        with self.assertRaises(ValueError):
+            ProcessMatcher.check_rule('re:sky(?i)pe')
+        
+    def test_manager_recompiles_on_load(self):
+        """Test the matcher is rebuilt when targets are reloaded"""
+        with patch('builtins.open', unittest.mock.mock_open(read_data='# comment\nslack\n')):
+            pm = ProcessManager(['zoom.exe'])
+            pm.load_target_processes('dummy_path.txt')
+        self.assertEqual(pm.matcher.match('Slack'), 'slack')
+        self.assertIsNone(pm.matcher.match('zoom.exe'))
+
+def write_fake_proc(root, pid, name, ppid=1, start_time=100, cmdline=None, exe=None):
+    """Create a minimal /proc/<pid> entry under root"""
+    proc_dir = os.path.join(root, str(pid))
+    os.makedirs(proc_dir, exist_ok=True)
+    fields = ['S', str(ppid)] + ['0'] * 17 + [str(start_time), '0', '0']
+    with open(os.path.join(proc_dir, 'stat'), 'w') as f:
+        f.write(f"{pid} ({name}) {' '.join(fields)}\n")
+    with open(os.path.join(proc_dir, 'cmdline'), 'wb') as f:
+        f.write(b'\0'.join(arg.encode() for arg in (cmdline or [name])) + b'\0')
+    if exe:
+        link = os.path.join(proc_dir, 'exe')
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(exe, link)
+
+class TestProcfsScanner(unittest.TestCase):
+    """Test the /proc fast-path scanner against a fake procfs tree"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        os.makedirs(os.path.join(self.root, 'self'))
+        
+    def tearDown(self):
+        self.tmp.cleanup()
+        
+    def test_scan_reads_stat(self):
+        """Test names, parent PIDs and exe paths are parsed"""
+        write_fake_proc(self.root, 10, 'zoom', ppid=1, exe='/opt/zoom/zoom')
+        write_fake_proc(self.root, 11, 'odd) name', ppid=10)
+        scanner = ProcfsScanner(self.root)
+        procs = {p.pid: p for p in scanner.scan(['pid', 'name', 'exe'])}
+        self.assertEqual(set(procs), {10, 11})
+        self.assertEqual(procs[10].exe, '/opt/zoom/zoom')
+        self.assertEqual(procs[11].name, 'odd) name')
+        self.assertEqual(procs[11].ppid, 10)
+        
+    def test_truncated_comm_uses_cmdline(self):
+        """Test 15-character comm values are expanded from argv[0]"""
+        write_fake_proc(self.root, 20, 'chrome_crashpad', cmdline=['/opt/chrome/chrome_crashpad_handler'])
+        scanner = ProcfsScanner(self.root)
+        self.assertEqual(next(scanner.scan()).name, 'chrome_crashpad_handler')
+        
+    def test_reused_pid_is_detected(self):
+        """Test the cached name is dropped when the start time changes"""
+        write_fake_proc(self.root, 30, 'zoom', start_time=100)
+        scanner = ProcfsScanner(self.root)
+        self.assertEqual(next(scanner.scan()).name, 'zoom')
+        write_fake_proc(self.root, 30, 'bash', start_time=200)
+        self.assertEqual(next(scanner.scan()).name, 'bash')
+        
+    def test_exited_processes_are_pruned(self):
+        """Test cache entries for vanished PIDs are forgotten"""
+        write_fake_proc(self.root, 40, 'zoom')
+        scanner = ProcfsScanner(self.root)
+        list(scanner.scan())
+        shutil.rmtree(os.path.join(self.root, '40'))
+        self.assertEqual(list(scanner.scan()), [])
+        self.assertEqual(scanner._cache, {})
+
+    def test_threads_share_scanner(self):
+        """Test concurrent reads from several threads never mix up processes"""
+        names = {pid: f'proc{pid}' for pid in range(70, 78)}
+        for pid, name in names.items():
+            write_fake_proc(self.root, pid, name, cmdline=[name, 'x' * (pid * 100)])
+        scanner = ProcfsScanner(self.root, buffer_size=64)
+        errors = []
+
+        def worker(pid):
+            for _ in range(300):
+                info = scanner.read(pid, ['pid', 'name', 'cmdline'])
+                if info.name != names[pid] or info.cmdline[0] != names[pid]:
+                    errors.append((pid, info.name))
+                list(scanner.scan(['pid', 'name']))
+
+        threads = [threading.Thread(target=worker, args=(pid,)) for pid in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_manager_uses_scanner(self):
+        """Test ProcessManager queries go through the injected scanner"""
+        write_fake_proc(self.root, 50, 'Discord')
+        pm = ProcessManager(['discord'], scanner=ProcfsScanner(self.root))
+        self.assertTrue(pm.is_process_running('discord'))
+        self.assertFalse(pm.is_process_running('zoom.exe'))
+        
+    def test_snapshot_single_pass(self):
+        """Test snapshot reports targets with PIDs, parents and exe paths"""
+        write_fake_proc(self.root, 60, 'zoom', ppid=1, exe='/opt/zoom/zoom')
+        write_fake_proc(self.root, 61, 'zoom', ppid=60, exe='/opt/zoom/zoom')
+        write_fake_proc(self.root, 62, 'bash', ppid=1)
+        pm = ProcessManager(['slack', 'zoom'], scanner=ProcfsScanner(self.root))
+        with patch.object(pm.scanner, 'scan', wraps=pm.scanner.scan) as scan:
+            snapshot = pm.snapshot()
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual(sorted(snapshot.pids), [60, 61])
+        self.assertEqual(snapshot.running_targets, ['zoom'])
+        child = next(m for m in snapshot.by_target()['zoom'] if m.pid == 61)
+        self.assertEqual((child.ppid, child.exe), (60, '/opt/zoom/zoom'))
+
+def spawn_sleep_tree(script, children):
+    """Start a shell running background sleeps and wait for its children"""
+    proc = subprocess.Popen(['sh', '-c', script])
+    deadline = time.monotonic() + 5
+    while len(psutil.Process(proc.pid).children()) < children:
+        if time.monotonic() > deadline:
+            raise RuntimeError("sleep tree did not start")
+        time.sleep(0.01)
+    return proc
+
+@unittest.skipUnless(shutil.which('sh') and shutil.which('sleep'), "requires sh and sleep")
+class TestTerminationEngine(unittest.TestCase):
+    """Test batch termination against real sleep process trees"""
+    
+    def test_terminates_whole_tree(self):
+        """Test descendants are terminated along with the matched parent"""
+        proc = spawn_sleep_tree('sleep 30 & sleep 30 & wait', 2)
+        report = TerminationEngine(grace_period=5).terminate([proc.pid])
+        proc.wait(timeout=5)
+        self.assertTrue(report.ok)
+        self.assertEqual(len(report.outcomes), 3)
+        self.assertEqual(set(report.outcomes.values()), {TERMINATED})
+        self.assertEqual(report.roots, [proc.pid])
+        
+    def test_escalates_after_grace_period(self):
+        """Test processes ignoring SIGTERM are killed once the grace period ends"""
+        trees = [spawn_sleep_tree('trap "" TERM; sleep 30 & sleep 30 & wait', 2) for _ in range(3)]
+        engine = TerminationEngine(grace_period=0.3, kill_timeout=2)
+        report = engine.terminate([p.pid for p in trees])
+        for proc in trees:
+            proc.wait(timeout=5)
+        self.assertTrue(report.ok)
+        self.assertEqual(len(report.outcomes), 9)
+        self.assertEqual(set(report.outcomes.values()), {KILLED})
+        # Bounded by the grace period, not by the number of processes
+        self.assertLess(report.elapsed, 0.3 + 2)
+        
+    def test_spares_own_lineage(self):
+        """Test a rule matching Ghost Mode or the shell that started it never signals them"""
+        proc = spawn_sleep_tree('sleep 30 & wait', 1)
+        ours = [os.getpid(), os.getppid()]
+        report = TerminationEngine(grace_period=5).terminate(ours + [proc.pid])
+        proc.wait(timeout=5)
+        self.assertEqual([report.outcomes[pid] for pid in ours], [SPARED, SPARED])
+        self.assertEqual(report.outcomes[proc.pid], TERMINATED)
+        self.assertTrue(report.ok)
+        # Freezing and cloaking expand trees the same way
+        self.assertEqual(Suspender()._expand(ours), {})
+        self.assertEqual(process_tree(ours), [])
+
+    def test_denied_process_is_resumed(self):
+        """Test a process that refuses SIGTERM is resumed rather than left stopped"""
+        proc = MagicMock(pid=4242)
+        proc.terminate.side_effect = psutil.AccessDenied(4242)
+        report = TerminationEngine(grace_period=0).terminate_resolved([proc], [4242])
+        proc.suspend.assert_called_once_with()
+        proc.resume.assert_called_once_with()
+        self.assertEqual(report.outcomes[4242], DENIED)
+
+class TestEnforcement(unittest.TestCase):
+    """Test the continuous enforcement watcher"""
+    
+    def test_latency_stats(self):
+        """Test percentile summaries of recorded latencies"""
+        stats = LatencyStats()
+        for ms in range(1, 101):
+            stats.record(ms / 1000)
+        summary = stats.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50_ms'], 50)
+        self.assertAlmostEqual(summary['p99_ms'], 99)
+        self.assertAlmostEqual(summary['max_ms'], 100)
+        
+    def test_stop_keeps_restore_state(self):
+        """Test stopping enforcement leaves launch records for restoration"""
+        pm = ProcessManager(['zoom'])
+        pm.launch_records = ['record']
+        pm.enforcement = MagicMock()
+        pm.enforcement.stats.return_value = {'kills': 0}
+        self.assertEqual(pm.stop_enforcement(), {'kills': 0})
+        self.assertEqual(pm.launch_records, ['record'])
+        self.assertIsNone(pm.enforcement)
+        
+    def test_parse_proc_connector_exec(self):
+        """Test exec events are decoded from a netlink datagram"""
+        event = struct.pack('=IIQ', 0x2, 0, 5_000_000_000) + struct.pack('=II', 4321, 4321)
+        cn = struct.pack('=IIIIHH', 1, 1, 0, 0, len(event), 0)
+        msg = struct.pack('=IHHII', 16 + len(cn) + len(event), 3, 0, 0, 0) + cn + event
+        self.assertEqual(ProcConnectorSource.parse(msg), [(4321, 5.0)])
+        
+    def test_proc_diff_reports_only_new_pids(self):
+        """Test the diff source reports added PIDs for a few ticks"""
+        with tempfile.TemporaryDirectory() as root:
+            write_fake_proc(root, 1, 'init')
+            source = ProcDiffSource(root, recheck_ticks=2)
+            source.open()
+            self.assertEqual(source.poll(0), [])
+            write_fake_proc(root, 77, 'zoom')
+            self.assertEqual(source.poll(0), [(77, None)])
+            self.assertEqual(source.poll(0), [(77, None)])
+            self.assertEqual(source.poll(0), [])
+            
+    @unittest.skipUnless(os.path.exists('/proc/self/stat') and shutil.which('sleep'), "requires procfs")
+    def test_respawn_is_killed(self):
+        """Test a target started after activation is killed by the watcher"""
+        pm = ProcessManager(['cmd:31.4159'], scanner=ProcfsScanner())
+        watcher = EnforcementWatcher(pm, interval=0.02, source=ProcDiffSource())
+        watcher.start()
+        try:
+            proc = subprocess.Popen(['sleep', '31.4159'])
+            deadline = time.monotonic() + 5
+            while psutil.pid_exists(proc.pid) and proc.poll() is None:
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        finally:
+            watcher.stop()
+        self.assertEqual(watcher.kills, 1)
+        self.assertEqual(watcher.latency.count, 1)
+        self.assertIn('sleep', pm.killed_processes)
+
+HELPER_SCRIPT = (
+    "import subprocess, sys, time\n"
+    "helpers = [subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)', sys.argv[1]])"
+    " for _ in range(2)]\n"
+    "time.sleep(30)\n"
+)
+
+@unittest.skipUnless(os.name == 'posix', "requires POSIX process groups")
+class TestProcessRestoration(unittest.TestCase):
+    """Test capturing launch records and relaunching terminated apps"""
+    
+    def setUp(self):
+        self.marker = f"ghost-restore-{os.getpid()}-{time.monotonic_ns()}"
+        self.pm = ProcessManager([f"cmd:{self.marker}"], scanner=PsutilScanner(), grace_period=2)
+        
+    def tearDown(self):
+        self.pm.kill_processes()
+        
+    def wait_for_matches(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.pm.snapshot()) < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+        return self.pm.last_snapshot
+        
+    def test_filter_environment(self):
+        """Test only session variables are kept"""
+        env = filter_environment({'PATH': '/bin', 'LC_ALL': 'C', 'AWS_SECRET_ACCESS_KEY': 'x'})
+        self.assertEqual(env, {'PATH': '/bin', 'LC_ALL': 'C'})
+        
+    def test_kill_and_restore(self):
+        """Test an app with helpers is killed and relaunched once"""
+        parent = subprocess.Popen([sys.executable, '-c', HELPER_SCRIPT, self.marker])
+        self.wait_for_matches(3)
+        self.assertTrue(self.pm.kill_processes())
+        parent.wait(timeout=5)
+        self.assertEqual(len(self.pm.killed_processes), 3)
+        self.assertEqual(len(self.pm.launch_records), 1)
+        self.assertEqual(self.pm.launch_records[0].pid, parent.pid)
+        
+        self.assertTrue(self.pm.restore_processes())
+        self.assertEqual(len(self.pm.last_restore), 1)
+        result = self.pm.last_restore[0]
+        self.assertTrue(result.ok)
+        snapshot = self.wait_for_matches(3)
+        self.assertIn(result.pid, snapshot.pids)
+        self.assertEqual(self.pm.launch_records, [])
+
+def wait_for_status(proc, status, timeout=2):
+    """Poll until a process reports a status; signals are delivered asynchronously"""
+    deadline = time.monotonic() + timeout
+    while proc.status() != status:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+class TestSuspension(unittest.TestCase):
+    """Test freeze/thaw strategies"""
+    
+    def test_split_strategy(self):
+        """Test trailing strategy tokens in target entries"""
+        self.assertEqual(split_strategy('slack @freeze'), ('slack', 'freeze'))
+        self.assertEqual(split_strategy('Microsoft Teams.exe'), ('Microsoft Teams.exe', 'kill'))
+        self.assertEqual(split_strategy('cmd:@home'), ('cmd:@home', 'kill'))
+        pm = ProcessManager(['zoom.exe @FREEZE', 'chrome.exe'])
+        self.assertEqual(pm.target_processes, ['zoom.exe', 'chrome.exe'])
+        self.assertEqual(pm.strategy_for('zoom.exe'), 'freeze')
+        self.assertEqual(pm.strategy_for('chrome.exe'), 'kill')
+        
+    def test_cgroup_freezer_fake_tree(self):
+        """Test cgroup freeze and thaw against a fake cgroup v2 tree"""
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as proc_root:
+            open(os.path.join(root, 'cgroup.controllers'), 'w').close()
+            os.makedirs(os.path.join(root, 'user.slice'))
+            os.makedirs(os.path.join(proc_root, '42'))
+            with open(os.path.join(proc_root, '42', 'cgroup'), 'w') as f:
+                f.write('0::/user.slice\n')
+            freezer = CgroupFreezer(root, proc_root=proc_root)
+            self.assertTrue(freezer.available())
+            records = freezer.freeze({42: 'zoom'})
+            self.assertEqual(records, [(42, 'zoom', CGROUP, '/user.slice')])
+            with open(os.path.join(freezer.path, 'cgroup.freeze')) as f:
+                self.assertEqual(f.read(), '1')
+            self.assertTrue(freezer.thaw(records))
+            with open(os.path.join(root, 'user.slice', 'cgroup.procs')) as f:
+                self.assertEqual(f.read(), '42')
+            
+            # A process that cannot be moved is left to SIGSTOP; moved ones keep their records
+            write = freezer._write
+            
+            def busy(path, value, mode='w'):
+                if value == '43' or (fail_freeze and path.endswith('cgroup.freeze')):
+                    raise OSError(16, 'Device or resource busy')
+                write(path, value, mode)
+            freezer._write = busy
+            fail_freeze = False
+            signal = MagicMock()
+            signal.freeze.side_effect = lambda procs: [SuspendRecord(pid, name, SIGNAL) for pid, name in procs.items()]
+            suspender = Suspender(freezer, signal)
+            suspender._expand = lambda pids: {42: 'zoom', 43: 'teams'}
+            records = suspender.suspend([42, 43])
+            self.assertEqual(records, [(42, 'zoom', CGROUP, '/user.slice'), (43, 'teams', SIGNAL, None)])
+            self.assertTrue(suspender.resume(records))
+            # If the group cannot be frozen, moved processes go back before falling back
+            fail_freeze = True
+            records = suspender.suspend([42, 43])
+            self.assertEqual({r.mechanism for r in records}, {SIGNAL})
+            with open(os.path.join(root, 'user.slice', 'cgroup.procs')) as f:
+                self.assertEqual(f.read(), '424242')
+            # A group removed while frozen still sends its processes home
+            freezer._write = write
+            records = freezer.freeze({42: 'zoom'})
+            shutil.rmtree(freezer.path)
+            self.assertTrue(freezer.thaw(records))
+            with open(os.path.join(root, 'user.slice', 'cgroup.procs')) as f:
+                self.assertEqual(f.read(), '42424242')
+                
+    @unittest.skipUnless(shutil.which('sh') and shutil.which('sleep'), "requires sh and sleep")
+    def test_freeze_strategy_suspends_tree(self):
+        """Test freeze targets are stopped on activation and resumed on restore"""
+        # The marker only exists at runtime so no unrelated shell can match it
+        marker = f"ghost-freeze-{os.getpid()}-{time.monotonic_ns()}"
+        proc = spawn_sleep_tree(f'sleep 30 & wait # {marker}', 1)
+        child = psutil.Process(proc.pid).children()[0]
+        pm = ProcessManager([f"cmd:{marker} @freeze"], scanner=PsutilScanner())
+        pm.suspender = Suspender(signal=SignalFreezer())
+        pm.suspender.cgroup.available = lambda: False
+        try:
+            self.assertTrue(pm.kill_processes())
+            self.assertEqual({r.pid for r in pm.suspended}, {proc.pid, child.pid})
+            self.assertEqual({r.mechanism for r in pm.suspended}, {SIGNAL})
+            self.assertTrue(wait_for_status(child, psutil.STATUS_STOPPED))
+            self.assertEqual(pm.killed_processes, [])
+            self.assertTrue(pm.restore_processes())
+            self.assertTrue(wait_for_status(child, psutil.STATUS_SLEEPING))
+            self.assertEqual(len(pm.thawed), 2)
+        finally:
+            child.kill()
+            proc.kill()
+            proc.wait()
+
+def slow(result, delay=0.2):
+    """Stub service call with artificial latency"""
+    def call(*args, **kwargs):
+        time.sleep(delay)
+        return result
+    return MagicMock(side_effect=call)
+
+class TestPipelineOrchestrator(unittest.TestCase):
+    """Test concurrent activation stages with stub services"""
+    
+    def setUp(self):
+        self.orchestrator = PipelineOrchestrator()
+        self.hardware = MagicMock(os_type='Linux')
+        self.hardware.disable_webcam = slow(True)
+        self.hardware.disable_microphone = slow(True)
+        self.hardware.randomize_mac_address = slow(False)
+        self.hardware.deactivate_protections = slow(True)
+        self.process_manager = MagicMock()
+        self.process_manager.snapshot.return_value = ['snapshot']
+        self.process_manager.kill_processes = slow(True)
+        self.process_manager.restore_processes = slow(True)
+        self.location = MagicMock()
+        
+    def tearDown(self):
+        self.orchestrator.shutdown()
+        
+    def test_activation_stages_run_concurrently(self):
+        """Test four 200ms stages finish in far less than their sum"""
+        events = []
+        context = {}
+        stages = build_activation_stages(self.hardware, self.process_manager, self.location, context)
+        result = self.orchestrator.run(
+            'activation', stages, lambda event, name, _: events.append((event, name)), context
+        )
+        self.assertLess(result.elapsed, 0.6)
+        self.assertEqual(set(result.results), {'webcam', 'microphone', 'processes', 'location'})
+        self.assertFalse(result.ok)
+        self.assertFalse(result.stage_ok('location'))
+        self.assertTrue(result.stage_ok('processes'))
+        self.assertEqual(result.context['snapshot'], ['snapshot'])
+        self.process_manager.start_enforcement.assert_called_once()
+        self.assertEqual(sum(1 for e, _ in events if e == STARTED), 4)
+        self.assertEqual(sum(1 for e, _ in events if e == FINISHED), 4)
+        
+    def test_deactivation_stages(self):
+        """Test deactivation stops enforcement before restoring"""
+        context = {}
+        stages = build_deactivation_stages(self.hardware, self.process_manager, self.location, context)
+        result = self.orchestrator.run('deactivation', stages, context=context)
+        self.assertTrue(result.ok)
+        names = [c[0] for c in self.process_manager.method_calls]
+        self.assertLess(names.index('stop_enforcement'), names.index('snapshot'))
+        
+    def test_stage_timeout_and_error(self):
+        """Test a hung stage times out and a raising stage fails without blocking others"""
+        def boom():
+            raise RuntimeError("no device")
+        stages = [
+            Stage('hung', slow(True, delay=2), timeout=0.1),
+            Stage('error', boom),
+            Stage('fast', lambda: True),
+        ]
+        result = self.orchestrator.run('test', stages)
+        self.assertLess(result.elapsed, 1)
+        self.assertTrue(result.results['hung'].timed_out)
+        self.assertEqual(result.results['error'].error, 'no device')
+        self.assertTrue(result.stage_ok('fast'))
+        
+    def test_run_async_delivers_result(self):
+        """Test the async runner returns immediately and reports on completion"""
+        finished = []
+        start = time.monotonic()
+        thread = self.orchestrator.run_async('test', [Stage('a', slow(True))], on_finished=finished.append)
+        self.assertLess(time.monotonic() - start, 0.1)
+        thread.join(2)
+        self.assertTrue(finished[0].ok)
+
+class TestCommandExecutor(unittest.TestCase):
+    """Test warm shell sessions and the hardware command runner"""
+    
+    def test_session_output_and_exit_codes(self):
+        """Test output framing, exit codes and restart after the shell dies"""
+        session = ShellSession(['/bin/sh'])
+        try:
+            self.assertEqual(session.run(['printf', 'a\nb']), CommandResult(0, 'a\nb'))
+            result = session.run(['sh', '-c', 'echo oops >&2; exit 3'])
+            self.assertEqual((result.returncode, result.stdout), (3, 'oops\n'))
+            session.proc.kill()
+            session.proc.wait()
+            self.assertEqual(session.run(['echo', 'back']).stdout, 'back\n')
+            self.assertEqual(session.starts, 2)
+            with self.assertRaises(subprocess.TimeoutExpired):
+                session.run(['sleep', '5'], timeout=0.2)
+            self.assertEqual(session.run(['true']).returncode, 0)
+        finally:
+            session.close()
+            
+    def test_shell_dying_mid_command_is_not_retried(self):
+        """Test a command whose shell exits under it runs once and fails"""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        marker = os.path.join(root, 'ran')
+        session = ShellSession(['/bin/sh'])
+        try:
+            with self.assertRaises(RuntimeError):
+                session.run(['sh', '-c', f'echo x >> {marker}; kill -9 $PPID'])
+            with open(marker) as f:
+                self.assertEqual(f.read(), 'x\n')
+            self.assertEqual(session.run(['echo', 'back']).stdout, 'back\n')
+        finally:
+            session.close()
+
+    def test_busy_pool_times_out(self):
+        """Test waiting for a free session gives up after the timeout"""
+        executor = CommandExecutor(pool_size=1, shell_argv=['/bin/sh'])
+        try:
+            busy = threading.Thread(target=executor.run, args=(['sleep', '1'],))
+            busy.start()
+            time.sleep(0.2)
+            with self.assertRaises(TimeoutError):
+                executor.run(['true'], timeout=0.2)
+            busy.join(5)
+            self.assertEqual(executor.run(['true']).returncode, 0)
+        finally:
+            executor.close()
+            
+    def test_run_many_parallel(self):
+        """Test independent commands run concurrently across warm sessions"""
+        executor = CommandExecutor(pool_size=3, shell_argv=['/bin/sh'])
+        executor.warm()
+        try:
+            start = time.monotonic()
+            results = executor.run_many([['sleep', '0.3']] * 3)
+            self.assertLess(time.monotonic() - start, 0.6)
+            self.assertTrue(all(r.returncode == 0 for r in results))
+            self.assertTrue(all(s.starts == 1 for s in executor._sessions))
+        finally:
+            executor.close()
+            
+    @patch('platform.system')
+    def test_hardware_uses_runner(self, mock_system):
+        """Test hardware commands go through the injected runner"""
+        mock_system.return_value = 'Windows'
+        runner = MagicMock()
+        runner.run.return_value = CommandResult(1, '')
+        hw = HardwareController(runner)
+        self.assertTrue(hw.deactivate_protections())
+        commands = [c.args[0] for c in runner.run.call_args_list]
+        self.assertEqual(len(commands), 4)
+        self.assertLess(commands.index(['net', 'start', 'AudioEndpointBuilder']),
+                        commands.index(['net', 'start', 'Audiosrv']))
+        mock_system.return_value = 'Linux'
+        # MAC changes use ioctls rather than commands; never touch the real links here
+        hw = HardwareController(runner, mac=MacRandomizer(FakeNetSyscalls(failure_rate=1.0)))
+        runner.run.reset_mock()
+        self.assertFalse(hw.randomize_mac_address('eth0'))
+        self.assertFalse(runner.run.called)
+
+AMIXER_CAPTURE = """Simple mixer control 'Capture',0
+  Capabilities: cvolume cswitch
+  Front Left: Capture 39 [61%%] [12.00dB] [%s]
+  Front Right: Capture 39 [61%%] [12.00dB] [%s]
+"""
+
+class TestDeviceProbe(unittest.TestCase):
+    """Test device state probes against a fake sysfs/dev/proc tree"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.sys = os.path.join(self.root, 'sys')
+        self.dev = os.path.join(self.root, 'dev')
+        self.proc = os.path.join(self.root, 'proc')
+        os.makedirs(os.path.join(self.sys, 'module', 'uvcvideo'))
+        os.makedirs(os.path.join(self.proc, 'asound', 'card0', 'pcm0c'))
+        os.makedirs(os.path.join(self.proc, 'asound', 'card0', 'pcm0p'))
+        os.makedirs(self.dev)
+        open(os.path.join(self.dev, 'video0'), 'w').close()
+        self.runner = MagicMock()
+        self.runner.run.return_value = CommandResult(0, AMIXER_CAPTURE % ('on', 'on'))
+        self.probe = DeviceProbe(self.sys, self.dev, self.proc, self.runner, use_uevents=False)
+        
+    def tearDown(self):
+        self.probe.close()
+        shutil.rmtree(self.root)
+        
+    def test_webcam_cached_until_change(self):
+        """Test webcam state is served from cache until the tree changes"""
+        state = self.probe.webcam_state()
+        self.assertTrue(state.module_loaded)
+        self.assertFalse(state.disabled)
+        self.assertEqual(self.probe.webcam_state(), state)
+        self.assertEqual((self.probe.probes, self.probe.hits), (1, 1))
+        os.rmdir(os.path.join(self.sys, 'module', 'uvcvideo'))
+        os.remove(os.path.join(self.dev, 'video0'))
+        self.assertTrue(self.probe.webcam_state().disabled)
+        self.assertEqual(self.probe.probes, 2)
+        
+    def test_microphone_switches(self):
+        """Test capture switches come from one amixer call until invalidated"""
+        state = self.probe.microphone_state()
+        self.assertEqual(state.capture_devices, (os.path.join(self.proc, 'asound', 'card0', 'pcm0c'),))
+        self.assertFalse(state.disabled)
+        self.probe.microphone_state()
+        self.assertEqual(self.runner.run.call_count, 1)
+        self.runner.run.return_value = CommandResult(0, AMIXER_CAPTURE % ('off', 'off'))
+        self.probe.invalidate()
+        self.assertTrue(self.probe.microphone_state().disabled)
+        
+    def test_no_capture_device_skips_amixer(self):
+        """Test a machine without capture PCMs reports disabled without amixer"""
+        shutil.rmtree(os.path.join(self.proc, 'asound', 'card0', 'pcm0c'))
+        self.assertTrue(self.probe.microphone_state().disabled)
+        self.runner.run.assert_not_called()
+        
+    @patch('platform.system', return_value='Linux')
+    def test_hardware_status_checks(self, mock_system):
+        """Test the controller reports probed state"""
+        hw = HardwareController(self.runner, self.probe)
+        self.assertFalse(hw.check_webcam_status())
+        self.assertFalse(hw.check_microphone_status())
+        
+    def test_mtime_fallback_and_uevent_parse(self):
+        """Test the polling watcher and the uevent message parser"""
+        watcher = ChangeWatcher([self.dev], use_inotify=False)
+        self.assertFalse(watcher.changed())
+        time.sleep(0.01)
+        open(os.path.join(self.dev, 'video1'), 'w').close()
+        self.assertTrue(watcher.changed())
+        self.assertFalse(watcher.changed())
+        fields = UeventSource.parse(b'remove@/module/uvcvideo\0ACTION=remove\0SUBSYSTEM=module\0')
+        self.assertEqual(fields, {'ACTION': 'remove', 'SUBSYSTEM': 'module'})
+
+class TestReconciler(unittest.TestCase):
+    """Test desired-state reconciliation and the state journal"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'state.json')
+        self.orchestrator = PipelineOrchestrator()
+        self.observed = {'webcam': True, 'microphone': False}
+        self.observers = {n: MagicMock(side_effect=lambda n=n: self.observed[n]) for n in self.observed}
+        self.stages = {n: MagicMock(return_value=True) for n in self.observed}
+        self.actions = [Action(Stage(n, self.stages[n]), {n: True}) for n in self.observed]
+        
+    def tearDown(self):
+        self.orchestrator.shutdown()
+        shutil.rmtree(self.root)
+        
+    def reconciler(self, boot_id='boot-1'):
+        journal = StateJournal(self.path, boot_id)
+        protections = [Protection(n, self.observers[n]) for n in self.observed]
+        return Reconciler(self.orchestrator, journal, protections)
+        
+    def test_runs_only_missing_actions(self):
+        """Test protections already in effect are skipped and the saving estimated"""
+        reconciler = self.reconciler()
+        reconciler.journal.durations['activation.webcam'] = 1.5
+        desired = {'webcam': True, 'microphone': True}
+        report = reconciler.reconcile('activation', desired, self.actions)
+        self.stages['webcam'].assert_not_called()
+        self.stages['microphone'].assert_called_once()
+        self.assertEqual(report.skipped, ['webcam'])
+        self.assertEqual(report.saved, 1.5)
+        self.assertTrue(report.stage_ok('webcam'))
+        self.assertEqual(report.sources, {'webcam': PROBE, 'microphone': PROBE})
+        # A repeated activation finds everything in place
+        report = reconciler.reconcile('activation', desired, self.actions)
+        self.assertEqual(sorted(report.skipped), ['microphone', 'webcam'])
+        self.assertEqual(self.stages['microphone'].call_count, 1)
+        
+    def test_journal_resume_and_reboot(self):
+        """Test a restart resumes from the journal and a reboot discards it"""
+        self.reconciler().reconcile('activation', {'webcam': True, 'microphone': True}, self.actions)
+        for observer in self.observers.values():
+            observer.reset_mock()
+        observed, sources = self.reconciler().observe(['webcam', 'microphone'])
+        self.assertEqual(observed, {'webcam': True, 'microphone': True})
+        self.assertEqual(set(sources.values()), {JOURNAL})
+        self.observers['webcam'].assert_not_called()
+        rebooted = self.reconciler(boot_id='boot-2')
+        self.assertEqual(rebooted.journal.state, {})
+        self.assertIn('activation.microphone', rebooted.journal.durations)
+        
+    def test_failed_stage_forgets_state(self):
+        """Test a failed action leaves its protection unknown so it is retried"""
+        self.stages['microphone'].return_value = False
+        reconciler = self.reconciler()
+        reconciler.reconcile('activation', {'webcam': True, 'microphone': True}, self.actions)
+        self.assertIsNone(reconciler.journal.get('microphone'))
+        reconciler.reconcile('activation', {'webcam': True, 'microphone': True}, self.actions)
+        self.assertEqual(self.stages['microphone'].call_count, 2)
+        
+    def test_process_protection_state(self):
+        """Test the volatile process protection reflects enforcement and pending restores"""
+        pm = MagicMock(enforcement=None, launch_records=[], suspended=[], cloaked=[])
+        hardware = MagicMock(os_type='Linux')
+        protections = {p.name: p for p in build_protections(hardware, pm, MagicMock())}
+        self.assertTrue(protections['processes'].volatile)
+        self.assertIsNone(protections['location'].observe)
+        self.assertFalse(protections['processes'].observe())
+        pm.enforcement = MagicMock(running=True)
+        pm.snapshot.return_value = []
+        self.assertTrue(protections['processes'].observe())
+        pm.snapshot.return_value = ['chrome']
+        self.assertIsNone(protections['processes'].observe())
+
+class TestAuditLogger(unittest.TestCase):
+    """Test the asynchronous structured audit pipeline"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'audit.log')
+        
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        
+    def test_structured_records(self):
+        """Test records are typed JSON lines with stage results"""
+        audit = AuditLogger(self.path, fsync=FSYNC_BATCH)
+        stages = [{'name': 'webcam', 'ok': True, 'elapsed': 0.25, 'error': None, 'timed_out': False}]
+        audit.log_activation(['zoom'], True, False, (0,), matched=[{'pid': 42, 'name': 'zoom'}], stages=stages)
+        audit.log_deactivation([], True, True, ())
+        self.assertTrue(audit.flush())
+        audit.close()
+        activation, deactivation = read_records(self.path)
+        self.assertEqual(activation['event'], 'activation')
+        self.assertIs(activation['location_ok'], False)
+        self.assertEqual(activation['matched'][0]['pid'], 42)
+        self.assertEqual(activation['stages'][0]['elapsed'], 0.25)
+        self.assertLess(activation['seq'], deactivation['seq'])
+        self.assertIs(deactivation['hardware_restored'], True)
+        
+    def test_producers_never_block(self):
+        """Test a stalled writer makes producers drop records instead of waiting"""
+        audit = AuditLogger(self.path, queue_size=2)
+        gate = threading.Event()
+        write = audit._write
+        audit._write = lambda records: (gate.wait(), write(records))
+        audit.log('probe')
+        deadline = time.monotonic() + 2
+        while audit._queue.qsize() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        start = time.monotonic()
+        results = [audit.log('event', n=n) for n in range(3)]
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(results, [True, True, False])
+        gate.set()
+        self.assertTrue(audit.flush())
+        audit.close()
+        self.assertEqual(audit.stats()['written'], 3)
+        self.assertEqual(audit.stats()['dropped'], 1)
+        
+    def test_close_writes_a_full_queue(self):
+        """Test shutdown waits for a slow writer to drain a full queue instead of dropping it"""
+        audit = AuditLogger(self.path, queue_size=20, batch_size=1)
+        write = audit._write
+        audit._write = lambda records: (time.sleep(0.02), write(records))
+        results = [audit.log('event', n=n) for n in range(20)]
+        audit.close(timeout=0.1)
+        self.assertFalse(audit._thread.is_alive())
+        self.assertEqual(audit.stats()['written'], results.count(True))
+        self.assertEqual(len(read_records(self.path)), results.count(True))
+        
+    def test_rotation_compresses_archives(self):
+        """Test size-based rotation keeps backup_count gzip archives in order"""
+        audit = AuditLogger(self.path, batch_size=1, max_bytes=400, backup_count=2)
+        for n in range(40):
+            audit.log('event', n=n, padding='x' * 20)
+        audit.close()
+        self.assertGreater(audit.rotations, 2)
+        self.assertFalse(os.path.exists(audit.archive_path(3)))
+        older = read_records(audit.archive_path(2))
+        newer = read_records(audit.archive_path(1))
+        current = read_records(self.path) if os.path.exists(self.path) else []
+        seqs = [r['seq'] for r in older + newer + current]
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(seqs[-1], 40)
+        with self.assertRaises(ValueError):
+            AuditLogger(self.path, fsync='sometimes')
+
+def write_audit_history(path, count, start=1.7e9, step=37.0, seed=1, first_seq=1, mode='w'):
+    """Synthetic audit log in the AuditLogger record format"""
+    rng = random.Random(seed)
+    procs = ['zoom.exe', 'teams.exe', 'chrome', 'slack', 'obs', 'discord']
+    records = []
+    with open(path, mode) as f:
+        for n in range(count):
+            seq = first_seq + n
+            webcam_ok = rng.random() > 0.05
+            stages = [{'name': 'webcam', 'ok': webcam_ok, 'elapsed': 0.1},
+                      {'name': 'processes', 'ok': True, 'elapsed': 0.2}]
+            record = {'ts': start + (seq - 1) * step, 'seq': seq, 'stages': stages}
+            if seq % 2:
+                record.update(event='activation', hardware_ok=webcam_ok, location_ok=True,
+                              terminated=rng.sample(procs, rng.randint(0, 2)))
+            else:
+                record.update(event='deactivation', hardware_restored=True, location_restored=True,
+                              still_running=[])
+            records.append(record)
+            f.write(json.dumps(record) + '\n')
+    return records
+
+class TestAuditQuery(unittest.TestCase):
+    """Test indexed audit queries against a synthetic history"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.root, 'audit.log')
+        cls.records = write_audit_history(cls.path, 50000)
+        
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+        
+    def test_queries_match_full_scan(self):
+        """Test term and time-range queries return exactly what a full scan finds"""
+        query = AuditQuery(self.path)
+        start, end = self.records[10000]['ts'] + 5, self.records[30000]['ts']
+        expected = [r for r in self.records if start <= r['ts'] <= end
+                    and 'proc:zoom.exe' in record_terms(r) and 'fail:webcam' in record_terms(r)]
+        found = list(query.search(start, end, process='ZOOM.exe', failed='webcam'))
+        self.assertEqual([r['seq'] for r in found], [r['seq'] for r in expected])
+        in_range = [r['seq'] for r in query.search(start, end)]
+        self.assertEqual(in_range, [r['seq'] for r in self.records if start <= r['ts'] <= end])
+        last = query.last(process='slack', event='activation')
+        expected_last = [r for r in self.records if 'slack' in r.get('terminated', ())][-1]
+        self.assertEqual(last['seq'], expected_last['seq'])
+        self.assertEqual(query.count(failed='hardware'),
+                         sum(1 for r in self.records if r.get('hardware_ok') is False))
+        
+    def test_incremental_update_and_rotation(self):
+        """Test appends are indexed as new segments and a replaced log is re-indexed"""
+        path = os.path.join(self.root, 'incremental.log')
+        write_audit_history(path, 500)
+        query = AuditQuery(path)
+        self.assertEqual(query.refresh(), 500)
+        write_audit_history(path, 100, first_seq=501, mode='a')
+        self.assertEqual(AuditQuery(path).refresh(), 100)
+        self.assertEqual(len(query.index.segments), 1)
+        self.assertEqual(query.count(), 600)
+        self.assertEqual(len(query.index.segments), 2)
+        write_audit_history(path, 10, start=1.8e9)
+        self.assertEqual(query.count(), 10)
+        self.assertEqual(query.index.records, 10)
+        
+    def test_cli(self):
+        """Test the ghostmode audit query command"""
+        out = io.StringIO()
+        with redirect_stdout(out):
+            code = ghostmode.main(['audit', 'query', '--log', self.path, '--process', 'chrome',
+                                   '--last', '--json'])
+        self.assertEqual(code, 0)
+        expected = [r for r in self.records if 'chrome' in r.get('terminated', ())][-1]
+        self.assertEqual(json.loads(out.getvalue())['seq'], expected['seq'])
+
+class TestHeadlessController(unittest.TestCase):
+    """Test the Qt-free controller and command line"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.config = os.path.join(self.root, 'targets.txt')
+        with open(self.config, 'w') as f:
+            f.write('ghost-test-no-such-process\n')
+        self.state = os.path.join(self.root, 'state.json')
+        self.audit = os.path.join(self.root, 'audit.log')
+        
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        
+    def controller(self):
+        controller = GhostModeController(self.config, self.state, self.audit, enforce=False)
+        controller.hardware = MagicMock(os_type='Linux')
+        controller.hardware.check_webcam_status.return_value = False
+        controller.hardware.check_microphone_status.return_value = False
+        controller.location_service = MagicMock()
+        return controller
+        
+    def test_activation_is_idempotent_and_audited(self):
+        """Test a second activation skips everything and both are audited"""
+        controller = self.controller()
+        record = LaunchRecord('zoom', '/usr/bin/zoom', ['zoom'], '/', {}, None, 4242)
+        controller.process_manager.launch_records = [record]
+        self.assertTrue(controller.activate().ok)
+        controller.hardware.check_webcam_status.return_value = True
+        report = controller.activate()
+        self.assertEqual(sorted(report.skipped), ['location', 'microphone', 'processes', 'webcam'])
+        self.assertEqual(controller.hardware.disable_webcam.call_count, 1)
+        controller.close()
+        self.assertEqual([r['event'] for r in read_records(self.audit)], ['activation', 'activation'])
+        # A later process picks up what it needs to restore
+        restarted = GhostModeController(self.config, self.state, self.audit, enforce=False)
+        self.assertEqual(restarted.process_manager.launch_records, [record])
+        self.assertEqual(restarted.status()['pending_restore'], ['zoom'])
+        
+    def test_cli_status_stays_headless(self):
+        """Test the status command never imports Qt or winreg"""
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ghostmode.py')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', script, 'status', '--json', '--local', '--config', self.config,
+             '--state', self.state, '--audit', self.audit],
+            cwd=self.root, capture_output=True, text=True, timeout=30
+        )
+        self.assertIn(result.returncode, (0, 3), result.stderr[-500:])
+        modules = {line.split('|')[-1].strip() for line in result.stderr.splitlines()
+                   if line.startswith('import time:')}
+        self.assertIn('process_manager', modules)
+        self.assertFalse({m for m in modules if m.split('.')[0] in ('PyQt5', 'winreg')})
+        self.assertIn('protections', json.loads(result.stdout))
+
+
+class FakeReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.ok = True
+        
+    def to_dict(self):
+        return {'kind': self.kind, 'ok': True, 'stages': []}
+
+
+class SlowController:
+    """Controller stand-in whose pipelines take a while and are counted"""
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = []
+        self.status_calls = 0
+        self.active = False
+        
+    def _run(self, active, on_progress):
+        self.calls.append(active)
+        on_progress('started', 'webcam', None)
+        time.sleep(self.delay)
+        self.active = active
+        return FakeReport('activation' if active else 'deactivation')
+        
+    def activate(self, on_progress=None):
+        return self._run(True, on_progress)
+        
+    def deactivate(self, on_progress=None):
+        return self._run(False, on_progress)
+        
+    def status(self):
+        self.status_calls += 1
+        time.sleep(0.05)
+        return {'active': self.active, 'protections': {}, 'sources': {}, 'pending_restore': []}
+
+
+class TestDaemon(unittest.TestCase):
+    """Test the control daemon coalesces clients onto shared runs"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.root, 'ghost.sock')
+        self.controller = SlowController()
+        self.triggers = None
+        
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        
+    def serve(self, client_main):
+        """Run the daemon on a background loop while client_main runs here"""
+        import asyncio
+        daemon = GhostDaemon(self.controller, self.socket_path, triggers=self.triggers)
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(daemon.start())
+            ready.set()
+            loop.run_forever()
+            
+        thread = threading.Thread(target=run_loop, daemon=True)
+        thread.start()
+        self.assertTrue(ready.wait(5))
+        try:
+            return daemon, client_main()
+        finally:
+            asyncio.run_coroutine_threadsafe(daemon.stop(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(5)
+            loop.close()
+            
+    def test_foreign_socket_is_not_trusted(self):
+        """Test a socket another user planted is neither used nor removed"""
+        import asyncio
+        import socket
+        if os.getuid() != 0:
+            self.skipTest("needs root to plant another user's socket")
+        planted = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(planted.close)
+        planted.bind(self.socket_path)
+        planted.listen()
+        os.chown(self.socket_path, 65534, 65534)
+        self.assertFalse(DaemonClient(self.socket_path).alive())
+        with self.assertRaises(PermissionError):
+            asyncio.run(GhostDaemon(self.controller, self.socket_path).start())
+        self.assertTrue(os.path.exists(self.socket_path))
+        
+        shared = os.path.join(self.root, 'shared')
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        with self.assertRaises(PermissionError):
+            private_dir(shared)
+        self.assertEqual(os.stat(private_dir(os.path.join(self.root, 'own'))).st_mode & 0o777, 0o700)
+        
+    def test_socket_is_private(self):
+        """Test the daemon's socket is only accessible to its user"""
+        def clients():
+            self.assertTrue(DaemonClient(self.socket_path).alive())
+            return os.stat(self.socket_path).st_mode & 0o777
+            
+        _, mode = self.serve(clients)
+        self.assertEqual(mode, 0o600)
+        
+    def test_concurrent_toggles_coalesce(self):
+        """Test hundreds of simultaneous activations share one pipeline run"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        def clients():
+            with ThreadPoolExecutor(300) as pool:
+                return list(pool.map(lambda _: DaemonClient(self.socket_path).request('activate'), range(300)))
+                
+        daemon, results = self.serve(clients)
+        self.assertEqual(self.controller.calls, [True])
+        self.assertTrue(all(r['ok'] and r['kind'] == 'activation' for r in results))
+        self.assertEqual(daemon.stats()['requests'], 300)
+        
+    def test_last_request_wins(self):
+        """Test a queued toggle is superseded by a newer opposite request"""
+        def clients():
+            client = DaemonClient(self.socket_path)
+            threads, results = [], {}
+            for name in ('activate', 'deactivate', 'activate'):
+                thread = threading.Thread(target=lambda n=name: results.setdefault(len(results), client.request(n)))
+                thread.start()
+                threads.append(thread)
+                time.sleep(0.05)
+            for thread in threads:
+                thread.join(5)
+            return list(results.values())
+            
+        _, results = self.serve(clients)
+        self.assertEqual(self.controller.calls, [True])
+        self.assertEqual(sum(1 for r in results if r.get('superseded')), 1)
+        
+    def test_status_is_cached(self):
+        """Test repeated status requests within the TTL reuse one probe"""
+        def clients():
+            client = DaemonClient(self.socket_path)
+            return [client.request('status') for _ in range(20)]
+            
+        _, results = self.serve(clients)
+        self.assertEqual(self.controller.status_calls, 1)
+        self.assertFalse(results[-1]['active'])
+
+    def test_failing_command_is_answered(self):
+        """Test an exception in a command becomes an error reply on a connection that stays open"""
+        import socket
+        self.controller.status = MagicMock(side_effect=[OSError("probe failed"), {'active': True}])
+
+        def clients():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(5)
+                sock.connect(self.socket_path)
+                stream = sock.makefile('rb')
+                replies = []
+                for n in range(2):
+                    sock.sendall(json.dumps({'id': n, 'cmd': 'status'}).encode() + b'\n')
+                    replies.append(json.loads(stream.readline()))
+                return replies
+
+        _, replies = self.serve(clients)
+        self.assertEqual(replies[0], {'id': 0, 'ok': False, 'error': 'probe failed'})
+        self.assertTrue(replies[1]['ok'] and replies[1]['result']['active'])
+
+    def test_subscribers_receive_events(self):
+        """Test subscribe streams stage and finish events and unknown commands fail"""
+        def clients():
+            client = DaemonClient(self.socket_path)
+            events = []
+            stream = client.subscribe()
+            listener = threading.Thread(target=lambda: events.extend(
+                e for _, e in zip(range(3), stream)))
+            listener.start()
+            time.sleep(0.1)
+            client.request('activate')
+            listener.join(5)
+            with self.assertRaises(RuntimeError):
+                client.request('explode')
+            return events
+            
+        _, events = self.serve(clients)
+        self.assertEqual([e['event'] for e in events], ['pipeline_started', 'stage', 'pipeline_finished'])
+        
+    def test_trigger_storm_runs_one_pipeline(self):
+        """Test a storm of matching events becomes one activation through the daemon"""
+        self.triggers = TriggerEngine([Rule('call', PROCESS, 'activate', 'exec', processes=['glob:zoom*'])],
+                                      sources=[])
+        
+        def clients():
+            now = time.monotonic()
+            self.triggers.submit(Event(PROCESS, 'exec', {'name': 'zoom'}, now) for _ in range(500))
+            self.assertTrue(self.triggers.wait_idle())
+            return DaemonClient(self.socket_path).request('status')
+            
+        daemon, status = self.serve(clients)
+        self.assertEqual(self.controller.calls, [True])
+        self.assertTrue(status['active'])
+        self.assertEqual(daemon.stats()['triggers']['debounced'], 499)
+        self.assertFalse(self.triggers.running)
+
+
+class TestPanicMode(unittest.TestCase):
+    """Test the armed kill plan and its latency objective"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.config = os.path.join(self.root, 'targets.txt')
+        with open(self.config, 'w') as f:
+            f.write('cmd:27.1828\n')
+        self.state = os.path.join(self.root, 'state.json')
+        self.procs = []
+        
+    def tearDown(self):
+        for proc in self.procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        shutil.rmtree(self.root)
+        
+    def test_latency_histogram_and_objective(self):
+        """Test bucketed percentiles, persistence and objective evaluation"""
+        histogram = LatencyHistogram()
+        objective = LatencyObjective(0.25, 0.9)
+        self.assertIsNone(objective.evaluate(histogram)['met'])
+        for ms in [5] * 80 + [200] * 15 + [3000] * 5:
+            histogram.record(ms / 1000)
+        self.assertEqual(histogram.percentile(50), 0.01)
+        self.assertEqual(histogram.percentile(99), 3.0)
+        self.assertAlmostEqual(histogram.fraction_within(0.25), 0.95)
+        restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+        self.assertEqual(restored.summary(), histogram.summary())
+        self.assertTrue(objective.evaluate(restored)['met'])
+        self.assertFalse(LatencyObjective(0.1, 0.9).evaluate(restored)['met'])
+        
+    def test_disarm_releases_only_when_armed(self):
+        """Test the location key is released only by a disarm that follows arming"""
+        controller = GhostModeController(self.config, self.state, os.path.join(self.root, 'audit.log'),
+                                         enforce=False)
+        controller.hardware = MagicMock(os_type='Linux')
+        controller.location_service = MagicMock()
+        panic = PanicArm(controller, source=MagicMock())
+        panic.disarm()
+        controller.location_service.release.assert_not_called()
+        # A failed arm gives back what it prepared
+        with patch.object(panic, 'refresh', side_effect=OSError("scan failed")):
+            with self.assertRaises(OSError):
+                panic.arm()
+        controller.location_service.release.assert_called_once_with()
+        self.assertFalse(panic.armed)
+        controller.close()
+
+    @unittest.skipUnless(os.path.exists('/proc/self/stat') and shutil.which('sleep'), "requires procfs")
+    def test_trigger_runs_plan_without_scanning(self):
+        """Test a process started after arming is killed by the plan alone"""
+        controller = GhostModeController(self.config, self.state, os.path.join(self.root, 'audit.log'),
+                                         enforce=False)
+        controller.hardware = MagicMock(os_type='Linux')
+        controller.hardware.check_webcam_status.return_value = True
+        controller.hardware.check_microphone_status.return_value = False
+        controller.location_service = MagicMock()
+        controller.panic = PanicArm(controller, interval=0.02, rescan_interval=60,
+                                    source=ProcDiffSource())
+        self.procs.append(subprocess.Popen(['sleep', '27.1828']))
+        controller.panic.arm()
+        self.assertTrue(controller.armed)
+        self.procs.append(subprocess.Popen(['sleep', '27.1828']))
+        deadline = time.monotonic() + 5
+        while self.procs[1].pid not in controller.panic.plan.matches:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        pm = controller.process_manager
+        with patch.object(pm.scanner, 'scan', side_effect=AssertionError("scanned on trigger")):
+            report = controller.activate()
+        for proc in self.procs:
+            proc.wait(timeout=5)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.skipped, ['webcam'])
+        self.assertEqual(sorted(pm.killed_processes), ['sleep', 'sleep'])
+        self.assertEqual(len(pm.launch_records), 1)
+        self.assertFalse(controller.armed)
+        latency = report.context['panic']['latency']
+        self.assertAlmostEqual(latency, max(report.context['panic']['stages'].values()), places=3)
+        self.assertEqual(controller.journal.metrics[LATENCY_METRIC]['counts'][-1], 0)
+        # Arming survives the activation it was spent on
+        pm.launch_records = []
+        controller.deactivate()
+        self.assertTrue(controller.armed)
+        controller.close()
+        restarted = GhostModeController(self.config, self.state, enforce=False)
+        self.assertEqual(restarted.panic.latency.count, 1)
+
+class TestTracing(unittest.TestCase):
+    """Test span metrics, their export and single-operation profiling"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.orchestrator = PipelineOrchestrator()
+        
+    def tearDown(self):
+        tracing.disable()
+        self.orchestrator.shutdown()
+        shutil.rmtree(self.root)
+        
+    def test_disabled_spans_are_shared_noops(self):
+        """Test nothing is allocated or recorded while tracing is off"""
+        tracing.disable()
+        self.assertIs(tracing.span('command', command='amixer'), tracing.span('scan'))
+        with tracing.span('scan') as span:
+            span.label(outcome='ok')
+        tracing.count('processes_matched', 3)
+        self.assertIsNone(tracing.tracer())
+        
+    def test_stage_spans_export_prometheus(self):
+        """Test stage and command spans land in histograms, textfile and HTTP endpoint"""
+        tracer = tracing.enable(tracing.Tracer())
+        def boom():
+            raise RuntimeError("no device")
+        stages = [Stage('webcam', lambda: True), Stage('microphone', boom)]
+        with tracing.span('command', runner='shell', command='say "hi"\\'):
+            pass
+        self.orchestrator.run('activation', stages)
+        tracing.count('processes_matched', 2)
+        text = tracer.render()
+        self.assertIn('ghostmode_span_duration_seconds_count{span="stage",kind="activation",stage="webcam"} 1', text)
+        self.assertIn('ghostmode_span_errors_total{span="stage",kind="activation",stage="microphone"} 1', text)
+        self.assertIn('command="say \\"hi\\"\\\\"', text)
+        self.assertIn('le="+Inf"', text)
+        self.assertIn('ghostmode_processes_matched_total 2', text)
+        path = os.path.join(self.root, 'ghostmode.prom')
+        tracer.write_textfile(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), tracer.render())
+        server = tracing.MetricsServer(port=0)
+        try:
+            import urllib.request
+            host, port = server.address[:2]
+            with urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=5) as response:
+                self.assertIn(b'stage="webcam"', response.read())
+        finally:
+            server.close()
+        self.assertEqual(tracer.summary()['stage kind=activation stage=webcam']['count'], 1)
+        
+    def test_profile_session_covers_stage_threads(self):
+        """Test a profile of one run includes work done on pool threads"""
+        def probe_hardware_for_profile():
+            return sum(range(10000)) > 0
+        with tracing.ProfileSession(self.root, 'activation') as session:
+            result = self.orchestrator.run('activation', [Stage('webcam', probe_hardware_for_profile)])
+        self.assertTrue(result.ok)
+        import pstats
+        functions = {name for _, _, name in pstats.Stats(session.paths['cpu']).stats}
+        self.assertIn('probe_hardware_for_profile', functions)
+        with open(session.paths['memory']) as f:
+            self.assertTrue(f.readline().startswith('current '))
+        self.assertIs(tracing.profiled_call(len, 'abc'), 3)
+        
+    def test_cli_profile_runs_every_stage(self):
+        """Test activate --profile completes its stages and profiles them"""
+        sim = SimulatedOS(100)
+        self.addCleanup(sim.close)
+        controller = sim.controller()
+        directory = os.path.join(self.root, 'profiles')
+        with patch('controller.GhostModeController', lambda *args, **kwargs: controller), \
+                patch('sys.stdout', io.StringIO()) as out, patch('sys.stderr', io.StringIO()):
+            code = ghostmode.main(['activate', '--json', '--profile', directory])
+        summary = json.loads(out.getvalue())
+        self.assertEqual(code, 0, summary)
+        self.assertTrue(all(stage['ok'] for stage in summary['stages']), summary['stages'])
+        import pstats
+        prof = [name for name in os.listdir(directory) if name.endswith('.prof')]
+        functions = {name for _, _, name in pstats.Stats(os.path.join(directory, prof[0])).stats}
+        self.assertIn('kill_processes', functions)
+
+class TestMacRandomizer(unittest.TestCase):
+    """Test native, parallel MAC address randomization"""
+    
+    def test_addresses_and_sysfs(self):
+        """Test generated addresses are locally administered and links come from sysfs"""
+        rng = random.Random(1)
+        for prefix in (b'', b'\x01\x23\x45'):
+            for _ in range(200):
+                first = int(random_mac(rng, prefix)[:2], 16)
+                self.assertEqual(first & 0x03, 0x02)
+        self.assertTrue(random_mac(rng, b'\x02\x00\x5e').startswith('02:00:5e:'))
+        with self.assertRaises(ValueError):
+            MacRandomizer(NetSyscalls(), prefix='02:00:5e:00:00:01')
+        
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        for name, (link_type, device, address, _) in NETWORK_LINKS.items():
+            os.makedirs(os.path.join(root, name))
+            for attr, value in (('type', link_type), ('address', address)):
+                with open(os.path.join(root, name, attr), 'w') as f:
+                    f.write(f"{value}\n")
+            if device:
+                os.makedirs(os.path.join(root, name, 'device'))
+        syscalls = NetSyscalls(root)
+        self.assertEqual(MacRandomizer(syscalls).interfaces(), ['eth0', 'wlan0'])
+        self.assertEqual(syscalls.get_address('wlan0'), 'a4:c3:f0:11:22:33')
+        with patch.object(syscalls, '_ioctl') as ioctl:
+            syscalls.set_address('wlan0', '02:00:00:00:00:01')
+        request, ifreq = ioctl.call_args.args
+        self.assertEqual((request, len(ifreq)), (SIOCSIFHWADDR, 40))
+        self.assertEqual(ifreq[:5], b'wlan0')
+        self.assertEqual(ifreq[18:24], bytes([2, 0, 0, 0, 0, 1]))
+        
+    def test_parallel_randomize_and_restore(self):
+        """Test interfaces change concurrently, busy links are cycled and originals come back"""
+        links = {f'eth{n}': NETWORK_LINKS['eth0'] for n in range(6)}
+        mac = MacRandomizer(FakeNetSyscalls(Latency(0.05, 0), links=links))
+        start = time.monotonic()
+        self.assertTrue(all(mac.randomize().values()))
+        # One 50ms call per link: 0.3s if the six ran one after another
+        self.assertLess(time.monotonic() - start, 0.2)
+        
+        net = FakeNetSyscalls()
+        mac = MacRandomizer(net, rng=random.Random(2))
+        self.assertEqual(mac.randomize(), {'eth0': True, 'wlan0': True})
+        # wlan0 rejects changes while up, so it is taken down and back up
+        self.assertEqual(net.calls['set_address'], 3)
+        self.assertEqual(net.calls['set_flags'], 2)
+        self.assertEqual(net.flags['wlan0'], IFF_UP)
+        self.assertNotEqual(net.addresses['eth0'], NETWORK_LINKS['eth0'][2])
+        self.assertEqual(net.addresses['docker0'], NETWORK_LINKS['docker0'][2])
+        self.assertTrue(mac.randomize(['eth0'])['eth0'])
+        self.assertEqual(mac.originals, {name: NETWORK_LINKS[name][2] for name in ('eth0', 'wlan0')})
+        self.assertFalse(mac.randomize(['eth9'])['eth9'])
+        
+        self.assertEqual(mac.restore(), {'eth0': True, 'wlan0': True})
+        self.assertEqual(net.addresses['wlan0'], NETWORK_LINKS['wlan0'][2])
+        self.assertEqual(net.addresses['eth0'], NETWORK_LINKS['eth0'][2])
+        self.assertEqual(mac.originals, {})
+        net.failure_rate = 1.0
+        self.assertEqual(mac.randomize(), {'eth0': False, 'wlan0': False})
+        self.assertEqual(mac.originals, {})
+
+class TestProfiles(unittest.TestCase):
+    """Test named profiles, their hot reload and the compiled target cache"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.config = os.path.join(self.root, 'targets.txt')
+        self.ini = os.path.join(self.root, 'profiles.ini')
+        self.write(self.config, 'zoom.exe\n# comment\nglob:chrome* @freeze\n')
+        
+    def write(self, path, text):
+        # Replace atomically, as editors do
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+        
+    def test_parse_and_cached_targets(self):
+        """Test profiles parse and a cached target set loads without parsing rules"""
+        self.write(self.ini, '[DEFAULT]\ntargets_file = targets.txt\n[default]\n'
+                             '[meeting]\ntargets =\n    re:te+ams\n    cmd:--remote\n'
+                             'protections = processes location\nmac_prefix = 02:00:5e\n')
+        profiles = parse_profiles(self.ini)
+        self.assertEqual(profiles['default'].targets, ('zoom.exe', 'glob:chrome* @freeze'))
+        meeting = profiles['meeting']
+        self.assertEqual(meeting.targets[2:], ('re:te+ams', 'cmd:--remote'))
+        self.assertEqual(meeting.protections, ('processes', 'location'))
+        for bad in ('protections = webcam radio', 'mac_prefix = 02:zz', 'mac_prefix = 02:00:5e:00:00:01'):
+            self.write(self.ini, f'[x]\n{bad}\n')
+            with self.assertRaises(ValueError):
+                parse_profiles(self.ini)
+        
+        cache_path = os.path.join(self.root, 'targets.cache')
+        compiled = TargetCache(cache_path).get(meeting)
+        self.assertTrue(os.path.exists(cache_path))
+        with patch.object(TargetSet, 'compile', side_effect=AssertionError("parsed again")):
+            cache = TargetCache(cache_path)
+            loaded = cache.get(meeting)
+            self.assertIs(cache.get(meeting), loaded)
+        self.assertEqual(loaded.rules, compiled.rules)
+        self.assertEqual(loaded.strategies['glob:chrome*'], 'freeze')
+        for process in (('chrome.exe',), ('teeeams',), ('python', None, ['x', '--remote']), ('teams2',)):
+            self.assertEqual(loaded.matcher.match(*process), compiled.matcher.match(*process))
+        self.assertIsNone(loaded.matcher.match('teams2'))
+        
+    def test_hot_reload_keeps_last_valid(self):
+        """Test edits are picked up through the watch and a broken file is ignored"""
+        store = ProfileStore(self.ini, self.config, TargetCache(os.path.join(self.root, 'c')))
+        self.addCleanup(store.close)
+        self.assertEqual(list(store.profiles), ['default'])
+        self.assertEqual(store.get().targets, ('zoom.exe', 'glob:chrome* @freeze'))
+        self.assertFalse(store.refresh())
+        self.write(self.ini, '[travel]\ntargets_file = targets.txt\nprotections = location\n')
+        self.assertTrue(store.refresh())
+        self.assertEqual(store.default(), 'travel')
+        self.assertFalse(store.refresh())
+        self.write(self.config, 'slack\n')
+        self.assertTrue(store.refresh())
+        self.assertEqual(store.get('travel').targets, ('slack',))
+        self.write(self.ini, '[travel\nbroken')
+        self.assertFalse(store.refresh())
+        self.assertEqual(store.get('travel').protections, ('location',))
+        # A rule that would only fail when compiled is rejected at reload too
+        self.write(self.ini, '[travel]\ntargets = re:foo(\n')
+        self.assertFalse(store.refresh())
+        self.assertEqual(store.get('travel').targets, ('slack',))
+        with self.assertRaises(KeyError):
+            store.get('meeting')
+
+    def test_watch_without_inotify_polls_mtimes(self):
+        """Test watching falls back to mtimes where libc cannot be loaded, as on Windows"""
+        with patch.object(sys, 'platform', 'win32'), \
+                patch('ctypes.CDLL', side_effect=TypeError("expected str, got NoneType")):
+            store = ProfileStore(self.ini, self.config, TargetCache(os.path.join(self.root, 'c')))
+        self.addCleanup(store.close)
+        self.assertIsNone(store.watcher.inotify)
+        self.write(self.ini, '[travel]\ntargets = slack\n')
+        self.assertTrue(store.refresh())
+        self.assertEqual(store.get().targets, ('slack',))
+
+    def test_enforcement_applies_edits(self):
+        """Test a running enforcement watcher picks up edited targets"""
+        controller = GhostModeController(self.config, os.path.join(self.root, 'state.json'),
+                                         os.path.join(self.root, 'audit.log'))
+        self.addCleanup(controller.close)
+        controller.hardware = MagicMock(os_type='Linux')
+        pm = controller.process_manager
+        source = MagicMock(name='source')
+        source.poll.side_effect = lambda timeout: time.sleep(timeout) or []
+        pm.start_enforcement(source=source, interval=0.01, refresh_interval=0.01)
+        self.write(self.config, 'slack\n')
+        deadline = time.monotonic() + 5
+        while pm.target_processes != ['slack'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pm.target_processes, ['slack'])
+        
+    def test_controller_applies_profile(self):
+        """Test a profile selects targets and protections, and is remembered"""
+        self.write(self.ini, '[default]\ntargets_file = targets.txt\n'
+                             '[meeting]\ntargets = ghost-test-no-such-process\nprotections = processes\n')
+        state = os.path.join(self.root, 'state.json')
+        controller = GhostModeController(self.config, state, os.path.join(self.root, 'audit.log'),
+                                         enforce=False)
+        controller.hardware = MagicMock(os_type='Linux')
+        controller.location_service = MagicMock()
+        self.assertEqual(controller.process_manager.target_processes, ['zoom.exe', 'glob:chrome*'])
+        controller.select_profile('meeting')
+        self.assertEqual(controller.process_manager.target_processes, ['ghost-test-no-such-process'])
+        report = controller.activate()
+        self.assertTrue(report.ok)
+        self.assertEqual(report.desired, {'processes': True})
+        self.assertFalse(controller.hardware.disable_webcam.called)
+        self.assertEqual(controller.status()['profile'], 'meeting')
+        controller.close()
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'ghost_mode_targets.cache')))
+        restarted = GhostModeController(self.config, state, enforce=False)
+        self.assertEqual(restarted.profile.name, 'meeting')
+        self.assertEqual(restarted.process_manager.target_processes, ['ghost-test-no-such-process'])
+        restarted.close()
+
+class TestRegistry(unittest.TestCase):
+    """Test cached, transactional registry access"""
+    
+    def setUp(self):
+        self.backend = MemoryRegistryBackend({SENSOR_KEY: {SENSOR_VALUE: (1, REG_DWORD)}})
+        self.registry = Registry(self.backend)
+        self.addCleanup(self.registry.close)
+        
+    def test_handle_and_values_cached(self):
+        """Test a key is opened once and reads are served from cache until invalidated"""
+        for _ in range(50):
+            self.assertEqual(self.registry.get(SENSOR_KEY, SENSOR_VALUE), 1)
+        self.registry.set(SENSOR_KEY, SENSOR_VALUE, 0)
+        self.assertEqual(self.registry.get(SENSOR_KEY, SENSOR_VALUE), 0)
+        self.assertEqual(self.backend.operations, {'open': 1, 'query': 1, 'set': 1})
+        self.assertEqual(self.registry.get(SENSOR_KEY, 'Missing', 'default'), 'default')
+        self.backend.keys[SENSOR_KEY][SENSOR_VALUE] = (1, REG_DWORD)
+        self.assertEqual(self.registry.get(SENSOR_KEY, SENSOR_VALUE), 0)
+        self.registry.invalidate(SENSOR_KEY)
+        self.assertEqual(self.registry.get(SENSOR_KEY, SENSOR_VALUE), 1)
+        self.registry.close()
+        self.assertEqual(self.backend.operations['close'], 1)
+        
+    def test_transaction_batches_and_discards(self):
+        """Test writes in a transaction are visible, flushed on exit and dropped on error"""
+        with self.registry.transaction():
+            self.registry.set(SENSOR_KEY, SENSOR_VALUE, 0)
+            with self.registry.transaction():
+                self.registry.set(SENSOR_KEY, 'Other', 7)
+            self.assertEqual(self.registry.get(SENSOR_KEY, SENSOR_VALUE), 0)
+            self.assertNotIn('set', self.backend.operations)
+        self.assertEqual(self.backend.operations['set'], 2)
+        self.assertEqual(self.backend.keys[SENSOR_KEY]['Other'], (7, REG_DWORD))
+        with self.assertRaises(RuntimeError):
+            with self.registry.transaction():
+                self.registry.set(SENSOR_KEY, SENSOR_VALUE, 5)
+                raise RuntimeError('abort')
+        self.assertEqual(self.backend.keys[SENSOR_KEY][SENSOR_VALUE], (0, REG_DWORD))
+        
+        # A read-only handle makes writes fail and leaves nothing stale in the cache
+        readonly = Registry(self.backend)
+        self.backend.OpenKey = lambda root, path, reserved=0, access=KEY_READ: \
+            MemoryRegistryBackend.OpenKey(self.backend, root, path, reserved, KEY_READ)
+        self.assertEqual(readonly.get(SENSOR_KEY, SENSOR_VALUE), 0)
+        with self.assertRaises(PermissionError):
+            readonly.set(SENSOR_KEY, SENSOR_VALUE, 1)
+        self.backend.keys[SENSOR_KEY][SENSOR_VALUE] = (3, REG_DWORD)
+        self.assertEqual(readonly.get(SENSOR_KEY, SENSOR_VALUE), 3)
+        
+    def test_location_service_on_memory_backend(self):
+        """Test spoofing and restoring location opens the key once and writes once each"""
+        location = LocationService(self.registry)
+        location.os_type = 'Windows'
+        self.assertTrue(location.prepare())
+        with location.transaction():
+            self.assertTrue(location.spoof_location())
+        self.assertEqual(location.get_current_location(), (0,))
+        with location.transaction():
+            self.assertTrue(location.restore_location())
+        self.assertEqual(location.get_current_location(), (1,))
+        self.assertEqual(self.backend.operations, {'open': 1, 'query': 1, 'set': 2})
+
+class TestNetworkCloak(unittest.TestCase):
+    """Test per-application network cloaking through cgroups and nftables"""
+    
+    def test_ruleset_transactions(self):
+        """Test the ruleset loads atomically, replaces itself and is checked against the cgroup tree"""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        nft = FakeNft(root, Latency(0))
+        cloak = NetworkCloak(root, group='ghost/cloak', runner=nft)
+        with self.assertRaises(OSError):
+            cloak._load(build_ruleset('ghost/cloak'))
+        self.assertEqual(nft.tables, {})
+        os.makedirs(os.path.join(root, 'ghost', 'cloak'))
+        for _ in range(2):
+            cloak._load(build_ruleset('ghost/cloak'))
+        rules = nft.tables[('inet', 'ghostmode')]
+        self.assertEqual([r for r in rules if 'cgroupv2' in r],
+                         ['socket cgroupv2 level 2 "ghost/cloak" counter drop'] * 2)
+        for _ in range(2):
+            cloak._load(build_teardown())
+        self.assertEqual(nft.tables, {})
+        with self.assertRaises(OSError):
+            cloak._load('table inet ghostmode {\n\tchain output {\n')
+        self.assertEqual(nft.calls, 6)
+        
+    def test_cloak_strategy_hundreds_of_apps(self):
+        """Test hundreds of cloaked apps share one transaction and keep running until restored"""
+        sim = SimulatedOS(2000, command_latency=Latency(0))
+        self.addCleanup(sim.close)
+        sim.nft.latency = Latency(0)
+        apps = [f"app{n}" for n in range(300)]
+        for app in apps:
+            main = sim.table.spawn(app, f"/usr/bin/{app}", [app])
+            sim.table.spawn(f"{app}-helper", f"/usr/bin/{app}", [app, '--type=renderer'], main)
+        pm = sim.process_manager()
+        pm.target_processes = [f"{app} @cloak" for app in apps] + ['zoom']
+        self.assertTrue(pm.kill_processes())
+        self.assertEqual(len(pm.cloaked), 600)
+        self.assertEqual({r.name for r in pm.cloaked} - {''}, set(apps))
+        self.assertEqual(pm.killed_processes, ['zoom'] * 7)
+        self.assertEqual(sim.nft.calls, 1)
+        self.assertEqual(len(sim.nft.loads[0].splitlines()), len(build_ruleset().splitlines()))
+        with open(os.path.join(sim.cgroup_root, 'ghostmode-cloak', 'cgroup.procs')) as f:
+            self.assertEqual(len(f.read()), sum(len(str(r.pid)) for r in pm.cloaked))
+        
+        respawned = sim.table.spawn('app7', '/usr/bin/app7', ['app7'])
+        watcher = EnforcementWatcher(pm, source=MagicMock())
+        self.assertEqual(watcher.enforce([(respawned, None)]), 1)
+        self.assertEqual(pm.cloaked[-1].pid, respawned)
+        self.assertEqual(sim.nft.calls, 1)
+        # Respawned kill targets go through the manager's (simulated) terminator
+        self.assertEqual(watcher.enforce([(sim.table.spawn('zoom', '/usr/bin/zoom', ['zoom']), None)]), 1)
+        self.assertEqual(watcher.kills, 1)
+        
+        self.assertTrue(pm.restore_processes())
+        self.assertEqual(len(pm.uncloaked), 601)
+        self.assertEqual(pm.cloaked, [])
+        self.assertEqual(sim.nft.tables, {})
+        self.assertEqual(sim.nft.calls, 2)
+        sim.nft.failure_rate = 1.0
+        pm.target_processes = ['app1 @cloak']
+        self.assertFalse(pm.kill_processes())
+        self.assertEqual(pm.cloaked, [])
+        
+        # A failed teardown still leaves the next cloak to reload the table
+        sim.nft.failure_rate = 0.0
+        self.assertTrue(pm.kill_processes())
+        calls = sim.nft.calls
+        sim.nft.failure_rate = 1.0
+        self.assertFalse(pm.restore_processes())
+        sim.nft.failure_rate = 0.0
+        self.assertTrue(pm.kill_processes())
+        self.assertEqual(sim.nft.calls, calls + 2)
+
+class TestTriggers(unittest.TestCase):
+    """Test the event-driven trigger engine"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        
+    def write_rules(self, text):
+        path = os.path.join(self.root, 'triggers.ini')
+        with open(path, 'w') as f:
+            f.write(text)
+        return parse_rules(path)
+        
+    def test_rules_are_indexed_by_type(self):
+        """Test events are checked only against rules of their type and kind"""
+        rules = self.write_rules(
+            "[call]\non = process\nmatch =\n    glob:zoom*\n    cmd:--meeting\naction = activate\nprofile = meeting\n"
+            "[camera]\non = device\nsubsystem = video4linux\ndevice_action = add\naction = activate\n"
+            "[unplug]\non = device\ndevice_action = remove\naction = deactivate\n"
+            "[wifi]\non = network\ninterface = wl*\nstate = up\naction = activate\n"
+            "[night]\non = time\nwindow = 22:00-7:00\nedge = end\ndays = mon tue\naction = deactivate\n"
+        )
+        self.assertEqual([r.kind for r in rules], ['exec', 'video4linux', None, 'up', 'end'])
+        self.assertEqual(rules[-1].window, '22:00-07:00')
+        engine = TriggerEngine(rules + [Rule(f'app{n}', PROCESS, 'activate', 'exec', processes=[f'app{n}'])
+                                        for n in range(200)])
+        event = lambda type, kind, **fields: Event(type, kind, fields, time.monotonic())
+        self.assertEqual(engine.dispatch(event(DEVICE, 'sound', action='add')), [])
+        self.assertEqual(engine.checks, 1)
+        fired = engine.dispatch(event(DEVICE, 'video4linux', action='add', devname='video0'))
+        self.assertEqual([r.name for r in fired], ['camera'])
+        self.assertEqual(engine.checks, 3)
+        self.assertEqual(engine.dispatch(event(NETWORK, 'up', interface='eth0')), [])
+        self.assertEqual([r.name for r in engine.dispatch(event(NETWORK, 'up', interface='wlan0'))], ['wifi'])
+        self.assertEqual(engine.dispatch(event(TIME, 'end', window='22:00-07:00', day='wed')), [])
+        self.assertEqual(len(engine.dispatch(event(TIME, 'end', window='22:00-07:00', day='tue'))), 1)
+        checks = engine.checks
+        self.assertEqual(engine.dispatch(event(PROCESS, 'exec', name='bash', cmdline=['bash'])), [])
+        self.assertEqual(engine.checks, checks)
+        fired = engine.dispatch(event(PROCESS, 'exec', name='chrome', cmdline=['chrome', '--meeting']))
+        self.assertEqual([r.name for r in fired], ['call'])
+        self.assertEqual(engine._pending[:3], ('activate', 'meeting', 'call'))
+        
+        shipped = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'triggers.ini')
+        self.assertEqual([r.type for r in parse_rules(shipped)], [PROCESS, DEVICE])
+        for bad in ("[x]\non = mouse\naction = activate\n", "[x]\non = process\naction = activate\n",
+                    "[x]\non = time\nwindow = 25:00-01:00\naction = activate\n",
+                    "[x]\non = network\nstate = sideways\naction = activate\n",
+                    "[x]\non = process\nmatch = re:foo(\naction = activate\n"):
+            with self.assertRaises(ValueError):
+                self.write_rules(bad)
+                
+    def test_debounce_and_coalescing(self):
+        """Test storms fire once per debounce window and queued actions collapse to the newest"""
+        calls = []
+        
+        def act(action, profile, rule):
+            calls.append(action)
+            time.sleep(0.1)
+            
+        rules = [Rule('call', PROCESS, 'activate', 'exec', processes=['zoom'], debounce=60),
+                 Rule('plug', DEVICE, 'activate', debounce=0), Rule('unplug', NETWORK, 'deactivate', debounce=0)]
+        engine = TriggerEngine(rules, sources=[])
+        engine.start(act)
+        self.addCleanup(engine.stop)
+        engine.submit(Event(PROCESS, 'exec', {'name': 'zoom'}, time.monotonic()) for _ in range(1000))
+        self.assertTrue(engine.wait_idle())
+        self.assertEqual((engine.fired, engine.debounced, calls), (1, 999, ['activate']))
+        self.assertLess(engine.latency.percentile(99), 0.1)
+        
+        engine.submit([Event(DEVICE, 'usb', {}, time.monotonic())])
+        while len(calls) < 2:
+            time.sleep(0.005)
+        # While that runs, a repeat of it supersedes the queued deactivation
+        now = time.monotonic()
+        engine.submit([Event(NETWORK, 'down', {}, now), Event(DEVICE, 'usb', {}, now),
+                       Event(NETWORK, 'down', {}, now), Event(NETWORK, 'down', {}, now)])
+        self.assertTrue(engine.wait_idle())
+        self.assertEqual(calls, ['activate', 'activate', 'deactivate'])
+        self.assertEqual(engine.coalesced, 3)
+        self.assertEqual(engine.stats()['actions'], 3)
+        
+    def test_sources_and_schedule(self):
+        """Test rtnetlink parsing, process resolution and time window edges"""
+        def link(msg_type, name, flags):
+            attr = struct.pack('=HH', 4 + len(name) + 1, 3) + name + b'\0'
+            attr += b'\0' * (-len(attr) % 4)
+            body = struct.pack('=BxHiII', 0, 1, 2, flags, 0) + attr
+            return struct.pack('=IHHII', 16 + len(body), msg_type, 0, 0, 0) + body
+        data = link(16, b'wlan0', 0x10001) + link(16, b'eth0', 0x1) + link(17, b'usb0', 0)
+        self.assertEqual(LinkEvents.parse(data), [('wlan0', 'up'), ('eth0', 'down'), ('usb0', 'removed')])
+        
+        sim = SimulatedOS(100)
+        self.addCleanup(sim.close)
+        pid = sim.table.spawn('zoom', '/usr/bin/zoom', ['zoom'])
+        source = MagicMock()
+        source.poll.return_value = [(pid, 12.5), (1, None)]
+        events = ProcessEvents(sim.table, source).poll(0)
+        self.assertEqual(events, [Event(PROCESS, 'exec', {'pid': pid, 'name': 'zoom', 'exe': '/usr/bin/zoom',
+                                                          'cmdline': ['zoom']}, 12.5)])
+        
+        import datetime
+        monday = datetime.datetime(2026, 10, 19, 21, 0)
+        schedule = Schedule(['22:00-07:00', '09:00-17:00'], now=monday)
+        self.assertEqual(schedule.until_next(monday), 3600)
+        edges = schedule.due(monday + datetime.timedelta(hours=12))
+        self.assertEqual([(e.kind, e.fields['window'], e.fields['day']) for e in edges],
+                         [('start', '22:00-07:00', 'mon'), ('end', '22:00-07:00', 'tue'),
+                          ('start', '09:00-17:00', 'tue')])
+        self.assertEqual(schedule.due(monday + datetime.timedelta(hours=12)), [])
+
+class TestSimulatedOS(unittest.TestCase):
+    """Test end-to-end activation against the simulated OS backend"""
+    
+    def fast_os(self, os_type, **options):
+        sim = SimulatedOS(10000, os_type, command_latency=Latency(0), registry_latency=Latency(0),
+                          terminate_latency=Latency(0), restore_latency=Latency(0), **options)
+        self.addCleanup(sim.close)
+        controller = sim.controller()
+        self.addCleanup(controller.close)
+        return sim, controller
+        
+    def test_linux_activation_round_trip(self):
+        """Test a 10k-process table loses its target trees and gets one relaunch per app"""
+        sim, controller = self.fast_os('Linux')
+        self.assertEqual(len(sim.table), 10000)
+        self.assertTrue(all(info.pid > SYNTHETIC_PID_BASE for info in sim.table.scan()))
+        report = controller.activate()
+        self.assertTrue(report.ok)
+        self.assertEqual(len(controller.process_manager.killed_processes), 31)
+        self.assertEqual(len(controller.process_manager.launch_records), 5)
+        self.assertEqual(len(sim.table), 10000 - 31)
+        self.assertEqual(controller.status()['protections'], {
+            'webcam': True, 'microphone': True, 'processes': True, 'location': True
+        })
+        self.assertFalse(os.path.exists(os.path.join(sim.sysfs.dev_root, 'video0')))
+        self.assertNotEqual(sim.net.addresses['wlan0'], NETWORK_LINKS['wlan0'][2])
+        report = controller.deactivate()
+        self.assertTrue(report.ok)
+        self.assertEqual(sim.net.addresses['wlan0'], NETWORK_LINKS['wlan0'][2])
+        self.assertEqual(len(sim.table), 10000 - 31 + 5)
+        self.assertEqual(controller.process_manager.snapshot().running_targets, sim.table.target_rules)
+        
+    def test_windows_registry_and_failures(self):
+        """Test location goes through the fake registry and injected failures surface"""
+        sim, controller = self.fast_os('Windows')
+        self.assertTrue(controller.activate().ok)
+        self.assertEqual(controller.location_service.get_current_location(), (0,))
+        self.assertFalse(sim.runner.windows['camera'])
+        self.assertTrue(controller.deactivate().ok)
+        self.assertEqual(controller.location_service.get_current_location(), (1,))
+        self.assertGreater(sim.registry.operations['set'], 1)
+        sim.reset()
+        sim.runner.failure_rate = sim.terminator.failure_rate = 1.0
+        controller.journal.state = {}
+        report = controller.activate()
+        self.assertFalse(report.ok)
+        self.assertFalse(report.stage_ok('processes'))
+        self.assertEqual(len(sim.table), 10000)
+
 if __name__ == '__main__':
     unittest.main()
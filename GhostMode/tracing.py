@@ -0,0 +1,354 @@
+"""
+Tracing and metrics for Ghost Mode
+Spans around service calls feed in-process histograms and counters that
+can be exported in the Prometheus text format, and an optional profiling
+session captures cProfile and tracemalloc data for a single operation.
+
+Tracing is off unless enable() is called; span() then returns a shared
+no-op object, so instrumented code pays one global lookup per call. The
+profilers and the HTTP server are imported only when used.
+"""
+import io
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from stats import LatencyHistogram
+
+# Spans range from sub-millisecond registry reads to multi-second pipelines
+SPAN_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'ghostmode'
+
+_tracer: Optional['Tracer'] = None
+_session: Optional['ProfileSession'] = None
+
+
+class SpanRecord(NamedTuple):
+    """A finished span, kept for the most recent operations"""
+    name: str
+    labels: Dict[str, str]
+    start: float
+    duration: float
+    thread: str
+    error: Optional[str]
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def label(self, **labels) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """Times a block and reports it to the tracer that created it"""
+    __slots__ = ('tracer', 'name', 'labels', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, labels: Dict[str, str]):
+        self.tracer = tracer
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.finish(self, time.perf_counter() - self.start,
+                           exc_type.__name__ if exc_type else None)
+        return False
+
+    def label(self, **labels) -> None:
+        """Add labels known only once the work is under way, such as an outcome"""
+        self.labels.update(labels)
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, extra: str = '') -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in pairs]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Tracer:
+    """Histograms of span durations, counters, and a window of recent spans"""
+    def __init__(self, bounds=SPAN_BOUNDS, keep: int = 4096):
+        self.bounds = bounds
+        self.histograms: Dict[tuple, LatencyHistogram] = {}
+        self.errors: Dict[tuple, int] = {}
+        self.counters: Dict[tuple, float] = {}
+        self.recent: deque = deque(maxlen=keep)
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, labels: Dict[str, str] = None) -> None:
+        key = _key(name, labels or {})
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram(self.bounds)
+        histogram.record(seconds)
+
+    def finish(self, span: Span, seconds: float, error: Optional[str]) -> None:
+        self.observe(span.name, seconds, span.labels)
+        if error:
+            key = _key(span.name, span.labels)
+            with self._lock:
+                self.errors[key] = self.errors.get(key, 0) + 1
+        self.recent.append(SpanRecord(span.name, dict(span.labels), span.start, seconds,
+                                      threading.current_thread().name, error))
+
+    def count(self, name: str, value: float = 1, labels: Dict[str, str] = None) -> None:
+        key = _key(name, labels or {})
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def spans_since(self, start: float) -> List[SpanRecord]:
+        """Recent spans that began at or after a perf_counter() reading"""
+        return [record for record in list(self.recent) if record.start >= start]
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric"""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            errors = sorted(self.errors.items())
+            counters = sorted(self.counters.items())
+        lines = [
+            f'# HELP {PREFIX}_span_duration_seconds Time spent in instrumented Ghost Mode operations',
+            f'# TYPE {PREFIX}_span_duration_seconds histogram',
+        ]
+        for (name, pairs), histogram in histograms:
+            pairs = (('span', name),) + pairs
+            cumulative = 0
+            for bound, n in zip(histogram.bounds, histogram.counts):
+                cumulative += n
+                le = _labels(pairs, f'le="{bound:g}"')
+                lines.append(f'{PREFIX}_span_duration_seconds_bucket{le} {cumulative}')
+            le = _labels(pairs, 'le="+Inf"')
+            lines.append(f'{PREFIX}_span_duration_seconds_bucket{le} {histogram.count}')
+            lines.append(f'{PREFIX}_span_duration_seconds_sum{_labels(pairs)} {histogram.total:.6f}')
+            lines.append(f'{PREFIX}_span_duration_seconds_count{_labels(pairs)} {histogram.count}')
+        lines.append(f'# HELP {PREFIX}_span_errors_total Instrumented operations that raised')
+        lines.append(f'# TYPE {PREFIX}_span_errors_total counter')
+        for (name, pairs), n in errors:
+            lines.append(f'{PREFIX}_span_errors_total{_labels((("span", name),) + pairs)} {n}')
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+            for (counter, pairs), value in counters:
+                if counter == name:
+                    lines.append(f'{PREFIX}_{name}_total{_labels(pairs)} {value:g}')
+        lines.append(f'# TYPE {PREFIX}_tracing_start_time_seconds gauge')
+        lines.append(f'{PREFIX}_tracing_start_time_seconds {self.started:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        """Write atomically, for the node_exporter textfile collector"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix='.ghost_metrics.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def summary(self) -> dict:
+        """Per-span latency summaries, for JSON output"""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+        result = {}
+        for (name, pairs), histogram in histograms:
+            label = name + ''.join(f' {k}={v}' for k, v in pairs)
+            stats = histogram.summary()
+            stats.pop('buckets')
+            result[label] = stats
+        return result
+
+
+def enable(tracer: Tracer = None) -> Tracer:
+    """Start recording spans; returns the active tracer"""
+    global _tracer
+    if tracer is None:
+        tracer = _tracer or Tracer()
+    _tracer = tracer
+    return tracer
+
+
+def disable() -> None:
+    global _tracer
+    _tracer = None
+
+
+def tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def span(name: str, **labels):
+    """Context manager timing one operation; a shared no-op while tracing is off"""
+    active = _tracer
+    if active is None:
+        return _NOOP
+    return Span(active, name, labels)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    active = _tracer
+    if active is not None:
+        active.count(name, value, labels)
+
+
+class MetricsServer:
+    """Serves the active tracer's metrics over HTTP at /metrics"""
+    def __init__(self, host: str = '127.0.0.1', port: int = 9464):
+        import http.server
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                active = _tracer
+                if self.path.split('?')[0] != '/metrics' or active is None:
+                    self.send_error(404)
+                    return
+                body = active.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, name='ghost-metrics', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# From 3.12 cProfile runs on sys.monitoring: one profiler may be enabled
+# per process, and it already sees every thread
+SHARED_PROFILER = sys.version_info >= (3, 12)
+
+
+class ProfileSession:
+    """cProfile and tracemalloc capture for one operation across threads
+
+    The thread that opened the session is profiled directly. Where
+    profilers are per thread, work handed to other threads gets its own
+    profiler when it runs through profiled_call(), merged on exit; where
+    the one profiler sees every thread, that work simply runs under it.
+    """
+    def __init__(self, directory: str, label: str, cpu: bool = True, memory: bool = True,
+                 frames: int = 10):
+        self.directory = directory
+        self.label = label
+        self.cpu = cpu
+        self.memory = memory
+        self.frames = frames
+        self.paths: Dict[str, str] = {}
+        self._profiles: list = []
+        self._owner = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def __enter__(self):
+        global _session
+        import cProfile
+        import tracemalloc
+        os.makedirs(self.directory, exist_ok=True)
+        self._owner = threading.get_ident()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if self.cpu:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # Another profiler (e.g. python -m cProfile) owns sys.monitoring
+                self.logger.warning(f"CPU profile of {self.label} skipped: {e}")
+                self.cpu = False
+            else:
+                self._profiles.append(profile)
+        _session = self
+        return self
+
+    def call(self, func, *args):
+        if not self.cpu or SHARED_PROFILER or threading.get_ident() == self._owner:
+            return func(*args)
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args)
+        finally:
+            with self._lock:
+                self._profiles.append(profile)
+
+    def __exit__(self, exc_type, exc, tb):
+        global _session
+        import pstats
+        import tracemalloc
+        _session = None
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(self.directory, f'{self.label}-{stamp}')
+        if self.cpu:
+            self._profiles[0].disable()
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            self.paths['cpu'] = base + '.prof'
+            stats.dump_stats(self.paths['cpu'])
+            text = io.StringIO()
+            pstats.Stats(self.paths['cpu'], stream=text).sort_stats('cumulative').print_stats(40)
+            with open(base + '.prof.txt', 'w') as f:
+                f.write(text.getvalue())
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.paths['memory'] = base + '.alloc.txt'
+            with open(self.paths['memory'], 'w') as f:
+                f.write(f"current {current} bytes, peak {peak} bytes\n\n")
+                for stat in snapshot.statistics('lineno')[:40]:
+                    f.write(f"{stat}\n")
+        self.logger.info(f"Profile of {self.label} written to {self.paths}")
+        return False
+
+
+def profiled_call(func, *args):
+    """Run func, profiled if a ProfileSession is open; used for pooled work"""
+    session = _session
+    if session is None:
+        return func(*args)
+    return session.call(func, *args)
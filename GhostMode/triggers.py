@@ -0,0 +1,619 @@
+"""
+Automatic triggers for Ghost Mode
+Activates or deactivates ghost mode when a process starts, a device comes
+or goes, a network link changes or a time window opens or closes. Events
+come from kernel notification sockets rather than polling, and each one
+is checked only against the rules for its type.
+"""
+import configparser
+import datetime
+import errno
+import fnmatch
+import logging
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from process_matcher import ProcessMatcher
+from stats import LatencyStats
+from tracing import count, span
+
+TRIGGERS_FILE = 'triggers.ini'
+
+PROCESS = 'process'
+DEVICE = 'device'
+NETWORK = 'network'
+TIME = 'time'
+EVENT_TYPES = (PROCESS, DEVICE, NETWORK, TIME)
+ACTIONS = ('activate', 'deactivate')
+DEFAULT_DEBOUNCE = 5.0
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+# What each event type's kind is; rules naming a kind are only indexed under it
+KINDS = {
+    PROCESS: ('exec',),
+    DEVICE: None,  # any uevent subsystem
+    NETWORK: ('up', 'down', 'removed'),
+    TIME: ('start', 'end'),
+}
+
+# linux/rtnetlink.h and linux/if_link.h
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+IFLA_IFNAME = 3
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+NLMSGHDR = struct.Struct('=IHHII')
+IFINFOMSG = struct.Struct('=BxHiII')
+RTATTR = struct.Struct('=HH')
+
+
+class Event(NamedTuple):
+    """Something a trigger source saw
+
+    kind narrows the type for the rule index: 'exec' for processes, the
+    uevent subsystem for devices, the link state for networks and the edge
+    for time windows. at is when it happened, on the time.monotonic clock.
+    """
+    type: str
+    kind: str
+    fields: dict
+    at: float
+
+
+class Request(NamedTuple):
+    """An action a fired rule asked for"""
+    action: str
+    profile: Optional[str]
+    rule: str
+    at: float
+
+
+class Rule:
+    """One trigger: an event type and kind, conditions on the event, and an action
+
+    fields maps event fields to globs that must all match. Process rules
+    also carry a ProcessMatcher over target-list syntax entries; time rules
+    name their window and, optionally, the days it applies on.
+    """
+    def __init__(self, name: str, type: str, action: str, kind: str = None, profile: str = None,
+                 debounce: float = DEFAULT_DEBOUNCE, fields: Dict[str, str] = None,
+                 processes: Iterable[str] = (), window: str = None, days: Iterable[str] = ()):
+        self.name = name
+        self.type = type
+        self.action = action
+        self.kind = kind
+        self.profile = profile
+        self.debounce = debounce
+        self.fields = dict(fields or {})
+        if window is not None:
+            self.fields['window'] = window
+        self.processes = ProcessMatcher(processes) if processes else None
+        self.window = window
+        self.days = frozenset(days)
+
+    def matches(self, event: Event) -> bool:
+        fields = event.fields
+        if self.processes is not None and self.processes.match(
+                fields.get('name', ''), fields.get('exe'), fields.get('cmdline')) is None:
+            return False
+        if self.days and fields.get('day') not in self.days:
+            return False
+        return all(fnmatch.fnmatchcase(str(fields.get(key, '')), pattern) for key, pattern in self.fields.items())
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r}, {self.type}/{self.kind or '*'} -> {self.action})"
+
+
+def parse_window(value: str) -> Tuple[int, int]:
+    """Minutes after midnight of the start and end of 'HH:MM-HH:MM'"""
+    try:
+        start, end = value.split('-')
+        minutes = []
+        for clock in (start, end):
+            hours, mins = clock.strip().split(':')
+            if not (0 <= int(hours) < 24 and 0 <= int(mins) < 60):
+                raise ValueError(clock)
+            minutes.append(int(hours) * 60 + int(mins))
+    except ValueError:
+        raise ValueError(f"window {value!r} is not HH:MM-HH:MM") from None
+    return minutes[0], minutes[1]
+
+
+def format_window(start: int, end: int) -> str:
+    return f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+
+
+def parse_rules(path: str) -> List[Rule]:
+    """Parse triggers.ini; raises ValueError or OSError if it is invalid
+
+    Each section is a rule. Every rule has `on` (process, device, network
+    or time) and `action` (activate or deactivate), and may name a
+    `profile` to switch to first and a `debounce` in seconds.
+    """
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        with open(path) as f:
+            parser.read_file(f)
+    except configparser.Error as e:
+        raise ValueError(f"{path}: {e}") from e
+    rules = []
+    for name in parser.sections():
+        section = parser[name]
+        type, action = section.get('on', '').strip(), section.get('action', '').strip()
+        if type not in EVENT_TYPES:
+            raise ValueError(f"trigger {name!r}: 'on' must be one of {EVENT_TYPES}")
+        if action not in ACTIONS:
+            raise ValueError(f"trigger {name!r}: 'action' must be one of {ACTIONS}")
+        try:
+            debounce = section.getfloat('debounce', DEFAULT_DEBOUNCE)
+        except ValueError:
+            raise ValueError(f"trigger {name!r}: debounce is not a number of seconds") from None
+        options = {'profile': section.get('profile', '').strip() or None, 'debounce': debounce}
+        if type == PROCESS:
+            processes = [line.strip() for line in section.get('match', '').splitlines() if line.strip()]
+            if not processes:
+                raise ValueError(f"trigger {name!r}: process triggers need 'match'")
+            for entry in processes:
+                try:
+                    ProcessMatcher.check_rule(entry)
+                except ValueError as e:
+                    raise ValueError(f"trigger {name!r}: {e}") from None
+            rule = Rule(name, type, action, 'exec', processes=processes, **options)
+        elif type == DEVICE:
+            fields = {key: section[option] for key, option in (('action', 'device_action'), ('devname', 'device'))
+                      if section.get(option)}
+            rule = Rule(name, type, action, section.get('subsystem') or None, fields=fields, **options)
+        elif type == NETWORK:
+            fields = {'interface': section['interface']} if section.get('interface') else {}
+            rule = Rule(name, type, action, section.get('state') or None, fields=fields, **options)
+        else:
+            if not section.get('window'):
+                raise ValueError(f"trigger {name!r}: time triggers need 'window'")
+            days = section.get('days', '').lower().split()
+            rule = Rule(name, type, action, section.get('edge', 'start'),
+                        window=format_window(*parse_window(section['window'])), days=days, **options)
+            if set(days) - set(DAYS):
+                raise ValueError(f"trigger {name!r}: days must be some of {DAYS}")
+        kinds = KINDS[type]
+        if rule.kind is not None and kinds is not None and rule.kind not in kinds:
+            raise ValueError(f"trigger {name!r}: expected one of {kinds}, got {rule.kind!r}")
+        rules.append(rule)
+    return rules
+
+
+class Schedule:
+    """Start and end edges of daily time windows, on the wall clock
+
+    due() returns an event for every edge passed since the previous call;
+    days of a time rule apply to the day its edge falls on.
+    """
+    def __init__(self, windows: Iterable[str], now: datetime.datetime = None):
+        self.windows = {window: parse_window(window) for window in windows}
+        self.last = now or datetime.datetime.now()
+
+    def _edges(self, day: datetime.date):
+        midnight = datetime.datetime.combine(day, datetime.time())
+        for window, (start, end) in self.windows.items():
+            yield midnight + datetime.timedelta(minutes=start), window, 'start'
+            yield midnight + datetime.timedelta(minutes=end), window, 'end'
+
+    def until_next(self, now: datetime.datetime = None) -> Optional[float]:
+        """Seconds until the next edge, or None without windows"""
+        if not self.windows:
+            return None
+        now = now or datetime.datetime.now()
+        upcoming = [at for offset in (0, 1) for at, _, _ in self._edges(now.date() + datetime.timedelta(offset))
+                    if at > now]
+        return max(0.0, (min(upcoming) - now).total_seconds())
+
+    def due(self, now: datetime.datetime = None) -> List[Event]:
+        now = now or datetime.datetime.now()
+        events = []
+        day = self.last.date()
+        while day <= now.date():
+            for at, window, edge in sorted(self._edges(day)):
+                if self.last < at <= now:
+                    events.append(Event(TIME, edge, {'window': window, 'day': DAYS[at.weekday()]},
+                                        time.monotonic()))
+            day += datetime.timedelta(1)
+        self.last = max(self.last, now)
+        return events
+
+
+class ProcessEvents:
+    """Process starts from the proc connector (else the /proc diff), resolved by a scanner"""
+    type = PROCESS
+
+    def __init__(self, scanner, source=None):
+        self.scanner = scanner
+        self.source = source
+        self.logger = logging.getLogger(__name__)
+        self._owns_source = source is None
+
+    @property
+    def name(self) -> str:
+        return getattr(self.source, 'name', PROCESS)
+
+    def open(self) -> None:
+        if self._owns_source:
+            from enforcement import open_event_source
+            self.source = open_event_source(self.logger)
+        else:
+            self.source.open()
+
+    def poll(self, timeout: float) -> List[Event]:
+        events = []
+        for pid, exec_time in self.source.poll(timeout):
+            info = self.scanner.read(pid, ('pid', 'name', 'exe', 'cmdline'))
+            if info is None:
+                continue
+            at = exec_time if exec_time is not None else time.monotonic()
+            events.append(Event(PROCESS, 'exec', {'pid': pid, 'name': info.name, 'exe': info.exe,
+                                                   'cmdline': info.cmdline}, at))
+        return events
+
+    def close(self) -> None:
+        self.source.close()
+
+
+class DeviceEvents:
+    """Device uevents (add, remove, change) of the given subsystems, or of all"""
+    type = DEVICE
+    name = 'uevent'
+
+    def __init__(self, subsystems: Iterable[str] = None):
+        from device_probe import UeventSource
+        self.subsystems = frozenset(subsystems) if subsystems else None
+        self.uevents = UeventSource(self.subsystems)
+        self.logger = logging.getLogger(__name__)
+
+    def open(self) -> None:
+        if not self.uevents.open():
+            raise OSError("kernel uevents are unavailable")
+
+    def poll(self, timeout: float) -> List[Event]:
+        sock = self.uevents.sock
+        if not select.select([sock], [], [], timeout)[0]:
+            return []
+        events = []
+        while True:
+            try:
+                data = sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return events
+            except OSError as e:
+                # ENOBUFS: the kernel dropped events while we were busy
+                self.logger.warning(f"uevent socket: {e}")
+                return events
+            fields = self.uevents.parse(data)
+            subsystem = fields.get('SUBSYSTEM', '')
+            if self.subsystems is None or subsystem in self.subsystems:
+                events.append(Event(DEVICE, subsystem, {'action': fields.get('ACTION', ''),
+                                                        'devname': fields.get('DEVNAME', ''),
+                                                        'devpath': fields.get('DEVPATH', '')}, time.monotonic()))
+
+    def close(self) -> None:
+        self.uevents.close()
+
+
+class LinkEvents:
+    """Network links coming up, going down or disappearing, from rtnetlink
+
+    A link is up when it is administratively up and has carrier. Only
+    state changes are reported; the kernel sends RTM_NEWLINK for many
+    other changes too.
+    """
+    type = NETWORK
+    name = 'rtnetlink'
+
+    def __init__(self):
+        self.sock: Optional[socket.socket] = None
+        self.states: Dict[str, str] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def open(self) -> None:
+        if not hasattr(socket, 'AF_NETLINK'):
+            raise OSError("netlink is not available on this platform")
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        try:
+            self.sock.bind((0, RTMGRP_LINK))
+            self.sock.setblocking(False)
+        except OSError:
+            self.close()
+            raise
+
+    @staticmethod
+    def parse(data: bytes) -> List[Tuple[str, str]]:
+        """(interface, 'up' | 'down' | 'removed') for each link message in a datagram"""
+        links = []
+        offset = 0
+        while offset + NLMSGHDR.size + IFINFOMSG.size <= len(data):
+            length, msg_type = NLMSGHDR.unpack_from(data, offset)[:2]
+            if length < NLMSGHDR.size:
+                break
+            end = offset + length
+            if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                flags = IFINFOMSG.unpack_from(data, offset + NLMSGHDR.size)[3]
+                attr = offset + NLMSGHDR.size + IFINFOMSG.size
+                while attr + RTATTR.size <= end:
+                    attr_length, attr_type = RTATTR.unpack_from(data, attr)
+                    if attr_length < RTATTR.size:
+                        break
+                    if attr_type == IFLA_IFNAME:
+                        name = data[attr + RTATTR.size:attr + attr_length].split(b'\0')[0].decode()
+                        if msg_type == RTM_DELLINK:
+                            state = 'removed'
+                        else:
+                            state = 'up' if flags & IFF_UP and flags & IFF_LOWER_UP else 'down'
+                        links.append((name, state))
+                        break
+                    attr += (attr_length + 3) & ~3
+            offset += (length + 3) & ~3
+        return links
+
+    def poll(self, timeout: float) -> List[Event]:
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return []
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return events
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                self.logger.warning("rtnetlink dropped link events")
+                return events
+            for interface, state in self.parse(data):
+                if self.states.get(interface) == state:
+                    continue
+                self.states[interface] = state
+                if state == 'removed':
+                    del self.states[interface]
+                events.append(Event(NETWORK, state, {'interface': interface}, time.monotonic()))
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def default_sources(rules: Iterable[Rule], scanner) -> list:
+    """One source per event type the rules use; time windows need none"""
+    rules = list(rules)
+    types = {rule.type for rule in rules}
+    sources = []
+    if PROCESS in types:
+        sources.append(ProcessEvents(scanner))
+    if DEVICE in types:
+        subsystems = {rule.kind for rule in rules if rule.type == DEVICE}
+        sources.append(DeviceEvents(None if None in subsystems else subsystems))
+    if NETWORK in types:
+        sources.append(LinkEvents())
+    return sources
+
+
+class TriggerEngine:
+    """Dispatches source events to rules and runs the actions they fire
+
+    Rules are indexed by (type, kind), so an event is checked only against
+    the rules for its own type and kind plus those for any kind of its
+    type. Process rules are also folded into one ProcessMatcher, so an
+    exec that no rule targets costs a single match whatever the number of
+    rules. Each source blocks on its kernel socket in its own thread and
+    feeds one queue; the dispatcher thread sleeps on that queue until an
+    event or the next time window edge. A rule fires at most once per its
+    debounce seconds. Actions run one at a time through act(action,
+    profile, rule) on a worker thread: while one runs, later requests
+    collapse into one pending request, the newest, and a request for the
+    action already running replaces any pending one and is dropped.
+    Event-to-action latency is kept in latency.
+    """
+    def __init__(self, rules: Iterable[Rule] = (), scanner=None, sources: list = None,
+                 interval: float = 0.5, max_queue: int = 65536, clock: Callable[[], float] = time.monotonic):
+        self.rules = list(rules)
+        self.scanner = scanner
+        self.sources = sources
+        self.interval = interval
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self.index: Dict[Tuple[str, Optional[str]], List[Rule]] = {}
+        for rule in self.rules:
+            self.index.setdefault((rule.type, rule.kind), []).append(rule)
+        process_rules = [rule for rule in self.rules if rule.type == PROCESS]
+        # A process rule without entries matches every process, so nothing can be skipped
+        self.process_filter = None
+        if process_rules and all(rule.processes is not None for rule in process_rules):
+            self.process_filter = ProcessMatcher(entry for rule in process_rules for entry in rule.processes.rules)
+        self.schedule = Schedule({rule.window for rule in self.rules if rule.type == TIME})
+        self.latency = LatencyStats()
+        self.act: Optional[Callable[[str, Optional[str], str], object]] = None
+        self.events = 0
+        self.checks = 0
+        self.fired = 0
+        self.debounced = 0
+        self.coalesced = 0
+        self.actions = 0
+        self.dropped = 0
+        self._fired_at: Dict[str, float] = {}
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._cond = threading.Condition()
+        self._pending: Optional[Request] = None
+        self._running: Optional[Request] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads) and not self._stop.is_set()
+
+    def rules_for(self, event: Event) -> List[Rule]:
+        index = self.index
+        exact = index.get((event.type, event.kind), ())
+        wildcard = index.get((event.type, None), ())
+        return [*exact, *wildcard] if exact and wildcard else list(exact or wildcard)
+
+    def dispatch(self, event: Event) -> List[Rule]:
+        """Check one event against its rules and request the actions of those that fire"""
+        self.events += 1
+        fired = []
+        fields = event.fields
+        if event.type == PROCESS and self.process_filter is not None and self.process_filter.match(
+                fields.get('name', ''), fields.get('exe'), fields.get('cmdline')) is None:
+            return fired
+        for rule in self.rules_for(event):
+            self.checks += 1
+            if not rule.matches(event):
+                continue
+            now = self.clock()
+            last = self._fired_at.get(rule.name)
+            if last is not None and now - last < rule.debounce:
+                self.debounced += 1
+                continue
+            self._fired_at[rule.name] = now
+            self.fired += 1
+            fired.append(rule)
+            count('trigger_fired', rule=rule.name)
+            self.logger.info(f"Trigger {rule.name} fired on {event.type} {event.kind}: {rule.action}")
+            self.request(Request(rule.action, rule.profile, rule.name, event.at))
+        return fired
+
+    def request(self, request: Request) -> None:
+        with self._cond:
+            running = self._running
+            if running is not None and running[:2] == request[:2]:
+                # Whatever was queued behind it is superseded by a repeat of it
+                self.coalesced += 1 + (self._pending is not None)
+                self._pending = None
+                return
+            if self._pending is not None:
+                self.coalesced += 1
+            self._pending = request
+            self._cond.notify_all()
+
+    def submit(self, events: Iterable[Event]) -> None:
+        """Queue events for the dispatcher; safe to call from any thread"""
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def start(self, act: Callable[[str, Optional[str], str], object]) -> None:
+        """Open the sources and start dispatching; act runs each action"""
+        if self.running:
+            return
+        self.act = act
+        self._stop.clear()
+        self.schedule.last = datetime.datetime.now()
+        if self.sources is None:
+            self.sources = default_sources(self.rules, self.scanner)
+        threads = [threading.Thread(target=self._work, name='ghost-trigger-act', daemon=True),
+                   threading.Thread(target=self._dispatch_loop, name='ghost-trigger', daemon=True)]
+        for source in self.sources:
+            try:
+                source.open()
+            except OSError as e:
+                self.logger.warning(f"{source.type} triggers disabled: {e}")
+                continue
+            threads.append(threading.Thread(target=self._listen, args=(source,),
+                                            name=f'ghost-trigger-{source.type}', daemon=True))
+        self._threads = threads
+        for thread in threads:
+            thread.start()
+        self.logger.info(f"Triggers started: {len(self.rules)} rules, sources {self.source_names()}")
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        self.submit([None])
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wait_idle(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued event is dispatched and every action has run"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not self._queue.unfinished_tasks and self._pending is None and self._running is None:
+                    return True
+            time.sleep(0.001)
+        return False
+
+    def _listen(self, source) -> None:
+        try:
+            while not self._stop.is_set():
+                self.submit(source.poll(self.interval))
+        except Exception as e:
+            self.logger.error(f"{source.type} trigger source failed: {e}")
+        finally:
+            source.close()
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                event = self._queue.get(timeout=self.schedule.until_next())
+            except queue.Empty:
+                event = None
+            else:
+                if event is None:
+                    self._queue.task_done()
+                    continue
+            try:
+                with span('trigger', op='dispatch'):
+                    if event is not None:
+                        self.dispatch(event)
+                    for edge in self.schedule.due():
+                        self.dispatch(edge)
+            except Exception as e:
+                self.logger.error(f"Trigger dispatch failed: {e}")
+            finally:
+                if event is not None:
+                    self._queue.task_done()
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stop.is_set():
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                request, self._pending = self._pending, None
+                self._running = request
+            self.latency.record(max(0.0, time.monotonic() - request.at))
+            try:
+                with span('trigger', op='act', action=request.action):
+                    self.act(request.action, request.profile, request.rule)
+                self.actions += 1
+            except Exception as e:
+                self.logger.error(f"Trigger {request.rule} could not {request.action}: {e}")
+            finally:
+                with self._cond:
+                    self._running = None
+
+    def source_names(self) -> List[str]:
+        return [source.name for source in self.sources or ()]
+
+    def stats(self) -> dict:
+        return {
+            'running': self.running,
+            'rules': len(self.rules),
+            'sources': self.source_names(),
+            'events': self.events,
+            'checks': self.checks,
+            'fired': self.fired,
+            'debounced': self.debounced,
+            'coalesced': self.coalesced,
+            'actions': self.actions,
+            'dropped': self.dropped,
+            'latency': self.latency.summary(),
+        }